@@ -10,6 +10,7 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from shared.database import Base
+from shared.ids import UUIDStr
 
 
 class RoleEnum(str, enum.Enum):
@@ -22,7 +23,7 @@ class RoleEnum(str, enum.Enum):
 class User(Base):
     __tablename__ = "users"
     
-    id = Column(String(36), primary_key=True, index=True)
+    id = Column(UUIDStr(), primary_key=True)
     email = Column(String(255), unique=True, nullable=False, index=True)
     username = Column(String(100), unique=True, nullable=False, index=True)
     password_hash = Column(String(255), nullable=False)
@@ -40,7 +41,7 @@ class User(Base):
 class TokenBlacklist(Base):
     __tablename__ = "token_blacklist"
     
-    id = Column(String(36), primary_key=True, index=True)
+    id = Column(UUIDStr(), primary_key=True)
     token = Column(String(500), nullable=False, index=True, unique=True)
     revoked_at = Column(DateTime(timezone=True), server_default=func.now())
     expires_at = Column(DateTime(timezone=True), nullable=False)
@@ -1,5 +1,4 @@
 """Servicios de negocio para AuthService"""
-import uuid
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_
@@ -12,6 +11,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 from auth_service.models import User, TokenBlacklist, RoleEnum
 from auth_service.schemas import UserRegister, TokenResponse, RefreshTokenRequest
 from shared.jwt_utils import create_access_token, verify_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from shared.ids import new_id
 
 
 def hash_password(password: str) -> str:
@@ -40,7 +40,7 @@ class AuthService:
         
         # Crear nuevo usuario
         user = User(
-            id=str(uuid.uuid4()),
+            id=new_id(),
             email=user_data.email,
             username=user_data.username,
             password_hash=hash_password(user_data.password),
@@ -108,7 +108,7 @@ class AuthService:
         expires_at = datetime.fromtimestamp(payload.get("exp"))
         
         blacklist_entry = TokenBlacklist(
-            id=str(uuid.uuid4()),
+            id=new_id(),
             token=token,
             expires_at=expires_at
         )
@@ -0,0 +1,73 @@
+"""
+Benchmark del despacho por oleadas: húngaro (primera parada óptima) vs voraz.
+
+No requiere base de datos. Genera oleadas sintéticas de pedidos y
+repartidores con vehículos de distinta capacidad en el área de Bogotá y
+reporta tiempo de resolución, pedidos asignados y distancia total.
+
+Uso:
+    python benchmarks/bench_despacho.py --tamanos 200x50 1000x200 5000x1000
+"""
+import argparse
+import importlib.util
+import os
+import sys
+import time
+
+import numpy as np
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, RAIZ)
+
+# En el repo el servicio vive en fleet-service/; se registra como paquete fleet_service
+_spec = importlib.util.spec_from_file_location(
+    "fleet_service", os.path.join(RAIZ, "fleet-service", "__init__.py"),
+    submodule_search_locations=[os.path.join(RAIZ, "fleet-service")]
+)
+sys.modules["fleet_service"] = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(sys.modules["fleet_service"])
+
+from fleet_service.despacho import resolver_despacho
+
+LATITUD = (4.5, 4.8)
+LONGITUD = (-74.2, -74.0)
+CAPACIDADES_KG = [20, 80, 500]
+
+
+def oleada(rng, pedidos, repartidores):
+    return (
+        {
+            "ids": [f"p{i}" for i in range(pedidos)],
+            "latitudes": rng.uniform(*LATITUD, pedidos).tolist(),
+            "longitudes": rng.uniform(*LONGITUD, pedidos).tolist(),
+            "pesos_kg": rng.uniform(0.5, 30, pedidos).tolist(),
+        },
+        {
+            "ids": [f"r{i}" for i in range(repartidores)],
+            "latitudes": rng.uniform(*LATITUD, repartidores).tolist(),
+            "longitudes": rng.uniform(*LONGITUD, repartidores).tolist(),
+            "capacidades_kg": rng.choice(CAPACIDADES_KG, repartidores).tolist(),
+        },
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanos", nargs="+", default=["200x50", "1000x200", "1000x1000", "5000x1000"],
+                        help="oleadas como PEDIDOSxREPARTIDORES")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    print(f"{'oleada':<12}{'algoritmo':<10}{'ms':>10}{'asignados':>11}{'km total':>11}")
+    for tamano in args.tamanos:
+        pedidos, repartidores = oleada(rng, *map(int, tamano.split("x")))
+        for algoritmo in ("HUNGARO", "VORAZ"):
+            inicio = time.perf_counter()
+            plan = resolver_despacho(pedidos, repartidores, algoritmo)
+            duracion_ms = (time.perf_counter() - inicio) * 1000
+            asignados = len(pedidos["ids"]) - len(plan["sin_asignar"])
+            print(f"{tamano:<12}{algoritmo:<10}{duracion_ms:>10.0f}{asignados:>11}{plan['distancia_total_m'] / 1000:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
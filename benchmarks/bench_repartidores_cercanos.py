@@ -0,0 +1,98 @@
+"""
+Benchmark k-NN de repartidores: índice de grilla en memoria vs recorrido completo.
+
+No requiere base de datos. Genera N repartidores aleatorios en el área de
+Bogotá, mide la latencia de las consultas k-NN y de las actualizaciones de
+ubicación, y verifica que el índice devuelve lo mismo que el recorrido completo.
+
+Uso:
+    python benchmarks/bench_repartidores_cercanos.py --repartidores 50000 --consultas 2000
+"""
+import argparse
+import heapq
+import importlib.util
+import os
+import random
+import statistics
+import time
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# El módulo solo usa la biblioteca estándar; se carga por ruta (fleet-service/ tiene guion)
+_spec = importlib.util.spec_from_file_location(
+    "indice_espacial", os.path.join(RAIZ, "fleet-service", "indice_espacial.py")
+)
+indice_espacial = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(indice_espacial)
+
+LATITUD = (4.5, 4.9)
+LONGITUD = (-74.3, -73.8)
+
+
+def punto_aleatorio(rng):
+    return rng.uniform(*LATITUD), rng.uniform(*LONGITUD)
+
+
+def recorrido_completo(repartidores, latitud, longitud, k, radio_m):
+    distancias = (
+        (indice_espacial.distancia_m(latitud, longitud, lat, lon), repartidor_id)
+        for repartidor_id, lat, lon in repartidores
+    )
+    return [(repartidor_id, distancia) for distancia, repartidor_id
+            in heapq.nsmallest(k, (d for d in distancias if d[0] <= radio_m))]
+
+
+def percentiles_us(tiempos):
+    tiempos = sorted(tiempos)
+    return statistics.median(tiempos) * 1e6, tiempos[int(len(tiempos) * 0.99) - 1] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repartidores", type=int, default=50_000)
+    parser.add_argument("--consultas", type=int, default=2_000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--radio", type=float, default=5_000)
+    parser.add_argument("--verificar", type=int, default=50, help="consultas comparadas contra el recorrido completo")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    repartidores = [(f"rep-{i}", *punto_aleatorio(rng)) for i in range(args.repartidores)]
+    indice = indice_espacial.IndiceRepartidores()
+
+    inicio = time.perf_counter()
+    indice.reemplazar((repartidor_id, latitud, longitud, None) for repartidor_id, latitud, longitud in repartidores)
+    carga_s = time.perf_counter() - inicio
+
+    consultas = [punto_aleatorio(rng) for _ in range(args.consultas)]
+    tiempos_indice = []
+    for latitud, longitud in consultas:
+        inicio = time.perf_counter()
+        indice.cercanos(latitud, longitud, args.k, args.radio)
+        tiempos_indice.append(time.perf_counter() - inicio)
+
+    tiempos_completo = []
+    for latitud, longitud in consultas[:args.verificar]:
+        inicio = time.perf_counter()
+        esperado = recorrido_completo(repartidores, latitud, longitud, args.k, args.radio)
+        tiempos_completo.append(time.perf_counter() - inicio)
+        obtenido = indice.cercanos(latitud, longitud, args.k, args.radio)
+        assert [r for r, _ in obtenido] == [r for r, _ in esperado], (latitud, longitud)
+
+    movimientos = [(f"rep-{rng.randrange(args.repartidores)}", *punto_aleatorio(rng)) for _ in range(args.consultas)]
+    inicio = time.perf_counter()
+    for repartidor_id, latitud, longitud in movimientos:
+        indice.actualizar(repartidor_id, latitud, longitud)
+    actualizacion_us = (time.perf_counter() - inicio) / len(movimientos) * 1e6
+
+    p50_indice, p99_indice = percentiles_us(tiempos_indice)
+    p50_completo, p99_completo = percentiles_us(tiempos_completo)
+    print(f"{args.repartidores} repartidores, k={args.k}, radio={args.radio:.0f} m (carga {carga_s * 1000:.0f} ms)")
+    print(f"{'método':<20}{'p50 µs':>12}{'p99 µs':>12}")
+    print(f"{'índice de grilla':<20}{p50_indice:>12.0f}{p99_indice:>12.0f}")
+    print(f"{'recorrido completo':<20}{p50_completo:>12.0f}{p99_completo:>12.0f}")
+    print(f"actualización de ubicación: {actualizacion_us:.1f} µs; resultados verificados: {args.verificar}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark de secuenciación de paradas: vecino más cercano vs vecino más cercano + 2-opt.
+
+No requiere base de datos. Para cada tamaño genera rutas aleatorias en el
+área de Bogotá y reporta latencia p50/p95 de planear_ruta con la matriz en
+frío y en caché (mismas paradas, origen distinto, como al re-planear) y la
+mejora de distancia de 2-opt sobre el vecino más cercano.
+
+Uso:
+    python benchmarks/bench_rutas.py --paradas 50 100 200 --rutas 20
+"""
+import argparse
+import importlib.util
+import os
+import random
+import statistics
+import sys
+import time
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, RAIZ)
+
+# En el repo el servicio vive en fleet-service/; se registra como paquete fleet_service
+_spec = importlib.util.spec_from_file_location(
+    "fleet_service", os.path.join(RAIZ, "fleet-service", "__init__.py"),
+    submodule_search_locations=[os.path.join(RAIZ, "fleet-service")]
+)
+sys.modules["fleet_service"] = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(sys.modules["fleet_service"])
+
+from fleet_service.secuenciacion import cache_matrices, planear_ruta
+
+LATITUD = (4.55, 4.75)
+LONGITUD = (-74.15, -74.02)
+
+
+def punto_aleatorio(rng):
+    return rng.uniform(*LATITUD), rng.uniform(*LONGITUD)
+
+
+def percentiles_ms(tiempos):
+    tiempos = sorted(tiempos)
+    return statistics.median(tiempos) * 1000, tiempos[max(int(len(tiempos) * 0.95) - 1, 0)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paradas", type=int, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--rutas", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(f"{'paradas':>8}{'frío p50':>11}{'frío p95':>11}{'caché p50':>11}{'caché p95':>11}{'mejora 2-opt':>14}")
+    for n in args.paradas:
+        frio, cache, mejoras = [], [], []
+        for _ in range(args.rutas):
+            paradas = [
+                {"id": f"p{i}", "latitud": latitud, "longitud": longitud}
+                for i, (latitud, longitud) in enumerate(punto_aleatorio(rng) for _ in range(n))
+            ]
+            cache_matrices.clear()
+            inicio = time.perf_counter()
+            ruta = planear_ruta(punto_aleatorio(rng), paradas)
+            frio.append(time.perf_counter() - inicio)
+            mejoras.append(1 - ruta["distancia_m"] / ruta["distancia_vecino_mas_cercano_m"])
+
+            inicio = time.perf_counter()
+            planear_ruta(punto_aleatorio(rng), paradas)
+            cache.append(time.perf_counter() - inicio)
+
+        print(f"{n:>8}{percentiles_ms(frio)[0]:>9.1f}ms{percentiles_ms(frio)[1]:>9.1f}ms"
+              f"{percentiles_ms(cache)[0]:>9.1f}ms{percentiles_ms(cache)[1]:>9.1f}ms"
+              f"{statistics.mean(mejoras) * 100:>13.1f}%")
+
+
+if __name__ == "__main__":
+    main()
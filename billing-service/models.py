@@ -9,6 +9,7 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from shared.database import Base
+from shared.ids import UUIDStr
 
 
 class EstadoFacturaEnum(str, enum.Enum):
@@ -22,10 +23,10 @@ class EstadoFacturaEnum(str, enum.Enum):
 class Factura(Base):
     __tablename__ = "facturas"
     
-    id = Column(String(36), primary_key=True, index=True)
+    id = Column(UUIDStr(), primary_key=True)
     numero_factura = Column(String(50), unique=True, nullable=False, index=True)
-    pedido_id = Column(String(36), nullable=False, index=True)
-    cliente_id = Column(String(36), nullable=False, index=True)
+    pedido_id = Column(UUIDStr(), nullable=False, index=True)
+    cliente_id = Column(UUIDStr(), nullable=False, index=True)
     
     # Información de tarifa
     tarifa_base = Column(Float, nullable=False)
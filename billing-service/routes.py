@@ -1,5 +1,6 @@
 """API endpoints para BillingService"""
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 import sys
 import os
@@ -12,17 +13,24 @@ from billing_service.schemas import (
 )
 from billing_service.service import BillingService
 from shared.database import get_db
+from shared.http_cache import compute_etag, etag_matches, not_modified, set_cache_headers
+from shared.idempotency import (
+    IdempotencyStore, IdempotencyKeyConflict, IDEMPOTENCY_HEADER, REPLAYED_HEADER,
+    request_fingerprint, scoped_key
+)
 from shared.jwt_utils import verify_jwt_in_request
 from shared.logger import setup_logger, log_request
 
 router = APIRouter()
 logger = setup_logger("billing-service")
+idempotency_store = IdempotencyStore()
 
 
 @router.post("/", response_model=FacturaResponse, tags=["Facturas"])
 async def crear_factura(
     factura_data: CreateFacturaRequest,
     request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """
@@ -30,14 +38,34 @@ async def crear_factura(
     Requiere autenticación JWT en el header Authorization.
     
     Cálculo automático de impuesto (IVA 19%) si no se especifica.
+    Header opcional **Idempotency-Key**: los reintentos con la misma clave
+    devuelven la factura ya creada en lugar de crear una nueva.
     """
     try:
         token_data = await verify_jwt_in_request(request)
         user_id = token_data.get("sub")
         
-        factura = BillingService.crear_factura(db, factura_data)
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if idempotency_key is None:
+            factura = BillingService.crear_factura(db, factura_data)
+        else:
+            async def crear():
+                creada = await run_in_threadpool(BillingService.crear_factura, db, factura_data)
+                return FacturaResponse.model_validate(creada).model_dump(mode="json")
+            
+            factura, repetida = await idempotency_store.run(
+                scoped_key(user_id, "/api/billing", idempotency_key),
+                request_fingerprint(factura_data.model_dump(mode="json")),
+                crear
+            )
+            if repetida:
+                response.headers[REPLAYED_HEADER] = "true"
+        
         log_request(logger, "POST", "/api/billing", 201, user_id)
         return factura
+    except IdempotencyKeyConflict as e:
+        log_request(logger, "POST", "/api/billing", 422, None)
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
     except ValueError as e:
         log_request(logger, "POST", "/api/billing", 400, None)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
@@ -53,18 +81,29 @@ async def crear_factura(
 async def obtener_factura(
     factura_id: str,
     request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
-    """Obtiene los detalles de una factura específica."""
+    """Obtiene los detalles de una factura específica. Soporta GET condicional (If-None-Match)."""
     try:
         token_data = await verify_jwt_in_request(request)
         user_id = token_data.get("sub")
         
+        if request.headers.get("If-None-Match"):
+            marca = BillingService.obtener_marca_factura(db, factura_id)
+            if not marca:
+                raise ValueError("Factura no encontrada")
+            etag = compute_etag(factura_id, *marca)
+            if etag_matches(request, etag):
+                log_request(logger, "GET", f"/api/billing/{factura_id}", 304, user_id)
+                return not_modified(etag)
+        
         factura = BillingService.obtener_factura(db, factura_id)
         
         if not factura:
             raise ValueError("Factura no encontrada")
         
+        set_cache_headers(response, compute_etag(factura_id, factura.updated_at))
         log_request(logger, "GET", f"/api/billing/{factura_id}", 200, user_id)
         return factura
     except ValueError as e:
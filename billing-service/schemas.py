@@ -3,6 +3,12 @@ from pydantic import BaseModel, Field
 from enum import Enum
 from typing import Optional
 from datetime import datetime
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from shared.ids import ID_PATTERN
 
 
 class EstadoFacturaEnum(str, Enum):
@@ -15,8 +21,8 @@ class EstadoFacturaEnum(str, Enum):
 
 class CreateFacturaRequest(BaseModel):
     """Esquema para crear factura"""
-    pedido_id: str
-    cliente_id: str
+    pedido_id: str = Field(..., pattern=ID_PATTERN)
+    cliente_id: str = Field(..., pattern=ID_PATTERN)
     tarifa_base: float = Field(..., gt=0)
     tarifa_distancia: float = Field(default=0, ge=0)
     tarifa_peso: float = Field(default=0, ge=0)
@@ -50,8 +56,8 @@ class FacturaResponse(BaseModel):
     """Respuesta de factura"""
     id: str
     numero_factura: str
-    pedido_id: str
-    cliente_id: str
+    pedido_id: str = Field(..., pattern=ID_PATTERN)
+    cliente_id: str = Field(..., pattern=ID_PATTERN)
     tarifa_base: float
     tarifa_distancia: float
     tarifa_peso: float
@@ -1,5 +1,4 @@
 """Servicios de negocio para BillingService"""
-import uuid
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 import sys
@@ -9,6 +8,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 from billing_service.models import Factura, EstadoFacturaEnum
 from billing_service.schemas import CreateFacturaRequest, UpdateFacturaRequest
+from shared.ids import new_id, short_code
 
 
 # Tasas de impuesto en Colombia (IVA = 19%)
@@ -38,8 +38,8 @@ class BillingService:
         
         # Crear factura
         factura = Factura(
-            id=str(uuid.uuid4()),
-            numero_factura=f"FAC-{int(datetime.utcnow().timestamp())}-{uuid.uuid4().hex[:8].upper()}",
+            id=new_id(),
+            numero_factura=f"FAC-{short_code()}",
             pedido_id=factura_data.pedido_id,
             cliente_id=factura_data.cliente_id,
             tarifa_base=factura_data.tarifa_base,
@@ -66,6 +66,11 @@ class BillingService:
         """Obtiene una factura por ID"""
         return db.query(Factura).filter(Factura.id == factura_id).first()
     
+    @staticmethod
+    def obtener_marca_factura(db: Session, factura_id: str):
+        """Obtiene solo updated_at de una factura para validar ETags"""
+        return db.query(Factura.updated_at).filter(Factura.id == factura_id).first()
+    
     @staticmethod
     def obtener_factura_por_numero(db: Session, numero_factura: str) -> Factura:
         """Obtiene una factura por número"""
@@ -0,0 +1,235 @@
+"""Despacho por oleadas: asignación de pedidos a repartidores con restricción de capacidad"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import asyncio
+import multiprocessing
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fleet_service.indice_espacial import RADIO_TIERRA_M
+
+DESPACHO_PROCESOS = int(os.getenv("DESPACHO_PROCESOS", "2"))
+# Por debajo de este tamaño (pedidos x repartidores) resolver en un hilo sale más barato que el IPC
+DESPACHO_UMBRAL_PROCESO = int(os.getenv("DESPACHO_UMBRAL_PROCESO", "20000"))
+# Por encima de este tamaño el húngaro (O(n²m) por ronda) se cambia por el voraz
+DESPACHO_MAX_HUNGARO = int(os.getenv("DESPACHO_MAX_HUNGARO", "1000000"))
+DESPACHO_RADIO_MAX_M = int(os.getenv("DESPACHO_RADIO_MAX_M", "15000"))
+DESPACHO_MAX_PEDIDOS_REPARTIDOR = int(os.getenv("DESPACHO_MAX_PEDIDOS_REPARTIDOR", "10"))
+
+ALGORITMOS = ("HUNGARO", "VORAZ")
+# Costo de los pares infactibles; finito para que el húngaro no opere con inf - inf
+INFACTIBLE = 1e12
+
+_pool = None
+
+
+def obtener_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # fork copiaría los hilos del servidor (locks tomados, pool de conexiones); forkserver arranca limpio
+        _pool = ProcessPoolExecutor(max_workers=DESPACHO_PROCESOS, mp_context=multiprocessing.get_context("forkserver"))
+    return _pool
+
+
+def cerrar_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def matriz_distancias(latitudes_a, longitudes_a, latitudes_b, longitudes_b) -> np.ndarray:
+    """Distancias haversine en metros entre cada punto de A (filas) y de B (columnas)"""
+    phi_a = np.radians(np.asarray(latitudes_a, dtype=np.float64))[:, None]
+    phi_b = np.radians(np.asarray(latitudes_b, dtype=np.float64))[None, :]
+    dlambda = np.radians(np.asarray(longitudes_b, dtype=np.float64))[None, :] - \
+        np.radians(np.asarray(longitudes_a, dtype=np.float64))[:, None]
+    a = np.sin((phi_b - phi_a) / 2) ** 2 + np.cos(phi_a) * np.cos(phi_b) * np.sin(dlambda / 2) ** 2
+    return 2 * RADIO_TIERRA_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def hungaro(costos: np.ndarray) -> list:
+    """
+    Asignación de costo mínimo para una matriz rectangular (húngaro con
+    potenciales, O(n²m)). Devuelve [(fila, columna)]; con más filas que
+    columnas quedan filas sin asignar.
+    """
+    if costos.shape[0] > costos.shape[1]:
+        return [(fila, columna) for columna, fila in hungaro(costos.T)]
+
+    n, m = costos.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    # asignada[j] = fila (base 1) asignada a la columna j; la columna 0 es ficticia
+    asignada = np.zeros(m + 1, dtype=np.int64)
+    camino = np.zeros(m + 1, dtype=np.int64)
+
+    for fila in range(1, n + 1):
+        asignada[0] = fila
+        columna0 = 0
+        minimos = np.full(m + 1, np.inf)
+        usadas = np.zeros(m + 1, dtype=bool)
+        while True:
+            usadas[columna0] = True
+            fila0 = asignada[columna0]
+            libres = ~usadas
+            libres[0] = False
+            reducido = np.full(m + 1, np.inf)
+            reducido[1:] = costos[fila0 - 1] - u[fila0] - v[1:]
+            mejora = libres & (reducido < minimos)
+            minimos[mejora] = reducido[mejora]
+            camino[mejora] = columna0
+            candidatos = np.where(libres, minimos, np.inf)
+            columna1 = int(np.argmin(candidatos))
+            delta = candidatos[columna1]
+            u[asignada[usadas]] += delta
+            v[usadas] -= delta
+            minimos[libres] -= delta
+            columna0 = columna1
+            if asignada[columna0] == 0:
+                break
+        while columna0:
+            columna1 = camino[columna0]
+            asignada[columna0] = asignada[columna1]
+            columna0 = columna1
+
+    return [(int(asignada[columna]) - 1, columna - 1) for columna in range(1, m + 1) if asignada[columna]]
+
+
+def _factibles(distancias, pesos, capacidad_restante, cupos, radio_m) -> np.ndarray:
+    """Máscara pedidos x repartidores de pares que caben en el vehículo y el radio"""
+    return (distancias <= radio_m) & (pesos[:, None] <= capacidad_restante[None, :] + 1e-9) & (cupos[None, :] > 0)
+
+
+def _asignar_voraz(distancias_fn, pesos, capacidad, cupos, radio_m, asignar, libres=None):
+    """
+    Toma repetidamente el par factible más cercano (repartidor en su última
+    parada) entre los pedidos libres. Mantiene el mínimo de cada columna y
+    solo recalcula las columnas afectadas por la última asignación.
+    """
+    n, m = len(pesos), len(capacidad)
+    todos_pedidos = np.arange(n)
+    libres = np.ones(n, dtype=bool) if libres is None else libres.copy()
+
+    def columnas(indices):
+        distancias = distancias_fn(todos_pedidos, indices)
+        factibles = _factibles(distancias, pesos, capacidad[indices], cupos[indices], radio_m) & libres[:, None]
+        return np.where(factibles, distancias, np.inf)
+
+    costos = columnas(np.arange(m))
+    minimo_columna = costos.min(axis=0)
+    fila_minima = costos.argmin(axis=0)
+
+    while np.isfinite(minimo_columna).any():
+        repartidor = int(np.argmin(minimo_columna))
+        pedido = int(fila_minima[repartidor])
+        asignar(pedido, repartidor, costos[pedido, repartidor])
+        libres[pedido] = False
+        costos[pedido, :] = np.inf
+        # El repartidor se mueve al pedido: su columna cambia de origen y de capacidad
+        costos[:, repartidor] = columnas(np.array([repartidor]))[:, 0]
+        afectadas = np.union1d(np.flatnonzero(fila_minima == pedido), [repartidor])
+        minimo_columna[afectadas] = costos[:, afectadas].min(axis=0)
+        fila_minima[afectadas] = costos[:, afectadas].argmin(axis=0)
+
+
+def _asignar_hungaro(distancias_fn, pesos, capacidad, cupos, radio_m, asignar):
+    """
+    Primera parada óptima: asignación de costo mínimo uno a uno entre
+    pedidos y repartidores (cada repartidor disponible sale con un pedido si
+    hay uno factible). Los pedidos que sobran se encadenan con el voraz
+    desde la última parada de cada repartidor.
+    """
+    n, m = len(pesos), len(capacidad)
+    distancias = distancias_fn(np.arange(n), np.arange(m))
+    factibles = _factibles(distancias, pesos, capacidad, cupos, radio_m)
+    libres = np.ones(n, dtype=bool)
+    if factibles.any():
+        # Solo filas y columnas con al menos un par factible
+        filas = np.flatnonzero(factibles.any(axis=1))
+        columnas = np.flatnonzero(factibles.any(axis=0))
+        costos = np.where(factibles, distancias, INFACTIBLE)[np.ix_(filas, columnas)]
+        for fila, columna in hungaro(costos):
+            if costos[fila, columna] < INFACTIBLE:
+                asignar(filas[fila], columnas[columna], costos[fila, columna])
+                libres[filas[fila]] = False
+    if libres.any():
+        _asignar_voraz(distancias_fn, pesos, capacidad, cupos, radio_m, asignar, libres)
+
+
+def resolver_despacho(pedidos: dict, repartidores: dict, algoritmo: str = None,
+                      radio_m: float = DESPACHO_RADIO_MAX_M,
+                      max_pedidos: int = DESPACHO_MAX_PEDIDOS_REPARTIDOR) -> dict:
+    """
+    Asigna una oleada de pedidos a repartidores. Entradas en columnas (listas
+    paralelas) para que viajen baratas al proceso hijo:
+    pedidos = {ids, latitudes, longitudes, pesos_kg},
+    repartidores = {ids, latitudes, longitudes, capacidades_kg}.
+    Cada repartidor recorre sus pedidos en el orden asignado; la distancia de
+    cada tramo se mide desde la parada anterior.
+    """
+    n, m = len(pedidos["ids"]), len(repartidores["ids"])
+    if algoritmo is None:
+        algoritmo = "HUNGARO" if n * m <= DESPACHO_MAX_HUNGARO else "VORAZ"
+    if algoritmo not in ALGORITMOS:
+        raise ValueError(f"Algoritmo desconocido: {algoritmo}")
+
+    latitudes = np.asarray(pedidos["latitudes"], dtype=np.float64)
+    longitudes = np.asarray(pedidos["longitudes"], dtype=np.float64)
+    pesos = np.asarray(pedidos["pesos_kg"], dtype=np.float64)
+    capacidad = np.asarray(repartidores["capacidades_kg"], dtype=np.float64).copy()
+    cupos = np.full(m, max_pedidos, dtype=np.int64)
+    # Posición actual de cada repartidor: su ubicación o su última parada asignada
+    posicion_latitud = np.asarray(repartidores["latitudes"], dtype=np.float64).copy()
+    posicion_longitud = np.asarray(repartidores["longitudes"], dtype=np.float64).copy()
+
+    def distancias_fn(indices_pedidos, indices_repartidores):
+        return matriz_distancias(
+            latitudes[indices_pedidos], longitudes[indices_pedidos],
+            posicion_latitud[indices_repartidores], posicion_longitud[indices_repartidores]
+        )
+
+    rutas = {}
+
+    def asignar(pedido, repartidor, distancia):
+        capacidad[repartidor] -= pesos[pedido]
+        cupos[repartidor] -= 1
+        posicion_latitud[repartidor] = latitudes[pedido]
+        posicion_longitud[repartidor] = longitudes[pedido]
+        ruta = rutas.setdefault(int(repartidor), {"pedidos": [], "peso_kg": 0.0, "distancia_m": 0.0})
+        ruta["pedidos"].append(pedidos["ids"][pedido])
+        ruta["peso_kg"] += float(pesos[pedido])
+        ruta["distancia_m"] += float(distancia)
+
+    if n and m:
+        resolver = _asignar_hungaro if algoritmo == "HUNGARO" else _asignar_voraz
+        resolver(distancias_fn, pesos, capacidad, cupos, radio_m, asignar)
+
+    asignados = {pedido_id for ruta in rutas.values() for pedido_id in ruta["pedidos"]}
+    asignaciones = [
+        {
+            "repartidor_id": repartidores["ids"][repartidor],
+            "pedidos": ruta["pedidos"],
+            "peso_kg": round(ruta["peso_kg"], 3),
+            "distancia_m": round(ruta["distancia_m"], 1)
+        }
+        for repartidor, ruta in sorted(rutas.items())
+    ]
+    return {
+        "algoritmo": algoritmo,
+        "asignaciones": asignaciones,
+        "sin_asignar": [pedido_id for pedido_id in pedidos["ids"] if pedido_id not in asignados],
+        "distancia_total_m": round(sum(ruta["distancia_m"] for ruta in asignaciones), 1)
+    }
+
+
+async def ejecutar_despacho(pedidos: dict, repartidores: dict, **opciones) -> dict:
+    """Resuelve la oleada fuera del event loop: en un hilo si es pequeña, en el pool de procesos si no"""
+    tarea = partial(resolver_despacho, pedidos, repartidores, **opciones)
+    if len(pedidos["ids"]) * len(repartidores["ids"]) < DESPACHO_UMBRAL_PROCESO:
+        return await run_in_threadpool(tarea)
+    return await asyncio.get_running_loop().run_in_executor(obtener_pool(), tarea)
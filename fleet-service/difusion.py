@@ -0,0 +1,214 @@
+"""Difusión en vivo de posiciones y estados de repartidores por WebSocket"""
+import asyncio
+import json
+import threading
+from typing import Optional
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi import WebSocketDisconnect
+
+from fleet_service.snapshot_flota import snapshot_flota, segundos
+from shared.cobertura import CIUDADES_COBERTURA
+
+# Ventana de agrupación: cada cliente recibe a lo sumo un mensaje por intervalo
+DIFUSION_INTERVALO_MS = int(os.getenv("DIFUSION_INTERVALO_MS", "500"))
+# Un cliente que no acepta un mensaje en este tiempo se desconecta
+DIFUSION_TIMEOUT_ENVIO_SEGUNDOS = int(os.getenv("DIFUSION_TIMEOUT_ENVIO_SEGUNDOS", "10"))
+DIFUSION_MAX_CLIENTES = int(os.getenv("DIFUSION_MAX_CLIENTES", "500"))
+
+
+class MensajeInvalidoError(Exception):
+    """El cliente envió un frame que no es un objeto JSON de texto; se cierra con 1003"""
+    pass
+
+
+async def recibir_objeto(websocket) -> dict:
+    """Siguiente mensaje del cliente como objeto JSON"""
+    mensaje = await websocket.receive()
+    if mensaje["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(mensaje.get("code", 1000))
+    if mensaje.get("text") is None:
+        raise MensajeInvalidoError("Solo se aceptan mensajes JSON de texto")
+    try:
+        objeto = json.loads(mensaje["text"])
+    except ValueError:
+        raise MensajeInvalidoError("Mensaje JSON inválido")
+    if not isinstance(objeto, dict):
+        raise MensajeInvalidoError("El mensaje debe ser un objeto JSON")
+    return objeto
+
+
+def rectangulo(ciudad: str = None, lat_min: float = None, lon_min: float = None,
+               lat_max: float = None, lon_max: float = None) -> Optional[tuple]:
+    """Filtro (lat_min, lon_min, lat_max, lon_max) de una ciudad o de coordenadas; None = toda la flota"""
+    if ciudad is not None:
+        if ciudad not in CIUDADES_COBERTURA:
+            raise ValueError(f"La ciudad {ciudad} no está en cobertura")
+        limites = CIUDADES_COBERTURA[ciudad]
+        return (limites["latitud_min"], limites["longitud_min"], limites["latitud_max"], limites["longitud_max"])
+    coordenadas = (lat_min, lon_min, lat_max, lon_max)
+    if all(valor is None for valor in coordenadas):
+        return None
+    if any(valor is None for valor in coordenadas):
+        raise ValueError("El rectángulo requiere lat_min, lon_min, lat_max y lon_max")
+    if lat_min >= lat_max or lon_min >= lon_max:
+        raise ValueError("El rectángulo está vacío")
+    return coordenadas
+
+
+def _dentro(filtro: Optional[tuple], fila: tuple) -> bool:
+    if filtro is None:
+        return True
+    latitud, longitud = fila[1], fila[2]
+    if latitud is None or longitud is None:
+        return False
+    return filtro[0] <= latitud <= filtro[2] and filtro[1] <= longitud <= filtro[3]
+
+
+def _evento(repartidor_id: str, fila: Optional[tuple]) -> dict:
+    if fila is None:
+        return {"id": repartidor_id, "eliminado": True}
+    estado, latitud, longitud, timestamp = fila
+    return {"id": repartidor_id, "estado": estado, "latitud": latitud, "longitud": longitud,
+            "timestamp": segundos(timestamp)}
+
+
+class Suscriptor:
+    """
+    Cambios pendientes de un cliente: solo el último por repartidor. Un
+    cliente lento acumula a lo sumo una entrada por repartidor de su zona,
+    nunca una cola de posiciones viejas.
+    """
+
+    def __init__(self, filtro: Optional[tuple], loop: asyncio.AbstractEventLoop):
+        self.filtro = filtro
+        self.loop = loop
+        self.senal = asyncio.Event()
+        self.visibles: set = set()
+        self.pendientes: dict = {}
+        self.reemplazados = 0
+        self._lock = threading.Lock()
+
+    def recibir(self, repartidor_id: str, fila: Optional[tuple]):
+        """Llamado desde cualquier hilo por cada cambio de la flota"""
+        with self._lock:
+            if fila is not None and _dentro(self.filtro, fila):
+                self.visibles.add(repartidor_id)
+            elif repartidor_id in self.visibles:
+                # Salió de la zona o de la flota activa: el cliente debe quitarlo
+                self.visibles.discard(repartidor_id)
+                fila = None
+            else:
+                return
+            despertar = not self.pendientes
+            if repartidor_id in self.pendientes:
+                self.reemplazados += 1
+            self.pendientes[repartidor_id] = fila
+        if despertar:
+            self.loop.call_soon_threadsafe(self.senal.set)
+
+    def cambiar_filtro(self, filtro: Optional[tuple], filas: list) -> list:
+        """Aplica un filtro nuevo; devuelve el estado inicial de la zona nueva"""
+        with self._lock:
+            self.filtro = filtro
+            actuales = {repartidor_id: fila for repartidor_id, fila in filas if _dentro(filtro, fila)}
+            salientes = self.visibles - actuales.keys()
+            self.visibles = set(actuales)
+            # Los pendientes pueden ser más nuevos que `filas` (leídas sin el lock): se conservan los de la zona
+            self.pendientes = {r: fila for r, fila in self.pendientes.items() if r in self.visibles}
+        return [_evento(repartidor_id, None) for repartidor_id in salientes] + \
+            [_evento(repartidor_id, fila) for repartidor_id, fila in actuales.items()]
+
+    def extraer(self) -> list:
+        with self._lock:
+            pendientes, self.pendientes = self.pendientes, {}
+            self.senal.clear()
+        return [_evento(repartidor_id, fila) for repartidor_id, fila in pendientes.items()]
+
+
+class DifusorPosiciones:
+    """Reparte los cambios del snapshot de la flota entre los clientes conectados"""
+
+    def __init__(self):
+        self._suscriptores: set = set()
+        self._lock = threading.Lock()
+
+    def suscribir(self, filtro: Optional[tuple]) -> Suscriptor:
+        with self._lock:
+            if len(self._suscriptores) >= DIFUSION_MAX_CLIENTES:
+                raise ValueError("Se alcanzó el máximo de clientes en vivo")
+            suscriptor = Suscriptor(filtro, asyncio.get_running_loop())
+            self._suscriptores.add(suscriptor)
+        return suscriptor
+
+    def desuscribir(self, suscriptor: Suscriptor):
+        with self._lock:
+            self._suscriptores.discard(suscriptor)
+
+    def publicar(self, repartidor_id: str, fila: Optional[tuple]):
+        with self._lock:
+            suscriptores = list(self._suscriptores)
+        for suscriptor in suscriptores:
+            suscriptor.recibir(repartidor_id, fila)
+
+    def total_suscriptores(self) -> int:
+        return len(self._suscriptores)
+
+
+difusor = DifusorPosiciones()
+snapshot_flota.observar(difusor.publicar)
+
+
+async def atender_cliente(websocket, filtro: Optional[tuple]):
+    """
+    Envía el estado inicial de la zona y luego lotes de cambios cada
+    DIFUSION_INTERVALO_MS. El cliente puede cambiar de zona enviando
+    {"ciudad": ...} o {"lat_min", "lon_min", "lat_max", "lon_max"}.
+    """
+    suscriptor = difusor.suscribir(filtro)
+    envio = asyncio.Lock()
+
+    async def enviar(mensaje: dict):
+        # Un solo envío a la vez; si el cliente no lo acepta a tiempo se corta la conexión
+        async with envio:
+            await asyncio.wait_for(websocket.send_json(mensaje), timeout=DIFUSION_TIMEOUT_ENVIO_SEGUNDOS)
+
+    try:
+        inicial = suscriptor.cambiar_filtro(filtro, snapshot_flota.filas())
+        await enviar({"tipo": "snapshot", "repartidores": inicial})
+
+        async def escuchar():
+            while True:
+                mensaje = await recibir_objeto(websocket)
+                try:
+                    nuevo = rectangulo(**{
+                        clave: mensaje.get(clave) for clave in ("ciudad", "lat_min", "lon_min", "lat_max", "lon_max")
+                    })
+                except (ValueError, TypeError) as e:
+                    await enviar({"tipo": "error", "detalle": str(e)})
+                    continue
+                await enviar({
+                    "tipo": "snapshot", "repartidores": suscriptor.cambiar_filtro(nuevo, snapshot_flota.filas())
+                })
+
+        async def difundir():
+            while True:
+                await suscriptor.senal.wait()
+                cambios = suscriptor.extraer()
+                if cambios:
+                    await enviar({"tipo": "cambios", "repartidores": cambios})
+                await asyncio.sleep(DIFUSION_INTERVALO_MS / 1000)
+
+        tareas = [asyncio.create_task(escuchar()), asyncio.create_task(difundir())]
+        try:
+            done, _ = await asyncio.wait(tareas, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for tarea in tareas:
+                tarea.cancel()
+        for tarea in done:
+            tarea.result()
+    finally:
+        difusor.desuscribir(suscriptor)
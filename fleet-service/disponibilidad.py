@@ -0,0 +1,110 @@
+"""Barrido de repartidores sin señal: disponibilidad según la última ubicación"""
+from datetime import datetime, timezone, timedelta
+import threading
+import time
+from sqlalchemy import and_, case, cast, or_, update
+from sqlalchemy.orm import Session
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fleet_service.models import Repartidor, EstadoRepartidorEnum
+
+# Un DISPONIBLE sin ubicación en este tiempo pasa a SIN_SENAL y sale de los candidatos
+REPARTIDOR_SIN_SENAL_SEGUNDOS = int(os.getenv("REPARTIDOR_SIN_SENAL_SEGUNDOS", "300"))
+BARRIDO_SIN_SENAL_INTERVALO_SEGUNDOS = int(os.getenv("BARRIDO_SIN_SENAL_INTERVALO_SEGUNDOS", "30"))
+
+
+class MetricasBarrido:
+    """Contadores acumulados del barrido y datos de la última pasada"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.barridos = 0
+        self.marcados_sin_senal = 0
+        self.reactivados = 0
+        self.duracion_total_ms = 0.0
+        self.duracion_max_ms = 0.0
+        self.ultimo = None
+
+    def registrar(self, duracion_ms: float, marcados: int, reactivados: int):
+        with self._lock:
+            self.barridos += 1
+            self.marcados_sin_senal += marcados
+            self.reactivados += reactivados
+            self.duracion_total_ms += duracion_ms
+            self.duracion_max_ms = max(self.duracion_max_ms, duracion_ms)
+            self.ultimo = {
+                "instante": datetime.now(timezone.utc),
+                "duracion_ms": round(duracion_ms, 2),
+                "marcados_sin_senal": marcados,
+                "reactivados": reactivados
+            }
+
+    def obtener(self) -> dict:
+        with self._lock:
+            return {
+                "barridos": self.barridos,
+                "marcados_sin_senal": self.marcados_sin_senal,
+                "reactivados": self.reactivados,
+                "duracion_promedio_ms": round(self.duracion_total_ms / self.barridos, 2) if self.barridos else None,
+                "duracion_max_ms": round(self.duracion_max_ms, 2),
+                "ultimo": self.ultimo
+            }
+
+
+metricas_barrido = MetricasBarrido()
+
+
+def barrer_sin_senal(db: Session, umbral_segundos: int = REPARTIDOR_SIN_SENAL_SEGUNDOS,
+                     metricas: MetricasBarrido = metricas_barrido) -> list:
+    """
+    Concilia la disponibilidad con la última ubicación en un solo UPDATE:
+    DISPONIBLE con ultima_ubicacion vencida -> SIN_SENAL, y SIN_SENAL con una
+    ubicación reciente (volvió a reportar) -> DISPONIBLE. Ambas condiciones
+    son rangos de ix_repartidores_estado_ultima_ubicacion. Los repartidores
+    sin ninguna ubicación no se tocan. Devuelve las filas cambiadas.
+    """
+    inicio = time.perf_counter()
+    limite = datetime.now(timezone.utc) - timedelta(seconds=umbral_segundos)
+
+    vencido = and_(Repartidor.estado == EstadoRepartidorEnum.DISPONIBLE, Repartidor.ultima_ubicacion < limite)
+    recuperado = and_(Repartidor.estado == EstadoRepartidorEnum.SIN_SENAL, Repartidor.ultima_ubicacion >= limite)
+    stmt = update(Repartidor).where(
+        Repartidor.is_active == True,
+        or_(vencido, recuperado)
+    ).values(
+        # CASE con parámetros llega como text; el cast lo lleva al tipo enum de la columna
+        estado=case(
+            (Repartidor.estado == EstadoRepartidorEnum.DISPONIBLE,
+             cast(EstadoRepartidorEnum.SIN_SENAL, Repartidor.estado.type)),
+            else_=cast(EstadoRepartidorEnum.DISPONIBLE, Repartidor.estado.type)
+        )
+    ).returning(
+        Repartidor.id, Repartidor.estado, Repartidor.latitud, Repartidor.longitud,
+        Repartidor.ultima_ubicacion, Repartidor.is_active
+    ).execution_options(synchronize_session=False)
+
+    try:
+        cambiados = db.execute(stmt).all()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    marcados = sum(1 for fila in cambiados if fila.estado == EstadoRepartidorEnum.SIN_SENAL)
+    metricas.registrar((time.perf_counter() - inicio) * 1000, marcados, len(cambiados) - marcados)
+    return cambiados
+
+
+if __name__ == "__main__":
+    # Barrido manual o desde cron: python -m fleet_service.disponibilidad
+    from shared.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        barrer_sin_senal(db)
+        print(f"Barrido sin señal: {metricas_barrido.obtener()['ultimo']}")
+    finally:
+        db.close()
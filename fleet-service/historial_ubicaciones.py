@@ -0,0 +1,170 @@
+"""Historial compacto de ubicaciones por repartidor, con submuestreo de datos viejos"""
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fleet_service.models import HistorialUbicacion
+from fleet_service.indice_espacial import distancia_m
+
+MICROGRADOS = 1_000_000
+# Horas más viejas que COMPLETO_DIAS se reducen a un punto cada RESOLUCION_SEGUNDOS;
+# las más viejas que RETENCION_DIAS se borran
+HISTORIAL_UBICACIONES_COMPLETO_DIAS = int(os.getenv("HISTORIAL_UBICACIONES_COMPLETO_DIAS", "7"))
+HISTORIAL_UBICACIONES_RESOLUCION_SEGUNDOS = int(os.getenv("HISTORIAL_UBICACIONES_RESOLUCION_SEGUNDOS", "60"))
+HISTORIAL_UBICACIONES_RETENCION_DIAS = int(os.getenv("HISTORIAL_UBICACIONES_RETENCION_DIAS", "90"))
+HISTORIAL_UBICACIONES_LOTE = int(os.getenv("HISTORIAL_UBICACIONES_LOTE", "500"))
+MAX_VENTANA_RECORRIDO = timedelta(days=7)
+
+
+def _utc(instante: datetime) -> datetime:
+    return instante.replace(tzinfo=timezone.utc) if instante.tzinfo is None else instante.astimezone(timezone.utc)
+
+
+def _hora(instante: datetime) -> datetime:
+    return instante.replace(minute=0, second=0, microsecond=0)
+
+
+def agregar_puntos(db: Session, puntos: list):
+    """
+    Agrega puntos [(repartidor_id, latitud, longitud, instante)] al historial
+    en la transacción del llamador: un UPSERT que concatena los arreglos de
+    cada (repartidor, hora).
+    """
+    filas = {}
+    for repartidor_id, latitud, longitud, instante in puntos:
+        instante = _utc(instante)
+        hora = _hora(instante)
+        fila = filas.setdefault((repartidor_id, hora), {
+            "repartidor_id": repartidor_id, "hora": hora, "segundos": [], "latitudes": [], "longitudes": []
+        })
+        fila["segundos"].append(int((instante - hora).total_seconds()))
+        fila["latitudes"].append(round(latitud * MICROGRADOS))
+        fila["longitudes"].append(round(longitud * MICROGRADOS))
+    if not filas:
+        return
+
+    stmt = insert(HistorialUbicacion)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[HistorialUbicacion.repartidor_id, HistorialUbicacion.hora],
+        set_={
+            columna: getattr(HistorialUbicacion, columna).op("||")(getattr(stmt.excluded, columna))
+            for columna in ("segundos", "latitudes", "longitudes")
+        }
+    )
+    # Orden fijo de bloqueo entre réplicas que vuelcan a la vez
+    db.execute(stmt, [filas[clave] for clave in sorted(filas)])
+
+
+def _puntos_ordenados(fila: HistorialUbicacion) -> list:
+    """[(segundos, latitud_micro, longitud_micro)] de una hora, en orden temporal"""
+    return sorted(zip(fila.segundos, fila.latitudes, fila.longitudes), key=lambda punto: punto[0])
+
+
+def obtener_recorrido(db: Session, repartidor_id: str, desde: datetime, hasta: datetime) -> dict:
+    """Puntos del repartidor en [desde, hasta) y la distancia recorrida en metros"""
+    desde, hasta = _utc(desde), _utc(hasta)
+    if desde >= hasta:
+        raise ValueError("desde debe ser anterior a hasta")
+    if hasta - desde > MAX_VENTANA_RECORRIDO:
+        raise ValueError(f"La ventana no puede superar {MAX_VENTANA_RECORRIDO.days} días")
+
+    filas = db.query(HistorialUbicacion).filter(
+        HistorialUbicacion.repartidor_id == repartidor_id,
+        HistorialUbicacion.hora >= _hora(desde),
+        HistorialUbicacion.hora < hasta
+    ).order_by(HistorialUbicacion.hora).all()
+
+    puntos = []
+    for fila in filas:
+        for segundos, latitud, longitud in _puntos_ordenados(fila):
+            instante = fila.hora + timedelta(seconds=segundos)
+            if desde <= instante < hasta:
+                puntos.append({
+                    "latitud": latitud / MICROGRADOS,
+                    "longitud": longitud / MICROGRADOS,
+                    "timestamp": instante
+                })
+
+    distancia = sum(
+        distancia_m(anterior["latitud"], anterior["longitud"], punto["latitud"], punto["longitud"])
+        for anterior, punto in zip(puntos, puntos[1:])
+    )
+    return {
+        "repartidor_id": repartidor_id,
+        "desde": desde,
+        "hasta": hasta,
+        "distancia_m": round(distancia, 1),
+        "puntos": puntos
+    }
+
+
+def submuestrear(puntos: list, resolucion_segundos: int) -> list:
+    """Conserva el primer punto de cada tramo de resolucion_segundos"""
+    resultado, tramo_anterior = [], None
+    for punto in puntos:
+        tramo = punto[0] // resolucion_segundos
+        if tramo != tramo_anterior:
+            resultado.append(punto)
+            tramo_anterior = tramo
+    return resultado
+
+
+def compactar_historial(db: Session, ahora: datetime = None) -> tuple:
+    """
+    Submuestrea las horas fuera de la ventana completa y borra las que
+    superan la retención, por lotes de HISTORIAL_UBICACIONES_LOTE filas.
+    Esas horas ya no reciben puntos, así que no compiten con los volcados.
+    Devuelve (horas_compactadas, horas_eliminadas).
+    """
+    ahora = _utc(ahora or datetime.now(timezone.utc))
+    resolucion = HISTORIAL_UBICACIONES_RESOLUCION_SEGUNDOS
+
+    # Un DELETE por lote: transacciones cortas en vez de una sola sobre toda la cola vencida
+    vencidas = select(HistorialUbicacion.repartidor_id, HistorialUbicacion.hora).where(
+        HistorialUbicacion.hora < ahora - timedelta(days=HISTORIAL_UBICACIONES_RETENCION_DIAS)
+    ).order_by(HistorialUbicacion.hora).limit(HISTORIAL_UBICACIONES_LOTE)
+    stmt = delete(HistorialUbicacion).where(
+        tuple_(HistorialUbicacion.repartidor_id, HistorialUbicacion.hora).in_(vencidas)
+    ).execution_options(synchronize_session=False)
+
+    eliminadas = 0
+    while True:
+        borradas = db.execute(stmt).rowcount
+        db.commit()
+        eliminadas += borradas
+        if borradas < HISTORIAL_UBICACIONES_LOTE:
+            break
+
+    compactadas = 0
+    while True:
+        lote = db.query(HistorialUbicacion).filter(
+            HistorialUbicacion.hora < ahora - timedelta(days=HISTORIAL_UBICACIONES_COMPLETO_DIAS),
+            HistorialUbicacion.resolucion_segundos < resolucion
+        ).limit(HISTORIAL_UBICACIONES_LOTE).all()
+        if not lote:
+            break
+        for fila in lote:
+            segundos, latitudes, longitudes = zip(*submuestrear(_puntos_ordenados(fila), resolucion))
+            fila.segundos, fila.latitudes, fila.longitudes = list(segundos), list(latitudes), list(longitudes)
+            fila.resolucion_segundos = resolucion
+        db.commit()
+        compactadas += len(lote)
+
+    return compactadas, eliminadas
+
+
+if __name__ == "__main__":
+    # Compactación manual o desde cron: python -m fleet_service.historial_ubicaciones
+    from shared.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        compactadas, eliminadas = compactar_historial(db)
+        print(f"Historial de ubicaciones: {compactadas} horas compactadas, {eliminadas} eliminadas")
+    finally:
+        db.close()
@@ -0,0 +1,160 @@
+"""Índice espacial en memoria de repartidores disponibles (grilla de celdas fijas)"""
+from datetime import datetime, timezone
+import heapq
+import math
+import threading
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+RADIO_TIERRA_M = 6_371_000
+METROS_POR_GRADO = 111_320
+# ~1.1 km de lado en latitud; en Colombia (|lat| < 13°) la celda es casi cuadrada
+CELDA_GRADOS = float(os.getenv("INDICE_REPARTIDORES_CELDA_GRADOS", "0.01"))
+
+
+def _epoch(instante: datetime):
+    """Segundos Unix con fracción; un datetime sin zona se toma como UTC"""
+    if instante is None:
+        return None
+    if instante.tzinfo is None:
+        instante = instante.replace(tzinfo=timezone.utc)
+    return instante.timestamp()
+
+
+def distancia_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distancia haversine en metros"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * RADIO_TIERRA_M * math.asin(math.sqrt(a))
+
+
+class IndiceRepartidores:
+    """
+    Repartidores agrupados por celda de CELDA_GRADOS x CELDA_GRADOS.
+    La búsqueda k-NN recorre anillos de celdas alrededor del punto y se
+    detiene cuando ningún anillo más lejano puede mejorar los k mejores.
+    Seguro entre hilos; las actualizaciones son O(1).
+    """
+
+    def __init__(self, celda_grados: float = CELDA_GRADOS):
+        self.celda_grados = celda_grados
+        self._celdas: dict[tuple[int, int], set] = {}
+        # id -> (latitud, longitud, celda, instante de la posición en segundos Unix o None)
+        self._posiciones: dict[str, tuple[float, float, tuple[int, int], float]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._posiciones)
+
+    def _celda(self, latitud: float, longitud: float) -> tuple[int, int]:
+        return (math.floor(latitud / self.celda_grados), math.floor(longitud / self.celda_grados))
+
+    def _quitar(self, repartidor_id: str):
+        anterior = self._posiciones.pop(repartidor_id, None)
+        if anterior is not None:
+            miembros = self._celdas[anterior[2]]
+            miembros.discard(repartidor_id)
+            if not miembros:
+                del self._celdas[anterior[2]]
+
+    def _poner(self, repartidor_id: str, latitud: float, longitud: float, instante):
+        celda = self._celda(latitud, longitud)
+        anterior = self._posiciones.get(repartidor_id)
+        if anterior is not None and anterior[2] != celda:
+            self._quitar(repartidor_id)
+        self._posiciones[repartidor_id] = (latitud, longitud, celda, instante)
+        self._celdas.setdefault(celda, set()).add(repartidor_id)
+
+    def actualizar(self, repartidor_id: str, latitud: float, longitud: float, instante: datetime = None):
+        """Inserta o mueve un repartidor"""
+        with self._lock:
+            self._poner(repartidor_id, latitud, longitud, _epoch(instante))
+
+    def mover(self, repartidor_id: str, latitud: float, longitud: float, instante: datetime = None) -> bool:
+        """
+        Mueve un repartidor solo si ya está en el índice (no cambia su
+        disponibilidad). Un ping no más nuevo que la posición actual se
+        ignora: puede llegar tarde después de que su sucesor ya se volcó.
+        """
+        nuevo = _epoch(instante)
+        with self._lock:
+            actual = self._posiciones.get(repartidor_id)
+            if actual is None:
+                return False
+            if nuevo is not None and actual[3] is not None and actual[3] >= nuevo:
+                return False
+            self._poner(repartidor_id, latitud, longitud, nuevo)
+            return True
+
+    def eliminar(self, repartidor_id: str):
+        """Quita un repartidor (ya no disponible o sin ubicación)"""
+        with self._lock:
+            self._quitar(repartidor_id)
+
+    def reemplazar(self, repartidores):
+        """
+        Reconstruye el índice desde [(id, latitud, longitud, instante)]. Una
+        posición en memoria más nueva que la recibida (ping aún sin volcar)
+        se conserva.
+        """
+        filas = [
+            (repartidor_id, latitud, longitud, _epoch(instante))
+            for repartidor_id, latitud, longitud, instante in repartidores
+        ]
+        celdas, posiciones = {}, {}
+        with self._lock:
+            for repartidor_id, latitud, longitud, instante in filas:
+                actual = self._posiciones.get(repartidor_id)
+                if actual is not None and actual[3] is not None and (instante is None or actual[3] > instante):
+                    latitud, longitud, instante = actual[0], actual[1], actual[3]
+                celda = self._celda(latitud, longitud)
+                posiciones[repartidor_id] = (latitud, longitud, celda, instante)
+                celdas.setdefault(celda, set()).add(repartidor_id)
+            self._celdas, self._posiciones = celdas, posiciones
+
+    def cercanos(self, latitud: float, longitud: float, k: int, radio_m: float) -> list:
+        """Hasta k repartidores a menos de radio_m metros: [(id, distancia_m)] de menor a mayor"""
+        fila0, columna0 = self._celda(latitud, longitud)
+        # Lado mínimo de una celda en metros (la longitud se encoge con la latitud)
+        lado_m = self.celda_grados * METROS_POR_GRADO * max(math.cos(math.radians(abs(latitud) + self.celda_grados)), 0.01)
+        anillo_max = math.ceil(radio_m / lado_m) + 1
+
+        mejores = []  # heap de (-distancia, id) con los k mejores
+        with self._lock:
+            for anillo in range(anillo_max + 1):
+                # Todo punto de este anillo o más allá está al menos a (anillo - 1) * lado_m
+                cota = max(anillo - 1, 0) * lado_m
+                if cota > radio_m or (len(mejores) == k and cota > -mejores[0][0]):
+                    break
+                for celda in self._anillo(fila0, columna0, anillo):
+                    for repartidor_id in self._celdas.get(celda, ()):
+                        lat, lon = self._posiciones[repartidor_id][:2]
+                        distancia = distancia_m(latitud, longitud, lat, lon)
+                        if distancia > radio_m:
+                            continue
+                        if len(mejores) < k:
+                            heapq.heappush(mejores, (-distancia, repartidor_id))
+                        elif distancia < -mejores[0][0]:
+                            heapq.heapreplace(mejores, (-distancia, repartidor_id))
+
+        return [(repartidor_id, -distancia) for distancia, repartidor_id in sorted(mejores, reverse=True)]
+
+    @staticmethod
+    def _anillo(fila0: int, columna0: int, anillo: int):
+        """Celdas a distancia de Chebyshev exactamente `anillo` de (fila0, columna0)"""
+        if anillo == 0:
+            yield (fila0, columna0)
+            return
+        for columna in range(columna0 - anillo, columna0 + anillo + 1):
+            yield (fila0 - anillo, columna)
+            yield (fila0 + anillo, columna)
+        for fila in range(fila0 - anillo + 1, fila0 + anillo):
+            yield (fila, columna0 - anillo)
+            yield (fila, columna0 + anillo)
+
+
+indice_repartidores = IndiceRepartidores()
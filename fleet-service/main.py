@@ -1,14 +1,21 @@
 """Aplicación FastAPI para FleetService"""
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 import sys
 import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from fleet_service.routes import router
-from fleet_service.models import Base
-from shared.database import engine
+from fleet_service.models import Base, EstadoRepartidorEnum
+from fleet_service.service import FleetService
+from fleet_service.ubicaciones import UBICACIONES_INTERVALO_SEGUNDOS, volcar_ubicaciones
+from fleet_service.historial_ubicaciones import compactar_historial
+from fleet_service.disponibilidad import BARRIDO_SIN_SENAL_INTERVALO_SEGUNDOS
+from fleet_service.despacho import cerrar_pool
+from shared.database import engine, SessionLocal
 from shared.logger import setup_logger
 
 logger = setup_logger("fleet-service")
@@ -33,6 +40,123 @@ app.add_middleware(
 app.include_router(router, prefix="/api/fleet", tags=["fleet"])
 
 
+# Reconstrucción periódica del índice espacial y del snapshot: recoge cambios hechos por otras réplicas
+INDICE_RESYNC_SEGUNDOS = int(os.getenv("INDICE_REPARTIDORES_RESYNC_SEGUNDOS", "60"))
+
+
+def cargar_indice():
+    """Carga el índice de repartidores disponibles y el snapshot de la flota con su propia sesión"""
+    db = SessionLocal()
+    try:
+        return FleetService.cargar_indice(db)
+    finally:
+        db.close()
+
+
+async def job_indice():
+    """Reconstruye periódicamente el índice espacial y el snapshot desde la BD"""
+    while True:
+        await asyncio.sleep(INDICE_RESYNC_SEGUNDOS)
+        try:
+            await run_in_threadpool(cargar_indice)
+        except Exception as e:
+            logger.error(f"Error sincronizando índice de repartidores: {str(e)}")
+
+
+def volcar():
+    """Escribe las ubicaciones pendientes con su propia sesión"""
+    db = SessionLocal()
+    try:
+        return volcar_ubicaciones(db)
+    finally:
+        db.close()
+
+
+async def job_ubicaciones():
+    """Vuelca periódicamente las ubicaciones recibidas en un solo UPDATE"""
+    while True:
+        await asyncio.sleep(UBICACIONES_INTERVALO_SEGUNDOS)
+        try:
+            await run_in_threadpool(volcar)
+        except Exception as e:
+            logger.error(f"Error volcando ubicaciones: {str(e)}")
+
+
+# Submuestreo y retención del historial de ubicaciones
+HISTORIAL_COMPACTAR_SEGUNDOS = int(os.getenv("HISTORIAL_UBICACIONES_COMPACTAR_SEGUNDOS", "3600"))
+
+
+def compactar():
+    """Compacta el historial de ubicaciones con su propia sesión"""
+    db = SessionLocal()
+    try:
+        return compactar_historial(db)
+    finally:
+        db.close()
+
+
+async def job_historial():
+    """Submuestrea y purga periódicamente el historial de ubicaciones"""
+    while True:
+        await asyncio.sleep(HISTORIAL_COMPACTAR_SEGUNDOS)
+        try:
+            compactadas, eliminadas = await run_in_threadpool(compactar)
+            logger.info(f"Historial de ubicaciones: {compactadas} horas compactadas, {eliminadas} eliminadas")
+        except Exception as e:
+            logger.error(f"Error compactando historial de ubicaciones: {str(e)}")
+
+
+def conciliar():
+    """Barre los repartidores sin señal con su propia sesión"""
+    db = SessionLocal()
+    try:
+        return FleetService.conciliar_disponibilidad(db)
+    finally:
+        db.close()
+
+
+async def job_sin_senal():
+    """Saca periódicamente de la disponibilidad a los repartidores que dejaron de reportar ubicación"""
+    while True:
+        await asyncio.sleep(BARRIDO_SIN_SENAL_INTERVALO_SEGUNDOS)
+        try:
+            cambiados = await run_in_threadpool(conciliar)
+            if cambiados:
+                marcados = sum(1 for fila in cambiados if fila.estado == EstadoRepartidorEnum.SIN_SENAL)
+                logger.info(f"Barrido sin señal: {marcados} marcados, {len(cambiados) - marcados} reactivados")
+        except Exception as e:
+            logger.error(f"Error en el barrido de repartidores sin señal: {str(e)}")
+
+
+@app.on_event("startup")
+async def iniciar_jobs():
+    """Carga el índice espacial e inicia su resincronización (INDICE_REPARTIDORES_RESYNC_SEGUNDOS=0 la desactiva)"""
+    cargados = await run_in_threadpool(cargar_indice)
+    logger.info(f"Índice de repartidores cargado: {cargados}")
+    if INDICE_RESYNC_SEGUNDOS > 0:
+        app.state.job_indice = asyncio.create_task(job_indice())
+    app.state.job_ubicaciones = asyncio.create_task(job_ubicaciones())
+    if HISTORIAL_COMPACTAR_SEGUNDOS > 0:
+        app.state.job_historial = asyncio.create_task(job_historial())
+    if BARRIDO_SIN_SENAL_INTERVALO_SEGUNDOS > 0:
+        app.state.job_sin_senal = asyncio.create_task(job_sin_senal())
+
+
+@app.on_event("shutdown")
+async def detener_jobs():
+    for nombre in ("job_indice", "job_ubicaciones", "job_historial", "job_sin_senal"):
+        tarea = getattr(app.state, nombre, None)
+        if tarea:
+            tarea.cancel()
+    cerrar_pool()
+    # Último volcado para no perder los pings recibidos desde el anterior
+    try:
+        volcadas = await run_in_threadpool(volcar)
+        logger.info(f"Ubicaciones volcadas al detener: {volcadas}")
+    except Exception as e:
+        logger.error(f"Error volcando ubicaciones al detener: {str(e)}")
+
+
 @app.get("/health", tags=["Health"])
 async def health_check():
     return {"status": "healthy", "service": "fleet-service"}
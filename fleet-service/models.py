@@ -1,5 +1,6 @@
 """Modelos de base de datos para FleetService"""
-from sqlalchemy import Column, String, DateTime, Enum as SQLEnum, Float, Boolean
+from sqlalchemy import Column, String, DateTime, Enum as SQLEnum, Float, Boolean, Integer, SmallInteger, Index, text
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.sql import func
 from datetime import datetime
 import enum
@@ -9,6 +10,7 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from shared.database import Base
+from shared.ids import UUIDStr
 
 
 class EstadoRepartidorEnum(str, enum.Enum):
@@ -16,6 +18,8 @@ class EstadoRepartidorEnum(str, enum.Enum):
     EN_RUTA = "EN_RUTA"
     MANTENIMIENTO = "MANTENIMIENTO"
     INACTIVO = "INACTIVO"
+    # Asignado por el barrido de disponibilidad; vuelve a DISPONIBLE al reportar ubicación
+    SIN_SENAL = "SIN_SENAL"
 
 
 class TipoVehiculoEnum(str, enum.Enum):
@@ -27,8 +31,22 @@ class TipoVehiculoEnum(str, enum.Enum):
 
 class Repartidor(Base):
     __tablename__ = "repartidores"
+    __table_args__ = (
+        # Ranking de repartidores activos; el orden sale del índice, sin ordenar la tabla
+        Index(
+            "ix_repartidores_ranking_calificacion",
+            text("calificacion_promedio DESC"), text("calificaciones_total DESC"),
+            postgresql_where=text("is_active")
+        ),
+        Index(
+            "ix_repartidores_ranking_entregas", text("entregas_completadas DESC"),
+            postgresql_where=text("is_active")
+        ),
+        # Barrido de disponibilidad: DISPONIBLE / SIN_SENAL por antigüedad de la última ubicación
+        Index("ix_repartidores_estado_ultima_ubicacion", "estado", "ultima_ubicacion"),
+    )
     
-    id = Column(String(36), primary_key=True, index=True)
+    id = Column(UUIDStr(), primary_key=True)
     nombre = Column(String(255), nullable=False)
     email = Column(String(255), unique=True, nullable=False, index=True)
     telefono = Column(String(20), nullable=False)
@@ -39,9 +57,10 @@ class Repartidor(Base):
     longitud = Column(Float, nullable=True)
     ultima_ubicacion = Column(DateTime(timezone=True), nullable=True)
     
-    # Información
-    calificacion_promedio = Column(Float, default=5.0)
-    entregas_completadas = Column(String(36), default=0)
+    # Desempeño: contadores que solo se modifican con UPDATE x = x + 1
+    calificacion_promedio = Column(Float, nullable=False, default=5.0, server_default=text("5.0"))
+    calificaciones_total = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    entregas_completadas = Column(Integer, nullable=False, default=0, server_default=text("0"))
     
     # Auditoría
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -55,8 +74,8 @@ class Repartidor(Base):
 class Vehiculo(Base):
     __tablename__ = "vehiculos"
     
-    id = Column(String(36), primary_key=True, index=True)
-    repartidor_id = Column(String(36), nullable=False, index=True)
+    id = Column(UUIDStr(), primary_key=True)
+    repartidor_id = Column(UUIDStr(), nullable=False, index=True)
     placa = Column(String(20), unique=True, nullable=False, index=True)
     tipo = Column(SQLEnum(TipoVehiculoEnum), nullable=False)
     modelo = Column(String(100), nullable=False)
@@ -77,3 +96,43 @@ class Vehiculo(Base):
     
     def __repr__(self):
         return f"<Vehiculo {self.placa}>"
+
+
+class EntregaRepartidor(Base):
+    """
+    Entrega de un pedido registrada para un repartidor. La PK en pedido_id
+    hace que cada pedido cuente una sola vez en entregas_completadas y se
+    pueda calificar una sola vez, y solo para quien lo entregó.
+    """
+    __tablename__ = "entregas_repartidor"
+    
+    pedido_id = Column(UUIDStr(), primary_key=True)
+    repartidor_id = Column(UUIDStr(), nullable=False, index=True)
+    calificacion = Column(SmallInteger, nullable=True)
+    calificado_por = Column(UUIDStr(), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    calificado_at = Column(DateTime(timezone=True), nullable=True)
+    
+    def __repr__(self):
+        return f"<EntregaRepartidor {self.pedido_id}>"
+
+
+class HistorialUbicacion(Base):
+    """
+    Recorrido de un repartidor en una hora: una fila por (repartidor, hora)
+    con los puntos en arreglos paralelos. El tiempo va como segundos desde el
+    inicio de la hora y las coordenadas en microgrados enteros (~0.1 m), unos
+    10 bytes por punto frente a una fila por ping.
+    """
+    __tablename__ = "historial_ubicaciones"
+    
+    repartidor_id = Column(UUIDStr(), primary_key=True)
+    hora = Column(DateTime(timezone=True), primary_key=True, index=True)
+    segundos = Column(ARRAY(SmallInteger), nullable=False)
+    latitudes = Column(ARRAY(Integer), nullable=False)
+    longitudes = Column(ARRAY(Integer), nullable=False)
+    # 0 = todos los puntos recibidos; N = a lo sumo un punto cada N segundos
+    resolucion_segundos = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<HistorialUbicacion {self.repartidor_id} {self.hora}>"
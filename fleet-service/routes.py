@@ -1,5 +1,11 @@
 """API endpoints para FleetService"""
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+import msgpack
+from datetime import datetime, timedelta, timezone
+import asyncio
+from typing import Literal, Optional, Union
 from sqlalchemy.orm import Session
 import sys
 import os
@@ -8,18 +14,35 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 from fleet_service.models import Repartidor, Vehiculo, EstadoRepartidorEnum
 from fleet_service.schemas import (
-    CreateRepartidorRequest, UpdateRepartidorRequest, RepartidorResponse,
-    CreateVehiculoRequest, VehiculoResponse
+    CreateRepartidorRequest, UpdateRepartidorRequest, RepartidorResponse, RepartidorCercanoResponse,
+    LoteUbicacionesRequest, LoteUbicacionesResponse, RecorridoRepartidorResponse,
+    DespachoRequest, DespachoResponse, RutaRequest, RutaResponse,
+    CalificacionRequest, CalificacionResponse, EntregaCompletadaRequest, EntregaCompletadaResponse, RankingRepartidorResponse,
+    CreateVehiculoRequest, VehiculoResponse, RepartidorConVehiculosResponse
 )
 from fleet_service.service import FleetService
+from fleet_service.snapshot_flota import snapshot_flota
+from fleet_service.difusion import atender_cliente, rectangulo, difusor, MensajeInvalidoError
+from fleet_service.disponibilidad import metricas_barrido, REPARTIDOR_SIN_SENAL_SEGUNDOS
+from fleet_service.ubicaciones import buffer_ubicaciones
+from fleet_service.indice_espacial import indice_repartidores
+from fleet_service.despacho import ejecutar_despacho, DESPACHO_RADIO_MAX_M, DESPACHO_MAX_PEDIDOS_REPARTIDOR
 from shared.database import get_db
-from shared.jwt_utils import verify_jwt_in_request
+from shared.http_cache import compute_etag, etag_matches, not_modified, set_cache_headers
+from shared.jwt_utils import verify_jwt_in_request, verify_token
 from shared.logger import setup_logger, log_request
 
 router = APIRouter()
 logger = setup_logger("fleet-service")
 
 
+def _con_vehiculos(repartidor: Repartidor, vehiculos: list) -> RepartidorConVehiculosResponse:
+    return RepartidorConVehiculosResponse(
+        **RepartidorResponse.model_validate(repartidor).model_dump(),
+        vehiculos=[VehiculoResponse.model_validate(vehiculo) for vehiculo in vehiculos]
+    )
+
+
 @router.post("/repartidores", response_model=RepartidorResponse, tags=["Repartidores"])
 async def crear_repartidor(
     repartidor_data: CreateRepartidorRequest,
@@ -48,20 +71,257 @@ async def crear_repartidor(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error creando repartidor")
 
 
-@router.get("/repartidores/{repartidor_id}", response_model=RepartidorResponse, tags=["Repartidores"])
+@router.post("/repartidores/ubicaciones", response_model=LoteUbicacionesResponse,
+             status_code=status.HTTP_202_ACCEPTED, tags=["Repartidores"])
+async def registrar_ubicaciones(
+    lote: LoteUbicacionesRequest,
+    request: Request
+):
+    """
+    Ingesta de pings de GPS (uno o varios repartidores). No escribe en la BD:
+    se guarda el último ping de cada repartidor y se vuelca en un solo UPDATE
+    cada UBICACIONES_INTERVALO_SEGUNDOS. Los pings más antiguos que el último
+    recibido se ignoran. Un REPARTIDOR solo reporta su propia ubicación;
+    supervisores y administradores, la de cualquiera.
+    """
+    try:
+        token_data = await verify_jwt_in_request(request)
+        user_role = token_data.get("role", "").upper()
+        
+        if user_role == "REPARTIDOR":
+            if any(ubicacion.repartidor_id != token_data.get("sub") for ubicacion in lote.ubicaciones):
+                log_request(logger, "POST", "/repartidores/ubicaciones", 403, token_data.get("sub"))
+                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo puede reportar su propia ubicación")
+        elif user_role not in ["SUPERVISOR", "ADMIN"]:
+            log_request(logger, "POST", "/repartidores/ubicaciones", 403, token_data.get("sub"))
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado para reportar ubicaciones")
+        
+        aceptadas = FleetService.registrar_ubicaciones(lote.ubicaciones)
+        log_request(logger, "POST", "/repartidores/ubicaciones", 202, token_data.get("sub"))
+        return {"recibidas": len(lote.ubicaciones), "aceptadas": aceptadas}
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_request(logger, "POST", "/repartidores/ubicaciones", 500, None)
+        logger.error(f"Error registrando ubicaciones: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error registrando ubicaciones")
+
+
+@router.get("/repartidores/snapshot", tags=["Repartidores"])
+async def snapshot_repartidores(
+    request: Request,
+    desde: Optional[int] = Query(None, ge=0),
+    epoca: Optional[str] = None
+):
+    """
+    Estado y posición de todos los repartidores activos en columnas paralelas
+    (ids, estados, latitudes, longitudes, timestamps), servido desde memoria.
+    Con `desde` y `epoca` de una respuesta anterior devuelve solo los cambios
+    y los ids `eliminados`; si `completo` es true el cliente debe reemplazar
+    su copia. Con `Accept: application/x-msgpack` responde en MessagePack.
+    Soporta GET condicional (If-None-Match). Solo supervisores.
+    """
+    try:
+        token_data = await verify_jwt_in_request(request)
+        user_role = token_data.get("role", "").upper()
+        
+        if user_role not in ["SUPERVISOR", "ADMIN"]:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo supervisores pueden consultar el snapshot de la flota")
+        
+        etag = compute_etag(snapshot_flota.epoca, snapshot_flota.version, desde, epoca)
+        if etag_matches(request, etag):
+            log_request(logger, "GET", "/repartidores/snapshot", 304, token_data.get("sub"))
+            return not_modified(etag)
+        
+        snapshot = snapshot_flota.obtener(desde, epoca)
+        # La versión pudo avanzar entre el ETag y la lectura
+        etag = compute_etag(snapshot["epoca"], snapshot["version"], desde, epoca)
+        if "application/x-msgpack" in request.headers.get("Accept", ""):
+            response = Response(content=msgpack.packb(snapshot), media_type="application/x-msgpack")
+        else:
+            response = JSONResponse(content=snapshot)
+        set_cache_headers(response, etag)
+        log_request(logger, "GET", "/repartidores/snapshot", 200, token_data.get("sub"))
+        return response
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_request(logger, "GET", "/repartidores/snapshot", 500, None)
+        logger.error(f"Error obteniendo snapshot de la flota: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error obteniendo snapshot de la flota")
+
+
+def _token_websocket(websocket: WebSocket) -> tuple[str, Optional[str]]:
+    """
+    Token del header Authorization o, desde el navegador (que no permite
+    headers), del subprotocolo: Sec-WebSocket-Protocol: bearer, <token>.
+    Devuelve (token, subprotocolo a aceptar). Nunca en la URL: quedaría en
+    los logs de acceso de Kong y uvicorn.
+    """
+    auth_header = websocket.headers.get("Authorization", "")
+    if auth_header.lower().startswith("bearer "):
+        return auth_header[len("bearer "):].strip(), None
+    protocolos = [p.strip() for p in websocket.headers.get("Sec-WebSocket-Protocol", "").split(",") if p.strip()]
+    if len(protocolos) == 2 and protocolos[0].lower() == "bearer":
+        return protocolos[1], protocolos[0]
+    return "", None
+
+
+@router.websocket("/repartidores/en-vivo")
+async def repartidores_en_vivo(
+    websocket: WebSocket,
+    ciudad: Optional[str] = None,
+    lat_min: Optional[float] = None,
+    lon_min: Optional[float] = None,
+    lat_max: Optional[float] = None,
+    lon_max: Optional[float] = None
+):
+    """
+    Posiciones y estados de repartidores en vivo, filtrados por ciudad o
+    rectángulo. El token va en el header Authorization o, desde el
+    navegador, en el subprotocolo "bearer, <token>". Solo supervisores.
+    """
+    try:
+        token, subprotocolo = _token_websocket(websocket)
+        token_data = verify_token(token)
+        if token_data.get("role", "").upper() not in ["SUPERVISOR", "ADMIN"]:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo supervisores pueden seguir la flota en vivo")
+        filtro = rectangulo(ciudad, lat_min, lon_min, lat_max, lon_max)
+    except HTTPException as e:
+        log_request(logger, "WS", "/repartidores/en-vivo", e.status_code, None)
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+        return
+    except ValueError as e:
+        log_request(logger, "WS", "/repartidores/en-vivo", 400, None)
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e))
+        return
+    
+    await websocket.accept(subprotocol=subprotocolo)
+    log_request(logger, "WS", "/repartidores/en-vivo", 101, token_data.get("sub"))
+    try:
+        await atender_cliente(websocket, filtro)
+    except WebSocketDisconnect:
+        pass
+    except asyncio.TimeoutError:
+        log_request(logger, "WS", "/repartidores/en-vivo", 408, token_data.get("sub"))
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Cliente demasiado lento")
+    except MensajeInvalidoError as e:
+        log_request(logger, "WS", "/repartidores/en-vivo", 400, token_data.get("sub"))
+        await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA, reason=str(e))
+    except ValueError as e:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason=str(e))
+    except Exception as e:
+        logger.error(f"Error en difusión en vivo: {str(e)}")
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+
+
+@router.get("/repartidores/cercanos", response_model=list[RepartidorCercanoResponse], tags=["Repartidores"])
+async def repartidores_cercanos(
+    request: Request,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(10, ge=1, le=100),
+    radio: float = Query(5000, gt=0, le=50000),
+    db: Session = Depends(get_db)
+):
+    """
+    Los k repartidores DISPONIBLE más cercanos a (lat, lon) dentro de
+    `radio` metros, de menor a mayor distancia. Solo supervisores.
+    """
+    try:
+        token_data = await verify_jwt_in_request(request)
+        user_role = token_data.get("role", "").upper()
+        
+        if user_role not in ["SUPERVISOR", "ADMIN"]:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo supervisores pueden buscar repartidores cercanos")
+        
+        cercanos = FleetService.obtener_repartidores_cercanos(db, lat, lon, k, radio)
+        log_request(logger, "GET", "/repartidores/cercanos", 200, token_data.get("sub"))
+        return [{"repartidor": repartidor, "distancia_m": round(distancia, 1)} for repartidor, distancia in cercanos]
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_request(logger, "GET", "/repartidores/cercanos", 500, None)
+        logger.error(f"Error buscando repartidores cercanos: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error buscando repartidores cercanos")
+
+
+@router.get("/repartidores/ranking", response_model=list[RankingRepartidorResponse], tags=["Repartidores"])
+async def ranking_repartidores(
+    request: Request,
+    criterio: Literal["calificacion", "entregas"] = "calificacion",
+    limite: int = Query(10, ge=1, le=100),
+    min_calificaciones: int = Query(5, ge=1),
+    db: Session = Depends(get_db)
+):
+    """
+    Mejores repartidores activos por calificación promedio (con al menos
+    `min_calificaciones`) o por entregas completadas. Solo supervisores.
+    """
+    try:
+        token_data = await verify_jwt_in_request(request)
+        user_role = token_data.get("role", "").upper()
+        
+        if user_role not in ["SUPERVISOR", "ADMIN"]:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo supervisores pueden consultar el ranking")
+        
+        ranking = FleetService.obtener_ranking(db, criterio, limite, min_calificaciones)
+        log_request(logger, "GET", "/repartidores/ranking", 200, token_data.get("sub"))
+        return ranking
+    except ValueError as e:
+        log_request(logger, "GET", "/repartidores/ranking", 400, None)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_request(logger, "GET", "/repartidores/ranking", 500, None)
+        logger.error(f"Error obteniendo ranking: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error obteniendo ranking")
+
+
+@router.get("/repartidores/{repartidor_id}", response_model=Union[RepartidorConVehiculosResponse, RepartidorResponse],
+            tags=["Repartidores"])
 async def obtener_repartidor(
     repartidor_id: str,
     request: Request,
+    response: Response,
+    incluir_vehiculos: bool = False,
     db: Session = Depends(get_db)
 ):
-    """Obtiene un repartidor específico."""
+    """
+    Obtiene un repartidor específico; con incluir_vehiculos=true embebe sus
+    vehículos activos. Soporta GET condicional (If-None-Match).
+    """
     try:
         token_data = await verify_jwt_in_request(request)
+        
+        if request.headers.get("If-None-Match"):
+            marca = FleetService.obtener_marca_repartidor(db, repartidor_id)
+            if not marca:
+                raise ValueError("Repartidor no encontrado")
+            if incluir_vehiculos:
+                # Alta, baja o cambio de un vehículo también invalida el ETag del detalle embebido
+                marca = (*marca, *FleetService.obtener_marca_vehiculos_repartidor(db, repartidor_id))
+            etag = compute_etag(repartidor_id, *marca)
+            if etag_matches(request, etag):
+                log_request(logger, "GET", f"/repartidores/{repartidor_id}", 304, token_data.get("sub"))
+                return not_modified(etag)
+        
         repartidor = FleetService.obtener_repartidor(db, repartidor_id)
         
         if not repartidor:
             raise ValueError("Repartidor no encontrado")
         
+        if incluir_vehiculos:
+            vehiculos = FleetService.obtener_vehiculos_por_repartidor(db, [repartidor.id])[repartidor.id]
+            set_cache_headers(response, compute_etag(
+                repartidor_id, repartidor.updated_at,
+                *sorted((vehiculo.id, vehiculo.updated_at) for vehiculo in vehiculos)
+            ))
+            log_request(logger, "GET", f"/repartidores/{repartidor_id}", 200, token_data.get("sub"))
+            return _con_vehiculos(repartidor, vehiculos)
+        
+        set_cache_headers(response, compute_etag(repartidor_id, repartidor.updated_at))
         log_request(logger, "GET", f"/repartidores/{repartidor_id}", 200, token_data.get("sub"))
         return repartidor
     except ValueError as e:
@@ -75,17 +335,195 @@ async def obtener_repartidor(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error obteniendo repartidor")
 
 
-@router.get("/repartidores", response_model=list[RepartidorResponse], tags=["Repartidores"])
+@router.get("/repartidores/{repartidor_id}/recorrido", response_model=RecorridoRepartidorResponse, tags=["Repartidores"])
+async def obtener_recorrido(
+    repartidor_id: str,
+    request: Request,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Puntos registrados del repartidor en [desde, hasta) y la distancia
+    recorrida. Por defecto, la última hora; ventana máxima de 7 días. Los
+    datos de más de HISTORIAL_UBICACIONES_COMPLETO_DIAS días están
+    submuestreados. Solo supervisores.
+    """
+    try:
+        token_data = await verify_jwt_in_request(request)
+        user_role = token_data.get("role", "").upper()
+        
+        if user_role not in ["SUPERVISOR", "ADMIN"]:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo supervisores pueden consultar recorridos")
+        
+        if not FleetService.obtener_repartidor(db, repartidor_id):
+            log_request(logger, "GET", f"/repartidores/{repartidor_id}/recorrido", 404, token_data.get("sub"))
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Repartidor no encontrado")
+        
+        hasta = hasta or datetime.now(timezone.utc)
+        desde = desde or hasta - timedelta(hours=1)
+        recorrido = FleetService.obtener_recorrido(db, repartidor_id, desde, hasta)
+        log_request(logger, "GET", f"/repartidores/{repartidor_id}/recorrido", 200, token_data.get("sub"))
+        return recorrido
+    except ValueError as e:
+        log_request(logger, "GET", f"/repartidores/{repartidor_id}/recorrido", 400, None)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_request(logger, "GET", f"/repartidores/{repartidor_id}/recorrido", 500, None)
+        logger.error(f"Error obteniendo recorrido: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error obteniendo recorrido")
+
+
+@router.post("/repartidores/{repartidor_id}/ruta", response_model=RutaResponse, tags=["Repartidores"])
+async def planear_ruta(
+    repartidor_id: str,
+    ruta_data: RutaRequest,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Ordena las paradas del repartidor (hasta 500) con vecino más cercano +
+    2-opt, partiendo del origen indicado o de su última ubicación. Devuelve
+    la secuencia con distancia acumulada y la distancia total estimada.
+    Solo el propio repartidor, supervisores y administradores.
+    """
+    try:
+        token_data = await verify_jwt_in_request(request)
+        user_role = token_data.get("role", "").upper()
+        if user_role == "REPARTIDOR":
+            if repartidor_id != token_data.get("sub"):
+                log_request(logger, "POST", f"/repartidores/{repartidor_id}/ruta", 403, token_data.get("sub"))
+                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo puede planear su propia ruta")
+        elif user_role not in ["SUPERVISOR", "ADMIN"]:
+            log_request(logger, "POST", f"/repartidores/{repartidor_id}/ruta", 403, token_data.get("sub"))
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado para planear rutas")
+        
+        repartidor = FleetService.obtener_repartidor(db, repartidor_id)
+        if not repartidor:
+            log_request(logger, "POST", f"/repartidores/{repartidor_id}/ruta", 404, token_data.get("sub"))
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Repartidor no encontrado")
+        
+        ruta = await run_in_threadpool(
+            FleetService.planear_ruta_repartidor, repartidor, ruta_data.paradas,
+            ruta_data.origen_latitud, ruta_data.origen_longitud
+        )
+        log_request(logger, "POST", f"/repartidores/{repartidor_id}/ruta", 200, token_data.get("sub"))
+        return ruta
+    except ValueError as e:
+        log_request(logger, "POST", f"/repartidores/{repartidor_id}/ruta", 400, None)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_request(logger, "POST", f"/repartidores/{repartidor_id}/ruta", 500, None)
+        logger.error(f"Error planeando ruta: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error planeando ruta")
+
+
+@router.post("/repartidores/{repartidor_id}/calificaciones", response_model=CalificacionResponse,
+             status_code=status.HTTP_201_CREATED, tags=["Repartidores"])
+async def calificar_repartidor(
+    repartidor_id: str,
+    calificacion_data: CalificacionRequest,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Califica (1 a 5) la entrega de un pedido y actualiza el promedio
+    acumulado. El pedido debe estar registrado como entregado por el
+    repartidor y se califica una sola vez. Un repartidor no puede calificar.
+    """
+    try:
+        token_data = await verify_jwt_in_request(request)
+        user_role = token_data.get("role", "").upper()
+        
+        if user_role == "REPARTIDOR":
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Los repartidores no pueden registrar calificaciones")
+        
+        fila = FleetService.registrar_calificacion(
+            db, repartidor_id, calificacion_data.pedido_id, calificacion_data.calificacion, token_data.get("sub")
+        )
+        if not fila:
+            log_request(logger, "POST", f"/repartidores/{repartidor_id}/calificaciones", 404, token_data.get("sub"))
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Repartidor no encontrado")
+        
+        log_request(logger, "POST", f"/repartidores/{repartidor_id}/calificaciones", 201, token_data.get("sub"))
+        return {
+            "repartidor_id": fila.id,
+            "pedido_id": calificacion_data.pedido_id,
+            "calificacion_promedio": round(fila.calificacion_promedio, 2),
+            "calificaciones_total": fila.calificaciones_total
+        }
+    except ValueError as e:
+        log_request(logger, "POST", f"/repartidores/{repartidor_id}/calificaciones", 400, None)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_request(logger, "POST", f"/repartidores/{repartidor_id}/calificaciones", 500, None)
+        logger.error(f"Error registrando calificación: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error registrando calificación")
+
+
+@router.post("/repartidores/{repartidor_id}/entregas", response_model=EntregaCompletadaResponse,
+             status_code=status.HTTP_201_CREATED, tags=["Repartidores"])
+async def registrar_entrega(
+    repartidor_id: str,
+    entrega_data: EntregaCompletadaRequest,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Registra la entrega de un pedido y suma una entrega completada al
+    repartidor; cada pedido cuenta una sola vez. Solo supervisores.
+    """
+    try:
+        token_data = await verify_jwt_in_request(request)
+        user_role = token_data.get("role", "").upper()
+        
+        if user_role not in ["SUPERVISOR", "ADMIN"]:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo supervisores pueden registrar entregas")
+        
+        fila = FleetService.registrar_entrega_completada(db, repartidor_id, entrega_data.pedido_id)
+        if not fila:
+            log_request(logger, "POST", f"/repartidores/{repartidor_id}/entregas", 404, token_data.get("sub"))
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Repartidor no encontrado")
+        
+        log_request(logger, "POST", f"/repartidores/{repartidor_id}/entregas", 201, token_data.get("sub"))
+        return {"repartidor_id": fila.id, "pedido_id": entrega_data.pedido_id, "entregas_completadas": fila.entregas_completadas}
+    except ValueError as e:
+        log_request(logger, "POST", f"/repartidores/{repartidor_id}/entregas", 400, None)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_request(logger, "POST", f"/repartidores/{repartidor_id}/entregas", 500, None)
+        logger.error(f"Error registrando entrega: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error registrando entrega")
+
+
+@router.get("/repartidores", response_model=Union[list[RepartidorConVehiculosResponse], list[RepartidorResponse]],
+            tags=["Repartidores"])
 async def listar_repartidores(
     skip: int = 0,
     limit: int = 10,
+    incluir_vehiculos: bool = False,
     request: Request = None,
     db: Session = Depends(get_db)
 ):
-    """Lista todos los repartidores activos."""
+    """
+    Lista todos los repartidores activos. Con incluir_vehiculos=true embebe
+    los vehículos activos de cada uno, cargados en una sola consulta para
+    toda la página.
+    """
     try:
         token_data = await verify_jwt_in_request(request)
         repartidores = FleetService.obtener_todos_repartidores(db, skip, limit)
+        if incluir_vehiculos:
+            vehiculos = FleetService.obtener_vehiculos_por_repartidor(db, [r.id for r in repartidores])
+            repartidores = [_con_vehiculos(repartidor, vehiculos[repartidor.id]) for repartidor in repartidores]
         log_request(logger, "GET", "/repartidores", 200, token_data.get("sub"))
         return repartidores
     except HTTPException:
@@ -103,9 +541,18 @@ async def actualizar_repartidor(
     request: Request,
     db: Session = Depends(get_db)
 ):
-    """Actualiza un repartidor (PATCH)."""
+    """Actualiza un repartidor (PATCH). Un repartidor solo puede actualizarse a sí mismo."""
     try:
         token_data = await verify_jwt_in_request(request)
+        user_role = token_data.get("role", "").upper()
+        if user_role == "REPARTIDOR":
+            if repartidor_id != token_data.get("sub"):
+                log_request(logger, "PATCH", f"/repartidores/{repartidor_id}", 403, token_data.get("sub"))
+                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo puede actualizar su propio perfil")
+        elif user_role not in ["SUPERVISOR", "ADMIN"]:
+            log_request(logger, "PATCH", f"/repartidores/{repartidor_id}", 403, token_data.get("sub"))
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No autorizado para actualizar repartidores")
+        
         repartidor = FleetService.actualizar_repartidor(db, repartidor_id, repartidor_data)
         log_request(logger, "PATCH", f"/repartidores/{repartidor_id}", 200, token_data.get("sub"))
         return repartidor
@@ -120,6 +567,53 @@ async def actualizar_repartidor(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error actualizando repartidor")
 
 
+@router.post("/despacho", response_model=DespachoResponse, tags=["Despacho"])
+async def planear_despacho(
+    despacho: DespachoRequest,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Propone la asignación de una oleada de pedidos a los repartidores
+    DISPONIBLE respetando la capacidad de su vehículo. No modifica pedidos:
+    cada asignación se aplica con POST /api/pedidos/lote/transicion.
+    HUNGARO (por defecto hasta 1M pares) optimiza la primera parada de cada
+    repartidor; VORAZ encadena siempre el par más cercano. Solo supervisores.
+    """
+    try:
+        token_data = await verify_jwt_in_request(request)
+        user_role = token_data.get("role", "").upper()
+        
+        if user_role not in ["SUPERVISOR", "ADMIN"]:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo supervisores pueden planear despachos")
+        
+        radio_m = despacho.radio_m or DESPACHO_RADIO_MAX_M
+        repartidores = FleetService.obtener_candidatos_despacho(db, despacho.pedidos, radio_m, despacho.repartidor_ids)
+        pedidos = {
+            "ids": [pedido.id for pedido in despacho.pedidos],
+            "latitudes": [pedido.latitud for pedido in despacho.pedidos],
+            "longitudes": [pedido.longitud for pedido in despacho.pedidos],
+            "pesos_kg": [pedido.peso_kg for pedido in despacho.pedidos]
+        }
+        plan = await ejecutar_despacho(
+            pedidos, repartidores,
+            algoritmo=despacho.algoritmo,
+            radio_m=radio_m,
+            max_pedidos=despacho.max_pedidos_por_repartidor or DESPACHO_MAX_PEDIDOS_REPARTIDOR
+        )
+        log_request(logger, "POST", "/despacho", 200, token_data.get("sub"))
+        return plan
+    except ValueError as e:
+        log_request(logger, "POST", "/despacho", 400, None)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_request(logger, "POST", "/despacho", 500, None)
+        logger.error(f"Error planeando despacho: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error planeando despacho")
+
+
 @router.post("/vehiculos", response_model=VehiculoResponse, tags=["Vehiculos"])
 async def crear_vehiculo(
     vehiculo_data: CreateVehiculoRequest,
@@ -152,16 +646,28 @@ async def crear_vehiculo(
 async def obtener_vehiculo(
     vehiculo_id: str,
     request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
-    """Obtiene un vehículo específico."""
+    """Obtiene un vehículo específico. Soporta GET condicional (If-None-Match)."""
     try:
         token_data = await verify_jwt_in_request(request)
+        
+        if request.headers.get("If-None-Match"):
+            marca = FleetService.obtener_marca_vehiculo(db, vehiculo_id)
+            if not marca:
+                raise ValueError("Vehículo no encontrado")
+            etag = compute_etag(vehiculo_id, *marca)
+            if etag_matches(request, etag):
+                log_request(logger, "GET", f"/vehiculos/{vehiculo_id}", 304, token_data.get("sub"))
+                return not_modified(etag)
+        
         vehiculo = FleetService.obtener_vehiculo(db, vehiculo_id)
         
         if not vehiculo:
             raise ValueError("Vehículo no encontrado")
         
+        set_cache_headers(response, compute_etag(vehiculo_id, vehiculo.updated_at))
         log_request(logger, "GET", f"/vehiculos/{vehiculo_id}", 200, token_data.get("sub"))
         return vehiculo
     except ValueError as e:
@@ -173,3 +679,38 @@ async def obtener_vehiculo(
         log_request(logger, "GET", f"/vehiculos/{vehiculo_id}", 500, None)
         logger.error(f"Error obteniendo vehículo: {str(e)}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error obteniendo vehículo")
+
+
+@router.get("/metricas", tags=["Metricas"])
+async def metricas_flota(request: Request):
+    """
+    Métricas en memoria de esta réplica: barrido de repartidores sin señal
+    (duración y conteos), ingesta de ubicaciones, índice, snapshot y
+    clientes en vivo. Solo supervisores.
+    """
+    try:
+        token_data = await verify_jwt_in_request(request)
+        user_role = token_data.get("role", "").upper()
+        
+        if user_role not in ["SUPERVISOR", "ADMIN"]:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo supervisores pueden consultar métricas")
+        
+        log_request(logger, "GET", "/metricas", 200, token_data.get("sub"))
+        return {
+            "barrido_sin_senal": {"umbral_segundos": REPARTIDOR_SIN_SENAL_SEGUNDOS, **metricas_barrido.obtener()},
+            "ubicaciones": {
+                "recibidas": buffer_ubicaciones.recibidas,
+                "coalescidas": buffer_ubicaciones.coalescidas,
+                "volcadas": buffer_ubicaciones.volcadas,
+                "pendientes": len(buffer_ubicaciones)
+            },
+            "indice_disponibles": len(indice_repartidores),
+            "snapshot": {"repartidores": len(snapshot_flota), "version": snapshot_flota.version},
+            "clientes_en_vivo": difusor.total_suscriptores()
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_request(logger, "GET", "/metricas", 500, None)
+        logger.error(f"Error obteniendo métricas: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error obteniendo métricas")
@@ -1,8 +1,14 @@
 """Esquemas de validación para FleetService"""
 from pydantic import BaseModel, Field, EmailStr
 from enum import Enum
-from typing import Optional
+from typing import Literal, Optional
 from datetime import datetime
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from shared.ids import ID_PATTERN
 
 
 class EstadoRepartidorEnum(str, Enum):
@@ -10,6 +16,7 @@ class EstadoRepartidorEnum(str, Enum):
     EN_RUTA = "EN_RUTA"
     MANTENIMIENTO = "MANTENIMIENTO"
     INACTIVO = "INACTIVO"
+    SIN_SENAL = "SIN_SENAL"
 
 
 class TipoVehiculoEnum(str, Enum):
@@ -24,6 +31,9 @@ class CreateRepartidorRequest(BaseModel):
     nombre: str = Field(..., min_length=2, max_length=255)
     email: EmailStr
     telefono: str = Field(..., min_length=7, max_length=20)
+    # Id del usuario REPARTIDOR en auth-service; se usa como id del repartidor
+    # para que sus pings de GPS se validen contra el `sub` de su token
+    usuario_id: Optional[str] = Field(None, pattern=ID_PATTERN)
     
     class Config:
         json_schema_extra = {
@@ -40,7 +50,6 @@ class UpdateRepartidorRequest(BaseModel):
     estado: Optional[EstadoRepartidorEnum] = None
     latitud: Optional[float] = None
     longitud: Optional[float] = None
-    calificacion_promedio: Optional[float] = Field(None, ge=0, le=5)
 
 
 class RepartidorResponse(BaseModel):
@@ -53,7 +62,8 @@ class RepartidorResponse(BaseModel):
     latitud: Optional[float]
     longitud: Optional[float]
     calificacion_promedio: float
-    entregas_completadas: str
+    calificaciones_total: int
+    entregas_completadas: int
     created_at: datetime
     is_active: bool
     
@@ -61,9 +71,159 @@ class RepartidorResponse(BaseModel):
         from_attributes = True
 
 
+class CalificacionRequest(BaseModel):
+    """Calificación de la entrega de un pedido (1 a 5 estrellas)"""
+    pedido_id: str = Field(..., pattern=ID_PATTERN)
+    calificacion: int = Field(..., ge=1, le=5)
+
+
+class CalificacionResponse(BaseModel):
+    """Promedio y número de calificaciones tras registrar una"""
+    repartidor_id: str
+    pedido_id: str
+    calificacion_promedio: float
+    calificaciones_total: int
+
+
+class EntregaCompletadaRequest(BaseModel):
+    """Pedido entregado por el repartidor"""
+    pedido_id: str = Field(..., pattern=ID_PATTERN)
+
+
+class EntregaCompletadaResponse(BaseModel):
+    """Entregas completadas tras registrar una"""
+    repartidor_id: str
+    pedido_id: str
+    entregas_completadas: int
+
+
+class RankingRepartidorResponse(BaseModel):
+    """Posición de un repartidor en el ranking"""
+    posicion: int
+    id: str
+    nombre: str
+    calificacion_promedio: float
+    calificaciones_total: int
+    entregas_completadas: int
+
+
+class UbicacionRepartidorRequest(BaseModel):
+    """Ping de GPS de un repartidor"""
+    repartidor_id: str = Field(..., pattern=ID_PATTERN)
+    latitud: float = Field(..., ge=-90, le=90)
+    longitud: float = Field(..., ge=-180, le=180)
+    timestamp: Optional[datetime] = None
+
+
+class LoteUbicacionesRequest(BaseModel):
+    """Lote de pings de GPS"""
+    ubicaciones: list[UbicacionRepartidorRequest] = Field(..., min_length=1, max_length=1000)
+
+
+class LoteUbicacionesResponse(BaseModel):
+    """Resultado de la ingesta de un lote de pings"""
+    recibidas: int
+    aceptadas: int
+
+
+class PuntoRecorridoResponse(BaseModel):
+    """Punto del historial de ubicaciones"""
+    latitud: float
+    longitud: float
+    timestamp: datetime
+
+
+class RecorridoRepartidorResponse(BaseModel):
+    """Recorrido de un repartidor en una ventana de tiempo"""
+    repartidor_id: str
+    desde: datetime
+    hasta: datetime
+    distancia_m: float
+    puntos: list[PuntoRecorridoResponse]
+
+
+class RepartidorCercanoResponse(BaseModel):
+    """Repartidor disponible y su distancia al punto consultado"""
+    repartidor: RepartidorResponse
+    distancia_m: float
+
+
+class ParadaRutaRequest(BaseModel):
+    """Parada a secuenciar (normalmente un pedido asignado)"""
+    id: str = Field(..., min_length=1, max_length=64)
+    latitud: float = Field(..., ge=-90, le=90)
+    longitud: float = Field(..., ge=-180, le=180)
+
+
+class RutaRequest(BaseModel):
+    """Paradas de un repartidor y origen opcional (por defecto su última ubicación)"""
+    paradas: list[ParadaRutaRequest] = Field(..., min_length=1, max_length=500)
+    origen_latitud: Optional[float] = Field(None, ge=-90, le=90)
+    origen_longitud: Optional[float] = Field(None, ge=-180, le=180)
+
+
+class ParadaRutaResponse(BaseModel):
+    """Parada en orden de visita"""
+    id: str
+    latitud: float
+    longitud: float
+    distancia_acumulada_m: float
+
+
+class RutaResponse(BaseModel):
+    """Secuencia de paradas y distancia estimada"""
+    repartidor_id: str
+    paradas: list[ParadaRutaResponse]
+    distancia_m: float
+    distancia_vecino_mas_cercano_m: float
+
+
+class PedidoDespachoRequest(BaseModel):
+    """Pedido de una oleada de despacho"""
+    id: str = Field(..., pattern=ID_PATTERN)
+    latitud: float = Field(..., ge=-90, le=90)
+    longitud: float = Field(..., ge=-180, le=180)
+    peso_kg: float = Field(0.0, ge=0)
+
+
+class DespachoRequest(BaseModel):
+    """Oleada de pedidos a asignar"""
+    pedidos: list[PedidoDespachoRequest] = Field(..., min_length=1, max_length=5000)
+    algoritmo: Optional[Literal["HUNGARO", "VORAZ"]] = None
+    radio_m: Optional[float] = Field(None, gt=0, le=50000)
+    max_pedidos_por_repartidor: Optional[int] = Field(None, ge=1, le=50)
+    repartidor_ids: Optional[list[str]] = Field(None, max_length=5000)
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "pedidos": [
+                    {"id": "550e8400-e29b-41d4-a716-446655440000", "latitud": 4.711, "longitud": -74.072, "peso_kg": 2.5}
+                ],
+                "algoritmo": "HUNGARO"
+            }
+        }
+
+
+class AsignacionDespachoResponse(BaseModel):
+    """Pedidos propuestos para un repartidor, en orden de visita"""
+    repartidor_id: str
+    pedidos: list[str]
+    peso_kg: float
+    distancia_m: float
+
+
+class DespachoResponse(BaseModel):
+    """Plan de despacho de una oleada"""
+    algoritmo: str
+    asignaciones: list[AsignacionDespachoResponse]
+    sin_asignar: list[str]
+    distancia_total_m: float
+
+
 class CreateVehiculoRequest(BaseModel):
     """Esquema para crear vehículo"""
-    repartidor_id: str
+    repartidor_id: str = Field(..., pattern=ID_PATTERN)
     placa: str = Field(..., min_length=1, max_length=20)
     tipo: TipoVehiculoEnum
     modelo: str = Field(..., min_length=1, max_length=100)
@@ -104,3 +264,8 @@ class VehiculoResponse(BaseModel):
     
     class Config:
         from_attributes = True
+
+
+class RepartidorConVehiculosResponse(RepartidorResponse):
+    """Repartidor con sus vehículos activos embebidos"""
+    vehiculos: list[VehiculoResponse]
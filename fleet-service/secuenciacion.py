@@ -0,0 +1,118 @@
+"""Secuenciación de paradas de un repartidor: vecino más cercano + 2-opt"""
+import hashlib
+import time
+import numpy as np
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fleet_service.despacho import matriz_distancias
+from shared.ttl_cache import TTLCache
+
+RUTA_MAX_ITERACIONES_2OPT = int(os.getenv("RUTA_MAX_ITERACIONES_2OPT", "1000"))
+RUTA_PRESUPUESTO_MS = int(os.getenv("RUTA_PRESUPUESTO_MS", "500"))
+# Las matrices entre paradas se reutilizan mientras el conjunto no cambie
+# (el repartidor re-planea tras cada entrega o desvío; solo cambia el origen)
+RUTA_MATRIZ_TTL_SEGUNDOS = int(os.getenv("RUTA_MATRIZ_TTL_SEGUNDOS", "3600"))
+DECIMALES_CLAVE = 5  # ~1 m
+
+cache_matrices = TTLCache(ttl_seconds=RUTA_MATRIZ_TTL_SEGUNDOS, max_entries=2_000)
+
+
+def matriz_paradas(latitudes: list, longitudes: list) -> np.ndarray:
+    """Distancias entre paradas, cacheadas por el conjunto ordenado de coordenadas"""
+    puntos = [(round(lat, DECIMALES_CLAVE), round(lon, DECIMALES_CLAVE)) for lat, lon in zip(latitudes, longitudes)]
+    orden = sorted(range(len(puntos)), key=puntos.__getitem__)
+    clave = hashlib.sha1(repr([puntos[i] for i in orden]).encode()).hexdigest()
+
+    canonica = cache_matrices.get(clave)
+    if canonica is None:
+        ordenados = np.asarray([puntos[i] for i in orden], dtype=np.float64)
+        canonica = matriz_distancias(ordenados[:, 0], ordenados[:, 1], ordenados[:, 0], ordenados[:, 1])
+        cache_matrices.set(clave, canonica)
+
+    # Reordenar filas y columnas al orden recibido
+    posicion = np.empty(len(orden), dtype=np.int64)
+    posicion[orden] = np.arange(len(orden))
+    return canonica[np.ix_(posicion, posicion)]
+
+
+def vecino_mas_cercano(distancias: np.ndarray) -> list:
+    """Recorrido abierto desde el nodo 0 visitando siempre el nodo libre más cercano"""
+    n = len(distancias)
+    visitado = np.zeros(n, dtype=bool)
+    recorrido = [0]
+    visitado[0] = True
+    for _ in range(n - 1):
+        fila = np.where(visitado, np.inf, distancias[recorrido[-1]])
+        siguiente = int(np.argmin(fila))
+        recorrido.append(siguiente)
+        visitado[siguiente] = True
+    return recorrido
+
+
+def longitud_recorrido(distancias: np.ndarray, recorrido: list) -> float:
+    indices = np.asarray(recorrido)
+    return float(distancias[indices[:-1], indices[1:]].sum())
+
+
+def dos_opt(distancias: np.ndarray, recorrido: list, max_iteraciones: int = RUTA_MAX_ITERACIONES_2OPT,
+            presupuesto_ms: int = RUTA_PRESUPUESTO_MS) -> list:
+    """
+    Mejora un recorrido abierto con el nodo 0 fijo invirtiendo tramos
+    [i, j] mientras alguna inversión lo acorte. Cada pasada evalúa todos
+    los j de un i a la vez con NumPy y aplica la mejor.
+    """
+    recorrido = np.asarray(recorrido)
+    n = len(recorrido)
+    limite = time.perf_counter() + presupuesto_ms / 1000
+    for _ in range(max_iteraciones):
+        mejorado = False
+        for i in range(1, n - 1):
+            a, b = recorrido[i - 1], recorrido[i]
+            c = recorrido[i + 1:]
+            # El último tramo no tiene sucesor: invertirlo solo cambia la arista de entrada
+            d = np.append(recorrido[i + 2:], -1)
+            salida_actual = np.where(d >= 0, distancias[c, np.maximum(d, 0)], 0.0)
+            salida_nueva = np.where(d >= 0, distancias[b, np.maximum(d, 0)], 0.0)
+            ganancia = distancias[a, b] + salida_actual - distancias[a, c] - salida_nueva
+            mejor = int(np.argmax(ganancia))
+            if ganancia[mejor] > 1e-9:
+                j = i + 1 + mejor
+                recorrido[i:j + 1] = recorrido[i:j + 1][::-1]
+                mejorado = True
+        if not mejorado or time.perf_counter() > limite:
+            break
+    return recorrido.tolist()
+
+
+def planear_ruta(origen: tuple, paradas: list) -> dict:
+    """
+    Ordena paradas [{id, latitud, longitud}] empezando en origen (latitud,
+    longitud). Devuelve la secuencia con distancia acumulada, la distancia
+    total y la del vecino más cercano sin mejorar, como referencia.
+    """
+    latitudes = [parada["latitud"] for parada in paradas]
+    longitudes = [parada["longitud"] for parada in paradas]
+    n = len(paradas)
+
+    # Nodo 0 = origen; la fila del origen cambia en cada consulta y no se cachea
+    distancias = np.empty((n + 1, n + 1))
+    distancias[1:, 1:] = matriz_paradas(latitudes, longitudes)
+    distancias[0, 1:] = matriz_distancias([origen[0]], [origen[1]], latitudes, longitudes)[0]
+    distancias[1:, 0] = distancias[0, 1:]
+    distancias[0, 0] = 0.0
+
+    inicial = vecino_mas_cercano(distancias)
+    recorrido = dos_opt(distancias, inicial)
+
+    secuencia, acumulada = [], 0.0
+    for anterior, nodo in zip(recorrido, recorrido[1:]):
+        acumulada += distancias[anterior, nodo]
+        secuencia.append({**paradas[nodo - 1], "distancia_acumulada_m": round(acumulada, 1)})
+    return {
+        "paradas": secuencia,
+        "distancia_m": round(acumulada, 1),
+        "distancia_vecino_mas_cercano_m": round(longitud_recorrido(distancias, inicial), 1)
+    }
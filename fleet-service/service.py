@@ -1,14 +1,23 @@
 """Servicios de negocio para FleetService"""
-import uuid
-from datetime import datetime
+from datetime import datetime, timezone
+import math
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 import sys
 import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from fleet_service.models import Repartidor, Vehiculo, EstadoRepartidorEnum
+from fleet_service.models import Repartidor, Vehiculo, EntregaRepartidor, EstadoRepartidorEnum
 from fleet_service.schemas import CreateRepartidorRequest, UpdateRepartidorRequest, CreateVehiculoRequest
+from fleet_service.indice_espacial import indice_repartidores, METROS_POR_GRADO
+from fleet_service.snapshot_flota import snapshot_flota
+from fleet_service.ubicaciones import buffer_ubicaciones, MAX_ADELANTO_RELOJ
+from fleet_service.historial_ubicaciones import agregar_puntos, obtener_recorrido
+from fleet_service.disponibilidad import barrer_sin_senal
+from fleet_service.secuenciacion import planear_ruta
+from shared.ids import new_id, require_id
 
 
 class FleetService:
@@ -21,8 +30,11 @@ class FleetService:
         if existing:
             raise ValueError("El email ya está registrado")
         
+        if repartidor_data.usuario_id and FleetService.obtener_repartidor(db, repartidor_data.usuario_id):
+            raise ValueError("El usuario ya tiene un repartidor")
+        
         repartidor = Repartidor(
-            id=str(uuid.uuid4()),
+            id=repartidor_data.usuario_id or new_id(),
             nombre=repartidor_data.nombre,
             email=repartidor_data.email,
             telefono=repartidor_data.telefono,
@@ -32,6 +44,7 @@ class FleetService:
         db.add(repartidor)
         db.commit()
         db.refresh(repartidor)
+        FleetService.sincronizar_memoria(repartidor)
         
         return repartidor
     
@@ -40,11 +53,41 @@ class FleetService:
         """Obtiene un repartidor por ID"""
         return db.query(Repartidor).filter(Repartidor.id == repartidor_id).first()
     
+    @staticmethod
+    def obtener_marca_repartidor(db: Session, repartidor_id: str):
+        """Obtiene solo updated_at de un repartidor para validar ETags"""
+        return db.query(Repartidor.updated_at).filter(Repartidor.id == repartidor_id).first()
+    
     @staticmethod
     def obtener_todos_repartidores(db: Session, skip: int = 0, limit: int = 10):
         """Obtiene todos los repartidores"""
         return db.query(Repartidor).filter(Repartidor.is_active == True).offset(skip).limit(limit).all()
     
+    @staticmethod
+    def obtener_vehiculos_por_repartidor(db: Session, repartidor_ids: list) -> dict:
+        """
+        Vehículos activos de varios repartidores en una sola consulta (IN),
+        agrupados por repartidor_id. Evita una consulta por repartidor al
+        armar listados con vehículos embebidos.
+        """
+        vehiculos = {repartidor_id: [] for repartidor_id in repartidor_ids}
+        if not repartidor_ids:
+            return vehiculos
+        for vehiculo in db.query(Vehiculo).filter(
+            Vehiculo.repartidor_id.in_(repartidor_ids),
+            Vehiculo.is_active == True
+        ).order_by(Vehiculo.repartidor_id, Vehiculo.created_at):
+            vehiculos[vehiculo.repartidor_id].append(vehiculo)
+        return vehiculos
+    
+    @staticmethod
+    def obtener_marca_vehiculos_repartidor(db: Session, repartidor_id: str) -> list:
+        """(id, updated_at) de los vehículos activos de un repartidor, para el ETag del detalle embebido"""
+        return db.query(Vehiculo.id, Vehiculo.updated_at).filter(
+            Vehiculo.repartidor_id == repartidor_id,
+            Vehiculo.is_active == True
+        ).order_by(Vehiculo.id).all()
+    
     @staticmethod
     def actualizar_repartidor(db: Session, repartidor_id: str, repartidor_data: UpdateRepartidorRequest) -> Repartidor:
         """Actualiza un repartidor con transacción ACID"""
@@ -61,11 +104,13 @@ class FleetService:
         if repartidor_data.longitud is not None:
             repartidor.longitud = repartidor_data.longitud
             repartidor.ultima_ubicacion = datetime.utcnow()
-        if repartidor_data.calificacion_promedio is not None:
-            repartidor.calificacion_promedio = repartidor_data.calificacion_promedio
+        if (repartidor_data.latitud is not None or repartidor_data.longitud is not None) \
+                and repartidor.latitud is not None and repartidor.longitud is not None:
+            agregar_puntos(db, [(repartidor.id, repartidor.latitud, repartidor.longitud, repartidor.ultima_ubicacion)])
         
         db.commit()
         db.refresh(repartidor)
+        FleetService.sincronizar_memoria(repartidor)
         
         return repartidor
     
@@ -82,9 +127,253 @@ class FleetService:
         
         db.commit()
         db.refresh(repartidor)
+        FleetService.sincronizar_memoria(repartidor)
         
         return repartidor
     
+    @staticmethod
+    def registrar_entrega_completada(db: Session, repartidor_id: str, pedido_id: str):
+        """
+        Registra la entrega del pedido e incrementa entregas_completadas en la
+        BD (x = x + 1), en una transacción. Un pedido ya registrado no vuelve
+        a contar (ValueError). Devuelve None si el repartidor no existe.
+        """
+        fila = db.execute(update(Repartidor).where(Repartidor.id == repartidor_id).values(
+            entregas_completadas=Repartidor.entregas_completadas + 1
+        ).returning(Repartidor.id, Repartidor.entregas_completadas)).first()
+        if not fila:
+            db.rollback()
+            return None
+        
+        registrada = db.execute(
+            insert(EntregaRepartidor).values(pedido_id=pedido_id, repartidor_id=repartidor_id)
+            .on_conflict_do_nothing(index_elements=[EntregaRepartidor.pedido_id])
+            .returning(EntregaRepartidor.pedido_id)
+        ).first()
+        if not registrada:
+            db.rollback()
+            raise ValueError("La entrega del pedido ya fue registrada")
+        
+        db.commit()
+        return fila
+    
+    @staticmethod
+    def registrar_calificacion(db: Session, repartidor_id: str, pedido_id: str, calificacion: int, usuario_id: str):
+        """
+        Califica la entrega de un pedido y suma la calificación al promedio.
+        Solo se califica un pedido registrado como entregado por este
+        repartidor y aún sin calificar; el UPDATE condicionado sobre la
+        entrega lo garantiza también con solicitudes concurrentes. El promedio
+        se actualiza en un solo UPDATE atómico: Postgres evalúa el SET con los
+        valores previos de la fila, así que promedio y contador avanzan juntos
+        sin releer el historial. Devuelve None si el repartidor no existe.
+        """
+        usuario_id = require_id(usuario_id, "calificado_por")
+        calificada = db.execute(update(EntregaRepartidor).where(
+            EntregaRepartidor.pedido_id == pedido_id,
+            EntregaRepartidor.repartidor_id == repartidor_id,
+            EntregaRepartidor.calificacion.is_(None)
+        ).values(
+            calificacion=calificacion, calificado_por=usuario_id, calificado_at=func.now()
+        ).returning(EntregaRepartidor.pedido_id)).first()
+        if not calificada:
+            db.rollback()
+            if not FleetService.obtener_repartidor(db, repartidor_id):
+                return None
+            raise ValueError("El pedido no tiene una entrega registrada de este repartidor o ya fue calificado")
+        
+        fila = db.execute(update(Repartidor).where(Repartidor.id == repartidor_id).values(
+            calificacion_promedio=(
+                Repartidor.calificacion_promedio * Repartidor.calificaciones_total + calificacion
+            ) / (Repartidor.calificaciones_total + 1),
+            calificaciones_total=Repartidor.calificaciones_total + 1
+        ).returning(Repartidor.id, Repartidor.calificacion_promedio, Repartidor.calificaciones_total)).first()
+        db.commit()
+        return fila
+    
+    @staticmethod
+    def obtener_ranking(db: Session, criterio: str, limite: int, min_calificaciones: int = 1) -> list:
+        """
+        Mejores repartidores activos por calificación o por entregas. El ORDER BY
+        coincide con los índices parciales ix_repartidores_ranking_*: la consulta
+        lee las primeras filas del índice en vez de ordenar la tabla.
+        """
+        query = db.query(
+            Repartidor.id, Repartidor.nombre, Repartidor.calificacion_promedio,
+            Repartidor.calificaciones_total, Repartidor.entregas_completadas
+        ).filter(Repartidor.is_active == True)
+        
+        if criterio == "calificacion":
+            # Sin un mínimo de calificaciones encabezarían los nuevos con el 5.0 inicial
+            query = query.filter(Repartidor.calificaciones_total >= min_calificaciones).order_by(
+                Repartidor.calificacion_promedio.desc(), Repartidor.calificaciones_total.desc()
+            )
+        elif criterio == "entregas":
+            query = query.order_by(Repartidor.entregas_completadas.desc())
+        else:
+            raise ValueError("Criterio inválido; use calificacion o entregas")
+        
+        return [
+            {"posicion": posicion, **fila._asdict()}
+            for posicion, fila in enumerate(query.limit(limite).all(), start=1)
+        ]
+    
+    @staticmethod
+    def sincronizar_memoria(repartidor: Repartidor):
+        """Refleja el repartidor en el índice espacial y en el snapshot de la flota"""
+        if (repartidor.is_active and repartidor.estado == EstadoRepartidorEnum.DISPONIBLE
+                and repartidor.latitud is not None and repartidor.longitud is not None):
+            indice_repartidores.actualizar(repartidor.id, repartidor.latitud, repartidor.longitud, repartidor.ultima_ubicacion)
+        else:
+            indice_repartidores.eliminar(repartidor.id)
+        
+        if repartidor.is_active:
+            snapshot_flota.actualizar(
+                repartidor.id, EstadoRepartidorEnum(repartidor.estado).value,
+                repartidor.latitud, repartidor.longitud, repartidor.ultima_ubicacion
+            )
+        else:
+            snapshot_flota.eliminar(repartidor.id)
+    
+    @staticmethod
+    def cargar_indice(db: Session) -> int:
+        """
+        Recarga desde la BD el snapshot de repartidores activos y el índice
+        espacial (los DISPONIBLE con ubicación). Devuelve el tamaño del índice.
+        """
+        filas = db.query(
+            Repartidor.id, Repartidor.estado, Repartidor.latitud, Repartidor.longitud, Repartidor.ultima_ubicacion
+        ).filter(Repartidor.is_active == True).all()
+        
+        snapshot_flota.reemplazar(
+            (fila.id, EstadoRepartidorEnum(fila.estado).value, fila.latitud, fila.longitud, fila.ultima_ubicacion)
+            for fila in filas
+        )
+        disponibles = [
+            (fila.id, fila.latitud, fila.longitud, fila.ultima_ubicacion) for fila in filas
+            if fila.estado == EstadoRepartidorEnum.DISPONIBLE and fila.latitud is not None and fila.longitud is not None
+        ]
+        indice_repartidores.reemplazar(disponibles)
+        return len(disponibles)
+    
+    @staticmethod
+    def conciliar_disponibilidad(db: Session) -> list:
+        """
+        Pasa a SIN_SENAL los DISPONIBLE sin ubicación reciente (y de vuelta a
+        DISPONIBLE los que volvieron a reportar) y refleja los cambios en el
+        índice y el snapshot de esta réplica; las demás los toman en su resync.
+        """
+        cambiados = barrer_sin_senal(db)
+        for fila in cambiados:
+            FleetService.sincronizar_memoria(fila)
+        return cambiados
+    
+    @staticmethod
+    def obtener_recorrido(db: Session, repartidor_id: str, desde: datetime, hasta: datetime) -> dict:
+        """Recorrido del repartidor en [desde, hasta) desde el historial de ubicaciones"""
+        return obtener_recorrido(db, repartidor_id, desde, hasta)
+    
+    @staticmethod
+    def registrar_ubicaciones(ubicaciones: list) -> int:
+        """
+        Encola pings de GPS sin tocar la BD; job_ubicaciones los escribe en lote.
+        El índice espacial y el snapshot se mueven de inmediato para que las
+        búsquedas de cercanos y el mapa no esperen al volcado. Devuelve cuántos pings se aceptaron.
+        """
+        aceptadas = 0
+        for ubicacion in ubicaciones:
+            ahora = datetime.now(timezone.utc)
+            instante = ubicacion.timestamp or ahora
+            if instante.tzinfo is None:
+                instante = instante.replace(tzinfo=timezone.utc)
+            # Mismo tope que el buffer: un reloj adelantado no congela la posición en memoria
+            instante = min(instante, ahora + MAX_ADELANTO_RELOJ)
+            if buffer_ubicaciones.registrar(ubicacion.repartidor_id, ubicacion.latitud, ubicacion.longitud, instante):
+                # El buffer solo compara con lo pendiente; índice y snapshot descartan pings más viejos que su posición
+                indice_repartidores.mover(ubicacion.repartidor_id, ubicacion.latitud, ubicacion.longitud, instante)
+                snapshot_flota.mover(ubicacion.repartidor_id, ubicacion.latitud, ubicacion.longitud, instante)
+                aceptadas += 1
+        return aceptadas
+    
+    @staticmethod
+    def obtener_repartidores_cercanos(db: Session, latitud: float, longitud: float, k: int, radio_m: float) -> list:
+        """
+        Los k repartidores disponibles más cercanos dentro de radio_m metros,
+        [(repartidor, distancia_m)] de menor a mayor distancia. El índice elige
+        los candidatos; la BD confirma que siguen disponibles (otra réplica
+        puede haberlos cambiado desde la última sincronización).
+        """
+        candidatos = indice_repartidores.cercanos(latitud, longitud, k, radio_m)
+        if not candidatos:
+            return []
+        
+        repartidores = {
+            repartidor.id: repartidor
+            for repartidor in db.query(Repartidor).filter(
+                Repartidor.id.in_([repartidor_id for repartidor_id, _ in candidatos]),
+                Repartidor.is_active == True,
+                Repartidor.estado == EstadoRepartidorEnum.DISPONIBLE
+            ).all()
+        }
+        return [
+            (repartidores[repartidor_id], distancia)
+            for repartidor_id, distancia in candidatos if repartidor_id in repartidores
+        ]
+    
+    @staticmethod
+    def planear_ruta_repartidor(repartidor: Repartidor, paradas: list,
+                                origen_latitud: float = None, origen_longitud: float = None) -> dict:
+        """Ordena las paradas del repartidor desde el origen dado o su última ubicación"""
+        if origen_latitud is None or origen_longitud is None:
+            origen_latitud, origen_longitud = repartidor.latitud, repartidor.longitud
+        if origen_latitud is None or origen_longitud is None:
+            raise ValueError("El repartidor no tiene ubicación; indique origen_latitud y origen_longitud")
+        
+        ids = [parada.id for parada in paradas]
+        if len(set(ids)) != len(ids):
+            raise ValueError("Hay paradas con id repetido")
+        
+        ruta = planear_ruta((origen_latitud, origen_longitud), [parada.model_dump() for parada in paradas])
+        return {"repartidor_id": repartidor.id, **ruta}
+    
+    @staticmethod
+    def obtener_candidatos_despacho(db: Session, pedidos: list, radio_m: float, repartidor_ids: list = None) -> dict:
+        """
+        Repartidores DISPONIBLE con ubicación y vehículo activo cerca de la
+        oleada, en columnas para resolver_despacho. La capacidad es la del
+        vehículo activo más grande del repartidor.
+        """
+        ids = [pedido.id for pedido in pedidos]
+        if len(set(ids)) != len(ids):
+            raise ValueError("Hay pedidos con id repetido")
+        
+        latitudes = [pedido.latitud for pedido in pedidos]
+        longitudes = [pedido.longitud for pedido in pedidos]
+        # Rectángulo de la oleada ampliado en radio_m
+        margen_latitud = radio_m / METROS_POR_GRADO
+        margen_longitud = radio_m / (METROS_POR_GRADO * max(math.cos(math.radians(max(map(abs, latitudes)))), 0.01))
+        
+        consulta = db.query(
+            Repartidor.id, Repartidor.latitud, Repartidor.longitud, func.max(Vehiculo.capacidad_kg)
+        ).join(Vehiculo, Vehiculo.repartidor_id == Repartidor.id).filter(
+            Repartidor.is_active == True,
+            Repartidor.estado == EstadoRepartidorEnum.DISPONIBLE,
+            Repartidor.latitud.between(min(latitudes) - margen_latitud, max(latitudes) + margen_latitud),
+            Repartidor.longitud.between(min(longitudes) - margen_longitud, max(longitudes) + margen_longitud),
+            Vehiculo.is_active == True,
+            Vehiculo.estado.notin_([EstadoRepartidorEnum.MANTENIMIENTO, EstadoRepartidorEnum.INACTIVO])
+        )
+        if repartidor_ids:
+            consulta = consulta.filter(Repartidor.id.in_(repartidor_ids))
+        filas = consulta.group_by(Repartidor.id, Repartidor.latitud, Repartidor.longitud).order_by(Repartidor.id).all()
+        
+        return {
+            "ids": [fila[0] for fila in filas],
+            "latitudes": [fila[1] for fila in filas],
+            "longitudes": [fila[2] for fila in filas],
+            "capacidades_kg": [fila[3] for fila in filas]
+        }
+    
     @staticmethod
     def crear_vehiculo(db: Session, vehiculo_data: CreateVehiculoRequest) -> Vehiculo:
         """Crea un nuevo vehículo"""
@@ -99,7 +388,7 @@ class FleetService:
             raise ValueError("La placa ya está registrada")
         
         vehiculo = Vehiculo(
-            id=str(uuid.uuid4()),
+            id=new_id(),
             repartidor_id=vehiculo_data.repartidor_id,
             placa=vehiculo_data.placa,
             tipo=vehiculo_data.tipo,
@@ -121,6 +410,11 @@ class FleetService:
         """Obtiene un vehículo por ID"""
         return db.query(Vehiculo).filter(Vehiculo.id == vehiculo_id).first()
     
+    @staticmethod
+    def obtener_marca_vehiculo(db: Session, vehiculo_id: str):
+        """Obtiene solo updated_at de un vehículo para validar ETags"""
+        return db.query(Vehiculo.updated_at).filter(Vehiculo.id == vehiculo_id).first()
+    
     @staticmethod
     def obtener_vehiculos_repartidor(db: Session, repartidor_id: str):
         """Obtiene todos los vehículos de un repartidor"""
@@ -0,0 +1,172 @@
+"""Snapshot columnar en memoria de la flota activa, con deltas por versión"""
+from bisect import bisect_right
+from datetime import datetime, timezone
+import threading
+import uuid
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Cambios recordados para responder deltas; un cliente más atrasado recibe el snapshot completo
+SNAPSHOT_MAX_CAMBIOS = int(os.getenv("SNAPSHOT_FLOTA_MAX_CAMBIOS", "100000"))
+
+
+def _epoch(instante: datetime):
+    """
+    Segundos Unix con fracción; un datetime sin zona se toma como UTC. La
+    fracción ordena pings del mismo segundo; hacia afuera se publica entero.
+    """
+    if instante is None:
+        return None
+    if instante.tzinfo is None:
+        instante = instante.replace(tzinfo=timezone.utc)
+    return instante.timestamp()
+
+
+def segundos(epoch):
+    """Timestamp publicado a los clientes: segundos Unix enteros"""
+    return None if epoch is None else int(epoch)
+
+
+class SnapshotFlota:
+    """
+    Estado, posición y hora de la última ubicación de cada repartidor activo.
+    Cada cambio incrementa la versión global y queda en un registro ordenado
+    (versión, id) del que salen los deltas. La época identifica esta copia en
+    memoria: una versión de otra réplica o de antes de un reinicio no sirve
+    como base de un delta.
+    """
+
+    def __init__(self, max_cambios: int = SNAPSHOT_MAX_CAMBIOS):
+        self.epoca = uuid.uuid4().hex[:12]
+        self.max_cambios = max_cambios
+        self.version = 0
+        self._repartidores: dict[str, tuple] = {}  # id -> (estado, latitud, longitud, timestamp)
+        self._versiones: list[int] = []
+        self._ids: list[str] = []
+        self._completo = None  # (versión, snapshot) del último snapshot completo armado
+        self._observadores = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._repartidores)
+
+    def observar(self, observador):
+        """
+        Registra observador(repartidor_id, fila) para cada cambio; fila es
+        (estado, latitud, longitud, timestamp) o None si el repartidor salió.
+        Se invoca con el lock tomado: debe ser rápido y no bloquear.
+        """
+        self._observadores.append(observador)
+
+    def _notificar(self, repartidor_id: str, fila):
+        for observador in self._observadores:
+            observador(repartidor_id, fila)
+
+    def _registrar(self, repartidor_id: str):
+        self.version += 1
+        self._versiones.append(self.version)
+        self._ids.append(repartidor_id)
+        if len(self._versiones) > 2 * self.max_cambios:
+            del self._versiones[:-self.max_cambios]
+            del self._ids[:-self.max_cambios]
+
+    def _poner(self, repartidor_id: str, fila: tuple):
+        if self._repartidores.get(repartidor_id) != fila:
+            self._repartidores[repartidor_id] = fila
+            self._registrar(repartidor_id)
+            self._notificar(repartidor_id, fila)
+
+    def _quitar(self, repartidor_id: str):
+        if self._repartidores.pop(repartidor_id, None) is not None:
+            self._registrar(repartidor_id)
+            self._notificar(repartidor_id, None)
+
+    def actualizar(self, repartidor_id: str, estado: str, latitud: float, longitud: float, instante: datetime):
+        """Inserta o reemplaza un repartidor activo"""
+        with self._lock:
+            self._poner(repartidor_id, (estado, latitud, longitud, _epoch(instante)))
+
+    def mover(self, repartidor_id: str, latitud: float, longitud: float, instante: datetime):
+        """
+        Actualiza la posición de un repartidor ya presente. Un ping no más
+        nuevo que la posición guardada (llegó tarde, quizá después de que su
+        sucesor se volcó y el buffer lo olvidó) se ignora.
+        """
+        nuevo = _epoch(instante)
+        with self._lock:
+            actual = self._repartidores.get(repartidor_id)
+            if actual is None:
+                return
+            if nuevo is not None and actual[3] is not None and actual[3] >= nuevo:
+                return
+            self._poner(repartidor_id, (actual[0], latitud, longitud, nuevo))
+
+    def eliminar(self, repartidor_id: str):
+        with self._lock:
+            self._quitar(repartidor_id)
+
+    def reemplazar(self, repartidores):
+        """
+        Sincroniza con la BD desde [(id, estado, latitud, longitud, ultima_ubicacion)].
+        Solo versiona lo que cambió; una posición en memoria más nueva que la
+        de la BD (ping aún sin volcar) se conserva.
+        """
+        with self._lock:
+            vistos = set()
+            for repartidor_id, estado, latitud, longitud, instante in repartidores:
+                vistos.add(repartidor_id)
+                fila = (estado, latitud, longitud, _epoch(instante))
+                actual = self._repartidores.get(repartidor_id)
+                if actual is not None and actual[3] is not None and (fila[3] is None or actual[3] > fila[3]):
+                    fila = (estado, actual[1], actual[2], actual[3])
+                self._poner(repartidor_id, fila)
+            for repartidor_id in [r for r in self._repartidores if r not in vistos]:
+                self._quitar(repartidor_id)
+
+    def filas(self) -> list:
+        """Copia de [(id, (estado, latitud, longitud, timestamp))]"""
+        with self._lock:
+            return list(self._repartidores.items())
+
+    @staticmethod
+    def _columnas(filas: list) -> dict:
+        return {
+            "ids": [repartidor_id for repartidor_id, _ in filas],
+            "estados": [fila[0] for _, fila in filas],
+            "latitudes": [fila[1] for _, fila in filas],
+            "longitudes": [fila[2] for _, fila in filas],
+            "timestamps": [segundos(fila[3]) for _, fila in filas],
+        }
+
+    def obtener(self, desde: int = None, epoca: str = None) -> dict:
+        """
+        Snapshot en columnas paralelas. Con `desde` (y la época con la que se
+        obtuvo) devuelve solo los repartidores cambiados desde esa versión y
+        los ids que dejaron de estar activos. `completo` indica si el cliente
+        debe descartar su copia.
+        """
+        with self._lock:
+            base = {"epoca": self.epoca, "version": self.version}
+            # Las versiones son consecutivas: el delta existe si el registro empieza en desde + 1 o antes
+            delta_posible = (
+                desde is not None and epoca == self.epoca and desde <= self.version
+                and (not self._versiones or desde + 1 >= self._versiones[0])
+            )
+            if delta_posible:
+                cambiados = dict.fromkeys(self._ids[bisect_right(self._versiones, desde):])
+                filas = [(r, self._repartidores[r]) for r in cambiados if r in self._repartidores]
+                return {
+                    **base, "completo": False, **self._columnas(filas),
+                    "eliminados": [r for r in cambiados if r not in self._repartidores]
+                }
+
+            if self._completo is None or self._completo[0] != self.version:
+                self._completo = (self.version, {
+                    **base, "completo": True, **self._columnas(list(self._repartidores.items())), "eliminados": []
+                })
+            return self._completo[1]
+
+
+snapshot_flota = SnapshotFlota()
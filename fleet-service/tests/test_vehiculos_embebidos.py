@@ -0,0 +1,121 @@
+"""
+Listado y detalle de repartidores con vehículos embebidos: número de
+sentencias por petición, medido a través de las rutas.
+
+Usa SQLite en memoria con solo las tablas repartidores y vehiculos; la
+verificación del JWT se reemplaza por un token fijo de supervisor.
+
+Uso:
+    python -m pytest fleet-service/tests -q
+"""
+import importlib.util
+import os
+import sys
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, RAIZ)
+
+# En el repo el servicio vive en fleet-service/; se registra como paquete fleet_service
+if "fleet_service" not in sys.modules:
+    _spec = importlib.util.spec_from_file_location(
+        "fleet_service", os.path.join(RAIZ, "fleet-service", "__init__.py"),
+        submodule_search_locations=[os.path.join(RAIZ, "fleet-service")]
+    )
+    sys.modules["fleet_service"] = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(sys.modules["fleet_service"])
+
+from fleet_service import routes
+from fleet_service.models import Base, Repartidor, Vehiculo, TipoVehiculoEnum
+from shared.database import get_db
+from shared.ids import new_id
+
+REPARTIDORES = 25
+VEHICULOS_POR_REPARTIDOR = 3
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[Repartidor.__table__, Vehiculo.__table__])
+    sesion = sessionmaker(bind=engine)()
+
+    for i in range(REPARTIDORES):
+        repartidor_id = new_id()
+        sesion.add(Repartidor(id=repartidor_id, nombre=f"R{i}", email=f"r{i}@example.com", telefono="+573001234567"))
+        for k in range(VEHICULOS_POR_REPARTIDOR):
+            sesion.add(Vehiculo(
+                id=new_id(), repartidor_id=repartidor_id, placa=f"P{i:02d}{k}", tipo=TipoVehiculoEnum.MOTO,
+                modelo="X", marca="Y", anio="2020", capacidad_kg=50,
+                # Un vehículo dado de baja por repartidor: no debe embeberse
+                is_active=k > 0
+            ))
+    sesion.commit()
+    sesion.expunge_all()
+
+    yield sesion
+    sesion.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def cliente(db, monkeypatch):
+    async def token_supervisor(request):
+        return {"sub": new_id(), "role": "SUPERVISOR"}
+
+    monkeypatch.setattr(routes, "verify_jwt_in_request", token_supervisor)
+    app = FastAPI()
+    app.include_router(routes.router, prefix="/api/fleet")
+    app.dependency_overrides[get_db] = lambda: db
+    return TestClient(app)
+
+
+@pytest.fixture
+def sentencias(db):
+    registradas = []
+
+    def contar(conn, cursor, statement, parameters, context, executemany):
+        registradas.append(statement)
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", contar)
+    yield registradas
+    event.remove(engine, "before_cursor_execute", contar)
+
+
+@pytest.mark.parametrize("limite", [5, 20])
+def test_pagina_con_vehiculos_en_dos_sentencias(cliente, sentencias, limite):
+    respuesta = cliente.get(f"/api/fleet/repartidores?limit={limite}&incluir_vehiculos=true")
+
+    assert respuesta.status_code == 200
+    assert len(sentencias) == 2, sentencias
+    repartidores = respuesta.json()
+    assert len(repartidores) == limite
+    for repartidor in repartidores:
+        assert len(repartidor["vehiculos"]) == VEHICULOS_POR_REPARTIDOR - 1
+        assert all(v["is_active"] and v["repartidor_id"] == repartidor["id"] for v in repartidor["vehiculos"])
+
+
+def test_detalle_con_vehiculos_en_dos_sentencias(cliente, sentencias, db):
+    repartidor_id = db.query(Repartidor.id).first().id
+    sentencias.clear()
+
+    respuesta = cliente.get(f"/api/fleet/repartidores/{repartidor_id}?incluir_vehiculos=true")
+
+    assert respuesta.status_code == 200
+    assert len(sentencias) == 2, sentencias
+    assert len(respuesta.json()["vehiculos"]) == VEHICULOS_POR_REPARTIDOR - 1
+
+
+def test_pagina_vacia_sin_consulta_de_vehiculos(cliente, sentencias):
+    respuesta = cliente.get(f"/api/fleet/repartidores?skip={REPARTIDORES}&incluir_vehiculos=true")
+
+    assert respuesta.status_code == 200
+    assert respuesta.json() == []
+    assert len(sentencias) == 1, sentencias
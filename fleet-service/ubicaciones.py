@@ -0,0 +1,119 @@
+"""Ingesta de ubicaciones GPS con escritura agrupada"""
+from datetime import datetime, timezone, timedelta
+import threading
+from sqlalchemy import DateTime, Float, column, or_, update, values
+from sqlalchemy.orm import Session
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fleet_service.models import Repartidor
+from fleet_service.historial_ubicaciones import agregar_puntos
+from shared.ids import UUIDStr
+
+UBICACIONES_INTERVALO_SEGUNDOS = int(os.getenv("UBICACIONES_INTERVALO_SEGUNDOS", "2"))
+# Tolerancia para relojes de dispositivos adelantados
+MAX_ADELANTO_RELOJ = timedelta(seconds=60)
+
+
+class BufferUbicaciones:
+    """
+    Última ubicación conocida por repartidor, pendiente de escribir.
+    Los pings que llegan entre dos volcados se sobrescriben en memoria;
+    solo el más reciente de cada repartidor llega a la BD.
+    """
+
+    def __init__(self):
+        self._pendientes: dict[str, tuple[float, float, datetime]] = {}
+        self._lock = threading.Lock()
+        # Métricas acumuladas: pings recibidos, pings absorbidos por uno más reciente, filas escritas
+        self.recibidas = 0
+        self.coalescidas = 0
+        self.volcadas = 0
+
+    def registrar(self, repartidor_id: str, latitud: float, longitud: float, instante: datetime = None) -> bool:
+        """Guarda el ping si es el más reciente del repartidor; devuelve False si llegó tarde"""
+        ahora = datetime.now(timezone.utc)
+        if instante is None:
+            instante = ahora
+        elif instante.tzinfo is None:
+            instante = instante.replace(tzinfo=timezone.utc)
+        instante = min(instante, ahora + MAX_ADELANTO_RELOJ)
+
+        with self._lock:
+            self.recibidas += 1
+            actual = self._pendientes.get(repartidor_id)
+            # Los pings pueden llegar desordenados; gana el más reciente
+            if actual is not None:
+                self.coalescidas += 1
+                if actual[2] >= instante:
+                    return False
+            self._pendientes[repartidor_id] = (latitud, longitud, instante)
+            return True
+
+    def extraer(self) -> dict:
+        """Entrega las ubicaciones pendientes y deja el buffer vacío"""
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+        return pendientes
+
+    def devolver(self, pendientes: dict):
+        """Reincorpora un lote que no se pudo escribir, sin pisar pings más nuevos"""
+        with self._lock:
+            for repartidor_id, ubicacion in pendientes.items():
+                actual = self._pendientes.get(repartidor_id)
+                if actual is None or actual[2] < ubicacion[2]:
+                    self._pendientes[repartidor_id] = ubicacion
+
+    def __len__(self):
+        return len(self._pendientes)
+
+
+buffer_ubicaciones = BufferUbicaciones()
+
+
+def volcar_ubicaciones(db: Session, buffer: BufferUbicaciones = buffer_ubicaciones) -> int:
+    """
+    Escribe las ubicaciones pendientes con un único UPDATE ... FROM (VALUES ...).
+    Una fila con ultima_ubicacion más reciente en la BD no se sobrescribe.
+    Las filas actualizadas se agregan al historial en la misma transacción.
+    Si la escritura falla, el lote vuelve al buffer para el siguiente intervalo.
+    """
+    pendientes = buffer.extraer()
+    if not pendientes:
+        return 0
+
+    datos = values(
+        column("id", UUIDStr()),
+        column("latitud", Float),
+        column("longitud", Float),
+        column("instante", DateTime(timezone=True)),
+        name="datos"
+    ).data([
+        (repartidor_id, latitud, longitud, instante)
+        for repartidor_id, (latitud, longitud, instante) in pendientes.items()
+    ])
+
+    stmt = update(Repartidor).where(
+        Repartidor.id == datos.c.id,
+        or_(Repartidor.ultima_ubicacion.is_(None), Repartidor.ultima_ubicacion < datos.c.instante)
+    ).values(
+        latitud=datos.c.latitud,
+        longitud=datos.c.longitud,
+        ultima_ubicacion=datos.c.instante
+    ).returning(
+        Repartidor.id, Repartidor.latitud, Repartidor.longitud, Repartidor.ultima_ubicacion
+    ).execution_options(synchronize_session=False)
+
+    try:
+        actualizadas = db.execute(stmt).all()
+        agregar_puntos(db, actualizadas)
+        db.commit()
+    except Exception:
+        db.rollback()
+        buffer.devolver(pendientes)
+        raise
+
+    buffer.volcadas += len(actualizadas)
+    return len(actualizadas)
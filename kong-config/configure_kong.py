@@ -97,6 +97,8 @@ class KongConfigurator:
         self.create_service("pedido-service", "http://pedido-service:8000", ["pedidos"])
         self.create_service("fleet-service", "http://fleet-service:8000", ["fleet"])
         self.create_service("billing-service", "http://billing-service:8000", ["billing"])
+        # Seguimiento público de pedidos: mismo upstream, servicio aparte para no aplicar JWT
+        self.create_service("pedido-seguimiento", "http://pedido-service:8000", ["pedidos", "publico"])
         
         print("\n=== CREANDO RUTAS - AUTH ===")
         # Ruta base para todo el prefijo /api/auth (login, register, me, etc.)
@@ -118,6 +120,8 @@ class KongConfigurator:
         self.create_route("pedido-service", "pedidos-detail", ["/api/pedidos"], ["GET"], strip_path=False)
         self.create_route("pedido-service", "pedidos-update", ["/api/pedidos"], ["PATCH"], strip_path=False)
         self.create_route("pedido-service", "pedidos-cancel", ["/api/pedidos"], ["DELETE"], strip_path=False)
+        # Prefijo más largo: Kong lo prioriza sobre /api/pedidos
+        self.create_route("pedido-seguimiento", "pedidos-seguimiento", ["/api/pedidos/seguimiento"], ["GET"], strip_path=False)
         
         print("\n=== CREANDO RUTAS - FLEET ===")
         # Ruta base para todo el prefijo /api/fleet
@@ -146,7 +150,14 @@ class KongConfigurator:
             "policy": "local"
         })
         
-        # JWT para rutas protegidas (NO en auth-service)
+        # Rate limiting por IP para el seguimiento público
+        self.create_plugin("rate-limiting", "pedido-seguimiento", {
+            "minute": 60,
+            "policy": "local",
+            "limit_by": "ip"
+        })
+        
+        # JWT para rutas protegidas (NO en auth-service ni pedido-seguimiento)
         self.create_plugin("jwt", "pedido-service", {
             "key_claim_name": "sub",
             "secret_is_base64": False
@@ -0,0 +1,70 @@
+"""Archivo de pedidos finalizados (particionado hot/cold)"""
+from datetime import datetime, timedelta
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pedido_service.models import Pedido, PedidoArchivado, EstadoPedidoEnum
+
+
+ARCHIVO_DIAS = int(os.getenv("PEDIDOS_ARCHIVO_DIAS", "90"))
+ARCHIVO_LOTE = int(os.getenv("PEDIDOS_ARCHIVO_LOTE", "1000"))
+ARCHIVO_INTERVALO_SEGUNDOS = int(os.getenv("PEDIDOS_ARCHIVO_INTERVALO_SEGUNDOS", "3600"))
+
+ESTADOS_FINALES = [EstadoPedidoEnum.ENTREGADO, EstadoPedidoEnum.CANCELADO]
+
+
+def archivar_lote(db: Session, limite: datetime, lote: int = ARCHIVO_LOTE) -> int:
+    """
+    Mueve hasta `lote` pedidos finalizados antes de `limite` a pedidos_archivados
+    en una sola sentencia (DELETE ... RETURNING dentro de un INSERT ... SELECT).
+    SKIP LOCKED evita esperar filas que otra transacción está modificando.
+    """
+    activa = Pedido.__table__
+    archivo = PedidoArchivado.__table__
+    # Columnas comunes; las propias de la tabla activa (p. ej. busqueda) no se archivan
+    columnas = [columna.name for columna in activa.columns if columna.name in archivo.c]
+    
+    candidatos = select(activa.c.id).where(
+        activa.c.estado.in_(ESTADOS_FINALES),
+        activa.c.updated_at < limite
+    ).order_by(activa.c.updated_at).limit(lote).with_for_update(skip_locked=True)
+    
+    movidos = delete(activa).where(activa.c.id.in_(candidatos.scalar_subquery())).returning(
+        *[activa.c[nombre] for nombre in columnas]
+    ).cte("movidos")
+    
+    stmt = insert(archivo).from_select(
+        columnas, select(*[movidos.c[nombre] for nombre in columnas])
+    )
+    
+    resultado = db.execute(stmt)
+    db.commit()
+    
+    return resultado.rowcount
+
+
+def archivar_pedidos(db: Session, dias: int = ARCHIVO_DIAS, lote: int = ARCHIVO_LOTE) -> int:
+    """Archiva por lotes todos los pedidos finalizados hace más de `dias` días"""
+    limite = datetime.utcnow() - timedelta(days=dias)
+    total = 0
+    
+    while True:
+        movidos = archivar_lote(db, limite, lote)
+        total += movidos
+        if movidos < lote:
+            return total
+
+
+if __name__ == "__main__":
+    # Ejecución manual o desde cron: python -m pedido_service.archivo
+    from shared.database import SessionLocal
+    
+    db = SessionLocal()
+    try:
+        print(f"Pedidos archivados: {archivar_pedidos(db)}")
+    finally:
+        db.close()
@@ -0,0 +1,89 @@
+"""Búsqueda de pedidos por destinatario, teléfono o dirección"""
+from difflib import SequenceMatcher
+import re
+from sqlalchemy import func, literal, or_
+from sqlalchemy.orm import Session
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pedido_service.models import Pedido
+from pedido_service.duplicados import normalizar_texto
+
+# Mínimo de dígitos para buscar por teléfono (evita recorrer el índice con "1")
+MIN_DIGITOS_TELEFONO = 4
+# Puntaje mínimo del modo en memoria, equivalente al umbral por defecto de pg_trgm
+UMBRAL_SIMILITUD = 0.3
+
+
+def buscar_pedidos(db: Session, texto: str, skip: int = 0, limit: int = 20) -> list:
+    """
+    Busca pedidos activos y devuelve [(pedido, puntaje)] ordenado por relevancia.
+    En PostgreSQL se resuelve con los índices GIN (tsvector y pg_trgm) de la tabla;
+    con otros motores se usa un recorrido en memoria, pensado solo para desarrollo.
+    """
+    texto = texto.strip()
+    if db.get_bind().dialect.name != "postgresql":
+        return _buscar_en_memoria(db, texto, skip, limit)
+
+    consulta_ts = func.plainto_tsquery("simple", texto)
+    condiciones = [
+        Pedido.busqueda.op("@@")(consulta_ts),
+        Pedido.destinatario_nombre.op("%")(texto),
+        # word_similarity: el texto buscado puede ser solo un fragmento de la dirección
+        literal(texto).op("<%")(Pedido.direccion),
+    ]
+    puntajes = [
+        func.ts_rank(Pedido.busqueda, consulta_ts),
+        func.similarity(Pedido.destinatario_nombre, texto),
+        func.word_similarity(texto, Pedido.direccion),
+    ]
+
+    digitos = re.sub(r"\D", "", texto)
+    if len(digitos) >= MIN_DIGITOS_TELEFONO:
+        condiciones.append(Pedido.destinatario_telefono.like(f"%{digitos}%"))
+        puntajes.append(func.similarity(Pedido.destinatario_telefono, digitos))
+
+    puntaje = func.greatest(*puntajes).label("puntaje")
+    filas = (
+        db.query(Pedido, puntaje)
+        .filter(or_(*condiciones))
+        .order_by(puntaje.desc(), Pedido.created_at.desc())
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+    return [(pedido, float(valor)) for pedido, valor in filas]
+
+
+def _similitud(texto: str, valor: str) -> float:
+    """Similitud entre el texto y el mejor fragmento del valor con la misma longitud"""
+    valor = normalizar_texto(valor)
+    if not valor:
+        return 0.0
+    if texto in valor:
+        return 1.0
+    ventana = len(texto)
+    fragmentos = [valor[i:i + ventana] for i in range(max(1, len(valor) - ventana + 1))]
+    return max(SequenceMatcher(None, texto, fragmento).ratio() for fragmento in fragmentos)
+
+
+def _buscar_en_memoria(db: Session, texto: str, skip: int, limit: int) -> list:
+    """Recorre la tabla y puntúa cada pedido en Python"""
+    texto_normalizado = normalizar_texto(texto)
+    digitos = re.sub(r"\D", "", texto)
+
+    resultados = []
+    for pedido in db.query(Pedido).all():
+        puntaje = max(
+            _similitud(texto_normalizado, pedido.destinatario_nombre),
+            _similitud(texto_normalizado, pedido.direccion),
+        )
+        if len(digitos) >= MIN_DIGITOS_TELEFONO and digitos in re.sub(r"\D", "", pedido.destinatario_telefono or ""):
+            puntaje = 1.0
+        if puntaje >= UMBRAL_SIMILITUD:
+            resultados.append((pedido, puntaje))
+
+    resultados.sort(key=lambda item: (item[1], item[0].created_at), reverse=True)
+    return resultados[skip:skip + limit]
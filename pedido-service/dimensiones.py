@@ -0,0 +1,128 @@
+"""Dimensiones estructuradas y peso volumétrico de pedidos"""
+import re
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.orm import Session
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pedido_service.models import Pedido, PedidoArchivado
+
+
+# cm³ por kg; 5000 es el divisor estándar de mensajería
+DIVISOR_VOLUMETRICO = float(os.getenv("PEDIDOS_DIVISOR_VOLUMETRICO", "5000"))
+BACKFILL_LOTE = int(os.getenv("PEDIDOS_DIMENSIONES_LOTE", "1000"))
+
+FACTOR_A_CM = {"mm": 0.1, "cm": 1.0, "m": 100.0, "in": 2.54, "pulg": 2.54}
+
+COLUMNAS_MEDIDAS = ("largo_cm", "ancho_cm", "alto_cm", "volumen_m3", "peso_volumetrico_kg")
+
+_NUMERO = r"(\d+(?:[.,]\d+)?)"
+_SEPARADOR = r"\s*[x×*]\s*"
+PATRON_DIMENSIONES = re.compile(
+    rf"^\s*{_NUMERO}{_SEPARADOR}{_NUMERO}{_SEPARADOR}{_NUMERO}\s*(mm|cm|m|in|pulg)?\.?\s*$",
+    re.IGNORECASE
+)
+
+
+def parsear_dimensiones(texto: str):
+    """
+    Convierte un texto como "30x20x10 cm" en (largo, ancho, alto) en centímetros.
+    Sin unidad se asumen centímetros. Devuelve None si el texto no tiene ese formato.
+    """
+    if not texto:
+        return None
+    coincidencia = PATRON_DIMENSIONES.match(texto)
+    if not coincidencia:
+        return None
+
+    factor = FACTOR_A_CM[(coincidencia.group(4) or "cm").lower()]
+    medidas = [float(valor.replace(",", ".")) * factor for valor in coincidencia.groups()[:3]]
+    if any(medida <= 0 for medida in medidas):
+        return None
+    return tuple(round(medida, 2) for medida in medidas)
+
+
+def calcular_medidas(texto: str) -> dict:
+    """
+    Columnas derivadas de `dimensiones`: largo/ancho/alto en cm, volumen en m³
+    y peso volumétrico en kg. Todas None si el texto no se puede interpretar.
+    """
+    medidas = parsear_dimensiones(texto)
+    if medidas is None:
+        return dict.fromkeys(COLUMNAS_MEDIDAS)
+
+    largo, ancho, alto = medidas
+    volumen_cm3 = largo * ancho * alto
+    return {
+        "largo_cm": largo,
+        "ancho_cm": ancho,
+        "alto_cm": alto,
+        "volumen_m3": round(volumen_cm3 / 1_000_000, 6),
+        "peso_volumetrico_kg": round(volumen_cm3 / DIVISOR_VOLUMETRICO, 3),
+    }
+
+
+def completar_lote(db: Session, modelo, desde_id: str = None, lote: int = BACKFILL_LOTE):
+    """
+    Calcula las medidas de hasta `lote` filas con dimensiones y sin volumen,
+    recorriendo por id a partir de `desde_id`. Devuelve (leídas, actualizadas, último id).
+    """
+    consulta = select(modelo.id, modelo.dimensiones).where(
+        modelo.dimensiones.isnot(None),
+        modelo.volumen_m3.is_(None)
+    ).order_by(modelo.id).limit(lote)
+    if desde_id is not None:
+        consulta = consulta.where(modelo.id > desde_id)
+
+    filas = db.execute(consulta).all()
+    if not filas:
+        return 0, 0, desde_id
+
+    cambios = []
+    for fila in filas:
+        medidas = calcular_medidas(fila.dimensiones)
+        if medidas["volumen_m3"] is not None:
+            cambios.append({"b_id": fila.id, **medidas})
+
+    if cambios:
+        # Un solo executemany; updated_at se conserva para no adelantar el archivo y
+        # version sube porque la representación cambió (el ETag de las cachés deja de valer)
+        tabla = modelo.__table__
+        stmt = update(tabla).where(tabla.c.id == bindparam("b_id")).values(
+            updated_at=tabla.c.updated_at,
+            version=tabla.c.version + 1,
+            **{columna: bindparam(columna) for columna in COLUMNAS_MEDIDAS}
+        )
+        db.execute(stmt, cambios)
+    db.commit()
+
+    return len(filas), len(cambios), filas[-1].id
+
+
+def completar_dimensiones(db: Session, lote: int = BACKFILL_LOTE) -> int:
+    """
+    Backfill de las columnas estructuradas en pedidos activos y archivados.
+    Las filas con texto no interpretable se saltan (quedan en None).
+    """
+    total = 0
+    for modelo in (Pedido, PedidoArchivado):
+        desde_id = None
+        while True:
+            leidas, actualizadas, desde_id = completar_lote(db, modelo, desde_id, lote)
+            total += actualizadas
+            if leidas < lote:
+                break
+    return total
+
+
+if __name__ == "__main__":
+    # Ejecución manual tras desplegar: python -m pedido_service.dimensiones
+    from shared.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(f"Pedidos con dimensiones estructuradas: {completar_dimensiones(db)}")
+    finally:
+        db.close()
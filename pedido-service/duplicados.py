@@ -0,0 +1,44 @@
+"""Detección de pedidos duplicados mediante una huella normalizada"""
+from datetime import datetime, timezone
+import hashlib
+import re
+import unicodedata
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+# Dos pedidos con la misma huella dentro de esta ventana se consideran duplicados
+DUPLICADOS_VENTANA_SEGUNDOS = int(os.getenv("PEDIDOS_DUPLICADOS_VENTANA_SEGUNDOS", "600"))
+# MARCAR: se crea el pedido con posible_duplicado_de; RECHAZAR: responde 409
+DUPLICADOS_MODO = os.getenv("PEDIDOS_DUPLICADOS_MODO", "MARCAR").upper()
+
+
+def normalizar_texto(valor: str) -> str:
+    """Minúsculas, sin tildes, solo letras/dígitos separados por un espacio"""
+    valor = unicodedata.normalize("NFKD", valor or "")
+    valor = "".join(c for c in valor if not unicodedata.combining(c)).lower()
+    return " ".join(re.findall(r"[a-z0-9]+", valor))
+
+
+def huellas_pedido(cliente_id: str, destinatario_nombre: str, direccion: str, ciudad: str,
+                   peso_kg: float, instante: datetime = None) -> tuple:
+    """
+    Huellas (actual, anterior) de un pedido: la del intervalo de tiempo en curso
+    y la del intervalo previo, para no perder duplicados que caen a ambos lados
+    del límite. El pedido nuevo se guarda con la actual; la búsqueda usa ambas.
+    """
+    instante = instante or datetime.now(timezone.utc)
+    intervalo = int(instante.timestamp()) // DUPLICADOS_VENTANA_SEGUNDOS
+    base = "|".join([
+        str(cliente_id).lower(),
+        normalizar_texto(destinatario_nombre),
+        normalizar_texto(direccion),
+        normalizar_texto(ciudad),
+        f"{peso_kg:.1f}",
+    ])
+    return tuple(
+        hashlib.sha256(f"{base}|{numero}".encode()).hexdigest()
+        for numero in (intervalo, intervalo - 1)
+    )
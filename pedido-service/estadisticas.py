@@ -0,0 +1,104 @@
+"""Estadísticas de pedidos por ciudad y estado mantenidas incrementalmente"""
+from sqlalchemy import func, select, text, union_all
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pedido_service.models import Pedido, PedidoArchivado, EstadisticaPedido, EstadoPedidoEnum
+
+
+def ajustar_contador(db: Session, ciudad: str, estado: EstadoPedidoEnum, delta: int):
+    """
+    Suma delta al contador (ciudad, estado) con un UPSERT atómico.
+    Se ejecuta en la transacción del llamador, sin hacer commit.
+    """
+    stmt = insert(EstadisticaPedido).values(ciudad=ciudad, estado=estado, total=delta)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[EstadisticaPedido.ciudad, EstadisticaPedido.estado],
+        set_={"total": EstadisticaPedido.total + delta, "updated_at": func.now()}
+    )
+    db.execute(stmt)
+
+
+def ajustar_contadores(db: Session, deltas: dict):
+    """
+    Aplica varios ajustes {(ciudad, estado): delta} en la transacción del llamador.
+    Se bloquean las filas siempre en el mismo orden para evitar deadlocks.
+    """
+    for (ciudad, estado), delta in sorted(deltas.items(), key=lambda item: (item[0][0], item[0][1].value)):
+        if delta:
+            ajustar_contador(db, ciudad, estado, delta)
+
+
+def registrar_transicion(db: Session, ciudad: str, estado_anterior: EstadoPedidoEnum,
+                         estado_nuevo: EstadoPedidoEnum):
+    """Mueve un pedido de un contador de estado a otro"""
+    if estado_anterior == estado_nuevo:
+        return
+    ajustar_contadores(db, {
+        (ciudad, EstadoPedidoEnum(estado_anterior)): -1,
+        (ciudad, EstadoPedidoEnum(estado_nuevo)): 1,
+    })
+
+
+def obtener_estadisticas(db: Session) -> dict:
+    """Lee la tabla resumen (a lo sumo ciudades x estados filas)"""
+    filas = db.query(EstadisticaPedido).filter(EstadisticaPedido.total != 0).all()
+
+    por_estado = {e.value: 0 for e in EstadoPedidoEnum}
+    por_ciudad = {}
+    detalle = []
+    for fila in filas:
+        estado = EstadoPedidoEnum(fila.estado).value
+        por_estado[estado] += fila.total
+        por_ciudad[fila.ciudad] = por_ciudad.get(fila.ciudad, 0) + fila.total
+        detalle.append({"ciudad": fila.ciudad, "estado": estado, "total": fila.total})
+
+    return {
+        "total": sum(por_estado.values()),
+        "por_estado": por_estado,
+        "por_ciudad": por_ciudad,
+        "por_ciudad_estado": detalle,
+    }
+
+
+def reconstruir_estadisticas(db: Session) -> int:
+    """
+    Reconstruye la tabla resumen desde cero con COUNT(*) GROUP BY.
+    El bloqueo EXCLUSIVE hace esperar a los ajustes concurrentes hasta el
+    commit, de modo que se aplican sobre los conteos ya reconstruidos.
+    """
+    db.execute(text(f"LOCK TABLE {EstadisticaPedido.__tablename__} IN EXCLUSIVE MODE"))
+    db.query(EstadisticaPedido).delete(synchronize_session=False)
+
+    # Los pedidos archivados siguen contando en las estadísticas
+    pedidos = union_all(
+        select(Pedido.ciudad, Pedido.estado),
+        select(PedidoArchivado.ciudad, PedidoArchivado.estado)
+    ).subquery()
+    conteos = db.execute(
+        select(pedidos.c.ciudad, pedidos.c.estado, func.count()).group_by(pedidos.c.ciudad, pedidos.c.estado)
+    ).all()
+
+    db.bulk_insert_mappings(EstadisticaPedido, [
+        {"ciudad": ciudad, "estado": estado, "total": total}
+        for ciudad, estado, total in conteos
+    ])
+    db.commit()
+
+    return len(conteos)
+
+
+if __name__ == "__main__":
+    # Job de reconciliación, p. ej. desde cron: python -m pedido_service.estadisticas
+    from shared.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        filas = reconstruir_estadisticas(db)
+        print(f"Estadísticas reconstruidas: {filas} combinaciones ciudad/estado")
+    finally:
+        db.close()
@@ -0,0 +1,124 @@
+"""Broker de eventos en proceso y Server-Sent Events para PedidoService"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+
+
+HEARTBEAT_SEGUNDOS = 15
+MAX_EVENTOS_PENDIENTES = 100
+ESTADOS_FINALES = {"ENTREGADO", "CANCELADO"}
+
+
+class BrokerEventos:
+    """
+    Distribuye cambios de pedidos a suscriptores en memoria.
+    Cada suscriptor tiene una cola acotada; si se llena se descarta el
+    evento más antiguo, así un cliente lento no hace crecer la memoria.
+    """
+
+    def __init__(self, max_pendientes: int = MAX_EVENTOS_PENDIENTES):
+        self.max_pendientes = max_pendientes
+        self._por_pedido: Dict[str, set] = defaultdict(set)
+        self._por_cliente: Dict[str, set] = defaultdict(set)
+        self._suscripciones: Dict[asyncio.Queue, Tuple[dict, str, asyncio.AbstractEventLoop]] = {}
+        # publicar puede correr en un hilo del threadpool mientras el loop suscribe o desuscribe
+        self._lock = threading.Lock()
+
+    def _suscribir(self, indice: dict, clave: str) -> asyncio.Queue:
+        cola = asyncio.Queue(maxsize=self.max_pendientes)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            indice[clave].add(cola)
+            self._suscripciones[cola] = (indice, clave, loop)
+        return cola
+
+    def suscribir_pedido(self, pedido_id: str) -> asyncio.Queue:
+        """Suscribe a los cambios de un pedido"""
+        return self._suscribir(self._por_pedido, pedido_id)
+
+    def suscribir_cliente(self, cliente_id: str) -> asyncio.Queue:
+        """Suscribe a los cambios de todos los pedidos de un cliente"""
+        return self._suscribir(self._por_cliente, cliente_id)
+
+    def desuscribir(self, cola: asyncio.Queue):
+        """Elimina una suscripción"""
+        with self._lock:
+            suscripcion = self._suscripciones.pop(cola, None)
+            if suscripcion is None:
+                return
+            indice, clave, _ = suscripcion
+            indice[clave].discard(cola)
+            if not indice[clave]:
+                del indice[clave]
+
+    def publicar(self, evento: dict):
+        """Publica un evento a los suscriptores del pedido y del cliente"""
+        # Copia bajo el lock; la entrega a cada loop se hace fuera de él
+        with self._lock:
+            colas = set(self._por_pedido.get(evento["pedido_id"], ()))
+            colas |= self._por_cliente.get(evento["cliente_id"], set())
+            destinos = [(cola, self._suscripciones[cola][2]) for cola in colas if cola in self._suscripciones]
+
+        for cola, loop in destinos:
+            # Puede publicarse desde un hilo distinto al event loop
+            loop.call_soon_threadsafe(self._entregar, cola, evento)
+
+    @staticmethod
+    def _entregar(cola: asyncio.Queue, evento: dict):
+        if cola.full():
+            cola.get_nowait()
+        cola.put_nowait(evento)
+
+    def total_suscriptores(self) -> int:
+        return len(self._suscripciones)
+
+
+broker = BrokerEventos()
+
+
+def evento_desde_pedido(pedido) -> dict:
+    """Proyección del pedido que se envía en cada evento"""
+    return {
+        "pedido_id": pedido.id,
+        "numero_pedido": pedido.numero_pedido,
+        "cliente_id": pedido.cliente_id,
+        "estado": getattr(pedido.estado, "value", pedido.estado),
+        "repartidor_id": pedido.repartidor_id,
+        "version": pedido.version,
+        "updated_at": pedido.updated_at.isoformat() if pedido.updated_at else None,
+        "cancelled_at": pedido.cancelled_at.isoformat() if pedido.cancelled_at else None,
+    }
+
+
+def formatear_sse(evento: dict) -> str:
+    """Serializa un evento en formato text/event-stream"""
+    return f"event: pedido\nid: {evento['pedido_id']}:{evento['version']}\ndata: {json.dumps(evento)}\n\n"
+
+
+async def generar_sse(request: Request, cola: asyncio.Queue, inicial: Optional[dict] = None,
+                      cerrar_en_estado_final: bool = False):
+    """Generador del stream SSE; envía heartbeats y libera la suscripción al terminar"""
+    try:
+        if inicial is not None:
+            yield formatear_sse(inicial)
+            if cerrar_en_estado_final and inicial["estado"] in ESTADOS_FINALES:
+                return
+
+        while True:
+            try:
+                evento = await asyncio.wait_for(cola.get(), timeout=HEARTBEAT_SEGUNDOS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": keepalive\n\n"
+                continue
+
+            yield formatear_sse(evento)
+            if cerrar_en_estado_final and evento["estado"] in ESTADOS_FINALES:
+                return
+    finally:
+        broker.desuscribir(cola)
@@ -0,0 +1,170 @@
+"""Historial de estados de pedidos y percentiles de tiempo en estado"""
+from collections import Counter
+from datetime import datetime, timezone
+import math
+from sqlalchemy import Integer, cast, func, select, text, tuple_, union_all
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pedido_service.models import (
+    Pedido, PedidoArchivado, EstadoPedidoEnum, HistorialEstadoPedido, TiempoEstadoPedido
+)
+
+# Cada bucket cubre [BASE^i, BASE^(i+1)) segundos: error relativo de ~12% en los percentiles
+BASE_BUCKET = 1.25
+PERCENTILES = (50, 90, 95, 99)
+
+
+def bucket_duracion(segundos: float) -> int:
+    """Índice del bucket para una duración; todo lo menor a 1 s cae en el bucket 0"""
+    return int(math.floor(math.log(max(segundos, 1.0)) / math.log(BASE_BUCKET)))
+
+
+def registrar_entrada(db: Session, pedido_id: str, estado: EstadoPedidoEnum, instante: datetime = None):
+    """Agrega la entrada de un pedido nuevo a su estado inicial, sin hacer commit"""
+    db.execute(insert(HistorialEstadoPedido).values(
+        pedido_id=pedido_id,
+        estado=estado,
+        entrada_at=instante or datetime.now(timezone.utc)
+    ).on_conflict_do_nothing())
+
+
+def registrar_cambios_estado(db: Session, cambios: list, instante: datetime = None):
+    """
+    Registra transiciones [(pedido_id, ciudad, estado_anterior, estado_nuevo)]
+    en la transacción del llamador: agrega una fila de historial por pedido y
+    suma la duración en el estado anterior al histograma de su ciudad.
+    """
+    cambios = [
+        (pedido_id, ciudad, EstadoPedidoEnum(anterior), EstadoPedidoEnum(nuevo))
+        for pedido_id, ciudad, anterior, nuevo in cambios
+        if EstadoPedidoEnum(anterior) != EstadoPedidoEnum(nuevo)
+    ]
+    if not cambios:
+        return
+    instante = instante or datetime.now(timezone.utc)
+
+    # Entrada al estado anterior de cada pedido, por clave primaria
+    entradas = dict(
+        ((fila.pedido_id, EstadoPedidoEnum(fila.estado)), fila.entrada_at)
+        for fila in db.execute(
+            select(HistorialEstadoPedido.pedido_id, HistorialEstadoPedido.estado, HistorialEstadoPedido.entrada_at)
+            .where(tuple_(HistorialEstadoPedido.pedido_id, HistorialEstadoPedido.estado).in_(
+                [(pedido_id, anterior) for pedido_id, _, anterior, _ in cambios]
+            ))
+        )
+    )
+
+    db.execute(insert(HistorialEstadoPedido).on_conflict_do_nothing(), [
+        {"pedido_id": pedido_id, "estado": nuevo, "entrada_at": instante}
+        for pedido_id, _, _, nuevo in cambios
+    ])
+
+    # Los pedidos anteriores al historial no tienen entrada y no aportan duración
+    buckets = Counter()
+    for pedido_id, ciudad, anterior, _ in cambios:
+        entrada_at = entradas.get((pedido_id, anterior))
+        if entrada_at is not None:
+            buckets[(ciudad, anterior, bucket_duracion((instante - entrada_at).total_seconds()))] += 1
+
+    # Orden fijo de bloqueo entre transacciones concurrentes
+    for (ciudad, estado, bucket), total in sorted(buckets.items(), key=lambda item: (item[0][0], item[0][1].value, item[0][2])):
+        stmt = insert(TiempoEstadoPedido).values(ciudad=ciudad, estado=estado, bucket=bucket, total=total)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[TiempoEstadoPedido.ciudad, TiempoEstadoPedido.estado, TiempoEstadoPedido.bucket],
+            set_={"total": TiempoEstadoPedido.total + total}
+        ))
+
+
+def _percentil(histograma: list, total: int, percentil: float) -> float:
+    """Percentil aproximado (segundos) a partir de [(bucket, conteo)] ordenado"""
+    objetivo = math.ceil(total * percentil / 100)
+    acumulado = 0
+    for bucket, conteo in histograma:
+        acumulado += conteo
+        if acumulado >= objetivo:
+            # Punto medio geométrico del bucket
+            return round(BASE_BUCKET ** (bucket + 0.5), 1)
+    return round(BASE_BUCKET ** (histograma[-1][0] + 0.5), 1)
+
+
+def obtener_tiempos_estado(db: Session, ciudad: str = None, percentiles=PERCENTILES) -> dict:
+    """
+    Percentiles de tiempo en estado (segundos) por ciudad y estado, calculados
+    sobre el histograma pre-agregado (a lo sumo ciudades x estados x ~70 filas).
+    """
+    consulta = db.query(TiempoEstadoPedido).filter(TiempoEstadoPedido.total > 0)
+    if ciudad is not None:
+        consulta = consulta.filter(TiempoEstadoPedido.ciudad == ciudad)
+
+    histogramas = {}
+    for fila in consulta.order_by(TiempoEstadoPedido.bucket).all():
+        clave = (fila.ciudad, EstadoPedidoEnum(fila.estado).value)
+        histogramas.setdefault(clave, []).append((fila.bucket, fila.total))
+
+    por_ciudad = {}
+    for (nombre_ciudad, estado), histograma in sorted(histogramas.items()):
+        total = sum(conteo for _, conteo in histograma)
+        resumen = {"muestras": total}
+        for percentil in percentiles:
+            resumen[f"p{percentil:g}"] = _percentil(histograma, total, percentil)
+        por_ciudad.setdefault(nombre_ciudad, {})[estado] = resumen
+
+    return {"unidad": "segundos", "por_ciudad": por_ciudad}
+
+
+def reconstruir_tiempos(db: Session) -> int:
+    """
+    Reconstruye el histograma desde el historial: la salida de cada estado es
+    la entrada al siguiente (lead() por pedido). Mismo esquema de bloqueo que
+    reconstruir_estadisticas.
+    """
+    db.execute(text(f"LOCK TABLE {TiempoEstadoPedido.__tablename__} IN EXCLUSIVE MODE"))
+    db.query(TiempoEstadoPedido).delete(synchronize_session=False)
+
+    historial = select(
+        HistorialEstadoPedido.pedido_id,
+        HistorialEstadoPedido.estado,
+        HistorialEstadoPedido.entrada_at,
+        func.lead(HistorialEstadoPedido.entrada_at).over(
+            partition_by=HistorialEstadoPedido.pedido_id,
+            order_by=HistorialEstadoPedido.entrada_at
+        ).label("salida_at")
+    ).subquery()
+    pedidos = union_all(
+        select(Pedido.id, Pedido.ciudad),
+        select(PedidoArchivado.id, PedidoArchivado.ciudad)
+    ).subquery()
+
+    segundos = func.extract("epoch", historial.c.salida_at - historial.c.entrada_at)
+    bucket = cast(func.floor(func.ln(func.greatest(segundos, 1)) / math.log(BASE_BUCKET)), Integer).label("bucket")
+    conteos = db.execute(
+        select(pedidos.c.ciudad, historial.c.estado, bucket, func.count())
+        .select_from(historial)
+        .join(pedidos, pedidos.c.id == historial.c.pedido_id)
+        .where(historial.c.salida_at.isnot(None))
+        .group_by(pedidos.c.ciudad, historial.c.estado, bucket)
+    ).all()
+
+    db.bulk_insert_mappings(TiempoEstadoPedido, [
+        {"ciudad": ciudad, "estado": estado, "bucket": indice, "total": total}
+        for ciudad, estado, indice, total in conteos
+    ])
+    db.commit()
+
+    return len(conteos)
+
+
+if __name__ == "__main__":
+    # Reconciliación manual o desde cron: python -m pedido_service.historial
+    from shared.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(f"Histograma de tiempos reconstruido: {reconstruir_tiempos(db)} buckets")
+    finally:
+        db.close()
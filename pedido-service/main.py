@@ -1,6 +1,8 @@
 """Aplicación FastAPI para PedidoService"""
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 import sys
 import os
 
@@ -8,7 +10,8 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 from pedido_service.routes import router
 from pedido_service.models import Base
-from shared.database import engine
+from pedido_service.archivo import archivar_pedidos, ARCHIVO_INTERVALO_SEGUNDOS
+from shared.database import engine, SessionLocal
 from shared.logger import setup_logger
 
 # Configurar logger
@@ -39,6 +42,41 @@ app.add_middleware(
 app.include_router(router, prefix="/api/pedidos", tags=["pedidos"])
 
 
+def ejecutar_archivo():
+    """Ejecuta una pasada del job de archivo con su propia sesión"""
+    db = SessionLocal()
+    try:
+        return archivar_pedidos(db)
+    finally:
+        db.close()
+
+
+async def job_archivo():
+    """Mueve periódicamente los pedidos finalizados antiguos a pedidos_archivados"""
+    while True:
+        await asyncio.sleep(ARCHIVO_INTERVALO_SEGUNDOS)
+        try:
+            archivados = await run_in_threadpool(ejecutar_archivo)
+            if archivados:
+                logger.info(f"Pedidos archivados: {archivados}")
+        except Exception as e:
+            logger.error(f"Error archivando pedidos: {str(e)}")
+
+
+@app.on_event("startup")
+async def iniciar_jobs():
+    """Inicia los jobs en segundo plano (ARCHIVO_INTERVALO_SEGUNDOS=0 lo desactiva)"""
+    if ARCHIVO_INTERVALO_SEGUNDOS > 0:
+        app.state.job_archivo = asyncio.create_task(job_archivo())
+
+
+@app.on_event("shutdown")
+async def detener_jobs():
+    tarea = getattr(app.state, "job_archivo", None)
+    if tarea:
+        tarea.cancel()
+
+
 @app.get("/health", tags=["Health"])
 async def health_check():
     """Health check endpoint"""
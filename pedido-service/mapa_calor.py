@@ -0,0 +1,123 @@
+"""Mapa de calor de demanda: conteo de pedidos por celda de una grilla por ciudad"""
+from datetime import datetime, timedelta, timezone
+import math
+import numpy as np
+from sqlalchemy import select, union_all
+from sqlalchemy.orm import Session
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pedido_service.models import Pedido, PedidoArchivado
+from shared.cobertura import CIUDADES_COBERTURA
+from shared.ttl_cache import TTLCache
+
+METROS_POR_GRADO_LATITUD = 111_320
+MAPA_CALOR_LOTE = int(os.getenv("MAPA_CALOR_LOTE", "50000"))
+# Ventanas que incluyen la hora en curso cambian con cada pedido; las cerradas casi nunca
+MAPA_CALOR_TTL_ABIERTA_SEGUNDOS = int(os.getenv("MAPA_CALOR_TTL_ABIERTA_SEGUNDOS", "60"))
+MAPA_CALOR_TTL_CERRADA_SEGUNDOS = int(os.getenv("MAPA_CALOR_TTL_CERRADA_SEGUNDOS", "86400"))
+
+cache_mapa_calor = TTLCache(ttl_seconds=MAPA_CALOR_TTL_ABIERTA_SEGUNDOS, max_entries=1_000)
+
+
+def _grilla(ciudad: str, celda_m: int) -> dict:
+    """Celdas de celda_m x celda_m metros sobre el rectángulo de cobertura de la ciudad"""
+    limites = CIUDADES_COBERTURA[ciudad]
+    latitud_centro = (limites["latitud_min"] + limites["latitud_max"]) / 2
+    paso_latitud = celda_m / METROS_POR_GRADO_LATITUD
+    paso_longitud = celda_m / (METROS_POR_GRADO_LATITUD * math.cos(math.radians(latitud_centro)))
+    return {
+        "latitud_min": limites["latitud_min"],
+        "longitud_min": limites["longitud_min"],
+        "paso_latitud": paso_latitud,
+        "paso_longitud": paso_longitud,
+        "filas": math.ceil((limites["latitud_max"] - limites["latitud_min"]) / paso_latitud),
+        "columnas": math.ceil((limites["longitud_max"] - limites["longitud_min"]) / paso_longitud),
+    }
+
+
+def _acumular(conteos: np.ndarray, grilla: dict, coordenadas: np.ndarray):
+    """Suma un lote de coordenadas [[latitud, longitud], ...] a la grilla aplanada"""
+    fila = np.floor((coordenadas[:, 0] - grilla["latitud_min"]) / grilla["paso_latitud"]).astype(np.int64)
+    columna = np.floor((coordenadas[:, 1] - grilla["longitud_min"]) / grilla["paso_longitud"]).astype(np.int64)
+    dentro = (fila >= 0) & (fila < grilla["filas"]) & (columna >= 0) & (columna < grilla["columnas"])
+    indices = fila[dentro] * grilla["columnas"] + columna[dentro]
+    conteos += np.bincount(indices, minlength=conteos.size)
+
+
+def calcular_mapa_calor(db: Session, ciudad: str, desde: datetime, hasta: datetime, celda_m: int) -> dict:
+    """
+    Recorre las coordenadas de los pedidos (activos y archivados) creados en
+    [desde, hasta) por lotes de MAPA_CALOR_LOTE filas y las agrupa por celda.
+    Devuelve solo las celdas con pedidos, de mayor a menor demanda.
+    """
+    grilla = _grilla(ciudad, celda_m)
+    conteos = np.zeros(grilla["filas"] * grilla["columnas"], dtype=np.int64)
+
+    coordenadas = union_all(*[
+        select(modelo.latitud, modelo.longitud).where(
+            modelo.ciudad == ciudad,
+            modelo.created_at >= desde,
+            modelo.created_at < hasta,
+            modelo.latitud.isnot(None),
+            modelo.longitud.isnot(None)
+        )
+        for modelo in (Pedido, PedidoArchivado)
+    ])
+    resultado = db.execute(coordenadas.execution_options(yield_per=MAPA_CALOR_LOTE))
+    for lote in resultado.partitions():
+        _acumular(conteos, grilla, np.asarray(lote, dtype=np.float64))
+
+    celdas = np.flatnonzero(conteos)
+    celdas = celdas[np.argsort(conteos[celdas], kind="stable")[::-1]]
+    filas, columnas = np.divmod(celdas, grilla["columnas"])
+    return {
+        "ciudad": ciudad,
+        "desde": desde,
+        "hasta": hasta,
+        "celda_m": celda_m,
+        "total": int(conteos.sum()),
+        "celdas": [
+            {
+                # Centro de la celda
+                "latitud": round(grilla["latitud_min"] + (fila + 0.5) * grilla["paso_latitud"], 6),
+                "longitud": round(grilla["longitud_min"] + (columna + 0.5) * grilla["paso_longitud"], 6),
+                "total": int(conteos[celda]),
+            }
+            for celda, fila, columna in zip(celdas.tolist(), filas.tolist(), columnas.tolist())
+        ],
+    }
+
+
+def obtener_mapa_calor(db: Session, ciudad: str, desde: datetime = None, hasta: datetime = None,
+                       celda_m: int = 500) -> dict:
+    """
+    Mapa de calor de una ciudad con la ventana redondeada a horas completas,
+    de modo que consultas cercanas comparten el resultado cacheado.
+    Por defecto, los últimos 7 días.
+    """
+    if ciudad not in CIUDADES_COBERTURA:
+        raise ValueError(f"La ciudad {ciudad} no está en cobertura")
+
+    ahora = datetime.now(timezone.utc)
+    hasta = hasta or ahora
+    desde = desde or hasta - timedelta(days=7)
+    if desde.tzinfo is None:
+        desde = desde.replace(tzinfo=timezone.utc)
+    if hasta.tzinfo is None:
+        hasta = hasta.replace(tzinfo=timezone.utc)
+    desde = desde.replace(minute=0, second=0, microsecond=0)
+    hora_hasta = hasta.replace(minute=0, second=0, microsecond=0)
+    hasta = hora_hasta if hora_hasta == hasta else hora_hasta + timedelta(hours=1)
+    if desde >= hasta:
+        raise ValueError("desde debe ser anterior a hasta")
+
+    clave = (ciudad, desde, hasta, celda_m)
+    mapa = cache_mapa_calor.get(clave)
+    if mapa is None:
+        mapa = calcular_mapa_calor(db, ciudad, desde, hasta, celda_m)
+        ttl = MAPA_CALOR_TTL_ABIERTA_SEGUNDOS if hasta > ahora else MAPA_CALOR_TTL_CERRADA_SEGUNDOS
+        cache_mapa_calor.set(clave, mapa, ttl_seconds=ttl)
+    return mapa
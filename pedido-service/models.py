@@ -1,6 +1,8 @@
 """Modelos de base de datos para PedidoService"""
-from sqlalchemy import Column, String, DateTime, Enum as SQLEnum, Float, Integer, Boolean, ForeignKey, Text
-from sqlalchemy.sql import func
+from sqlalchemy import Column, String, DateTime, Enum as SQLEnum, Float, Integer, Boolean, ForeignKey, Text, Index, Computed, DDL, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred
+from sqlalchemy.sql import func, text
 from datetime import datetime
 import enum
 import sys
@@ -9,6 +11,7 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from shared.database import Base
+from shared.ids import UUIDStr
 
 
 class EstadoPedidoEnum(str, enum.Enum):
@@ -27,11 +30,11 @@ class TipoEntregaEnum(str, enum.Enum):
     LOCKER = "LOCKER"
 
 
-class Pedido(Base):
-    __tablename__ = "pedidos"
+class PedidoColumnas:
+    """Columnas comunes de la tabla activa y la de archivo"""
     
-    id = Column(String(36), primary_key=True, index=True)
-    cliente_id = Column(String(36), nullable=False, index=True)
+    id = Column(UUIDStr(), primary_key=True)
+    cliente_id = Column(UUIDStr(), nullable=False, index=True)
     numero_pedido = Column(String(50), unique=True, nullable=False, index=True)
     estado = Column(SQLEnum(EstadoPedidoEnum), nullable=False, default=EstadoPedidoEnum.RECIBIDO)
     tipo_entrega = Column(SQLEnum(TipoEntregaEnum), nullable=False)
@@ -47,6 +50,12 @@ class Pedido(Base):
     descripcion = Column(Text, nullable=True)
     peso_kg = Column(Float, nullable=False, default=0.0)
     dimensiones = Column(String(100), nullable=True)
+    # Derivadas de dimensiones (ver pedido_service.dimensiones)
+    largo_cm = Column(Float, nullable=True)
+    ancho_cm = Column(Float, nullable=True)
+    alto_cm = Column(Float, nullable=True)
+    volumen_m3 = Column(Float, nullable=True)
+    peso_volumetrico_kg = Column(Float, nullable=True)
     valor_declarado = Column(Float, nullable=False, default=0.0)
     
     # Información de entrega
@@ -55,15 +64,124 @@ class Pedido(Base):
     destinatario_email = Column(String(255), nullable=True)
     
     # Repartidor asignado
-    repartidor_id = Column(String(36), nullable=True, index=True)
+    repartidor_id = Column(UUIDStr(), nullable=True, index=True)
     
     # Factura
-    factura_id = Column(String(36), nullable=True, index=True)
+    factura_id = Column(UUIDStr(), nullable=True, index=True)
+    
+    # Control de concurrencia optimista
+    version = Column(Integer, nullable=False, default=1)
     
     # Auditoría
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     cancelled_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class Pedido(PedidoColumnas, Base):
+    __tablename__ = "pedidos"
+    __table_args__ = (
+        # Candidatos del job de archivo; índice parcial, solo pedidos finalizados
+        Index(
+            "ix_pedidos_finalizados_updated_at", "updated_at",
+            postgresql_where=text("estado IN ('ENTREGADO', 'CANCELADO')")
+        ),
+        # Mapa de calor: pedidos de una ciudad en una ventana de tiempo
+        Index("ix_pedidos_ciudad_created_at", "ciudad", "created_at"),
+        # Pedidos pendientes de asignar por volumen y peso (asignación por capacidad)
+        Index(
+            "ix_pedidos_pendientes_volumen_peso", "volumen_m3", "peso_kg",
+            postgresql_where=text(
+                "repartidor_id IS NULL AND estado IN ('CONFIRMADO', 'EN_PREPARACION', 'LISTO_PARA_ENTREGA')"
+            )
+        ),
+        # Búsqueda de texto completo y difusa (pg_trgm)
+        Index("ix_pedidos_busqueda", "busqueda", postgresql_using="gin"),
+        Index(
+            "ix_pedidos_destinatario_nombre_trgm", "destinatario_nombre",
+            postgresql_using="gin", postgresql_ops={"destinatario_nombre": "gin_trgm_ops"}
+        ),
+        Index(
+            "ix_pedidos_destinatario_telefono_trgm", "destinatario_telefono",
+            postgresql_using="gin", postgresql_ops={"destinatario_telefono": "gin_trgm_ops"}
+        ),
+        Index(
+            "ix_pedidos_direccion_trgm", "direccion",
+            postgresql_using="gin", postgresql_ops={"direccion": "gin_trgm_ops"}
+        ),
+    )
+    
+    # Detección de duplicados (ver pedido_service.duplicados)
+    huella = Column(String(64), nullable=True, index=True)
+    posible_duplicado_de = Column(UUIDStr(), nullable=True)
+    
+    # Documento de búsqueda mantenido por PostgreSQL (columna generada, no se carga en el ORM)
+    busqueda = deferred(Column(TSVECTOR, Computed(
+        "to_tsvector('simple', coalesce(destinatario_nombre, '') || ' ' || coalesce(direccion, ''))",
+        persisted=True
+    )))
     
     def __repr__(self):
         return f"<Pedido {self.numero_pedido}>"
+
+
+# Los índices gin_trgm_ops requieren la extensión pg_trgm
+event.listen(
+    Pedido.__table__, "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
+
+
+class PedidoArchivado(PedidoColumnas, Base):
+    """Pedidos ENTREGADO/CANCELADO movidos fuera de la tabla activa"""
+    __tablename__ = "pedidos_archivados"
+    __table_args__ = (
+        Index("ix_pedidos_archivados_ciudad_created_at", "ciudad", "created_at"),
+    )
+    
+    archivado_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    def __repr__(self):
+        return f"<PedidoArchivado {self.numero_pedido}>"
+
+
+class EstadisticaPedido(Base):
+    """Conteo de pedidos por ciudad y estado, mantenido incrementalmente"""
+    __tablename__ = "estadisticas_pedidos"
+    
+    ciudad = Column(String(100), primary_key=True)
+    estado = Column(SQLEnum(EstadoPedidoEnum), primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<EstadisticaPedido {self.ciudad} {self.estado}={self.total}>"
+
+
+class HistorialEstadoPedido(Base):
+    """
+    Entrada de un pedido a cada estado (solo inserciones).
+    La máquina de estados no permite volver a un estado, así que
+    (pedido_id, estado) identifica la fila sin una columna id adicional.
+    """
+    __tablename__ = "historial_estados_pedidos"
+    
+    pedido_id = Column(UUIDStr(), primary_key=True)
+    estado = Column(SQLEnum(EstadoPedidoEnum), primary_key=True)
+    entrada_at = Column(DateTime(timezone=True), nullable=False)
+    
+    def __repr__(self):
+        return f"<HistorialEstadoPedido {self.pedido_id} {self.estado}>"
+
+
+class TiempoEstadoPedido(Base):
+    """Histograma de tiempo en estado por ciudad, con buckets de escala logarítmica"""
+    __tablename__ = "tiempos_estados_pedidos"
+    
+    ciudad = Column(String(100), primary_key=True)
+    estado = Column(SQLEnum(EstadoPedidoEnum), primary_key=True)
+    bucket = Column(Integer, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<TiempoEstadoPedido {self.ciudad} {self.estado}[{self.bucket}]={self.total}>"
@@ -1,6 +1,10 @@
 """API endpoints para PedidoService"""
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from typing import Optional
+from datetime import datetime
 import sys
 import os
 
@@ -8,21 +12,44 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 from pedido_service.models import Pedido
 from pedido_service.schemas import (
-    CreatePedidoRequest, UpdatePedidoRequest, PedidoResponse, CancelPedidoRequest
+    CreatePedidoRequest, UpdatePedidoRequest, PedidoResponse, CancelPedidoRequest,
+    SeguimientoPedidoResponse, TransicionLoteRequest, TransicionLoteResponse, ResultadoBusquedaPedido
+)
+from pedido_service.service import PedidoService, ConflictoPedidoError, PedidoDuplicadoError
+from pedido_service.eventos import broker, evento_desde_pedido, generar_sse
+from pedido_service.estadisticas import obtener_estadisticas, reconstruir_estadisticas
+from pedido_service.busqueda import buscar_pedidos
+from pedido_service.historial import obtener_tiempos_estado, reconstruir_tiempos
+from pedido_service.mapa_calor import obtener_mapa_calor
+from shared.database import get_db, SessionLocal
+from shared.http_cache import compute_etag, etag_matches, not_modified, set_cache_headers
+from shared.idempotency import (
+    IdempotencyStore, IdempotencyKeyConflict, IDEMPOTENCY_HEADER, REPLAYED_HEADER,
+    request_fingerprint, scoped_key
 )
-from pedido_service.service import PedidoService
-from shared.database import get_db
 from shared.jwt_utils import verify_jwt_in_request
+from shared.rate_limit import TokenBucketLimiter, client_ip
 from shared.logger import setup_logger, log_request
 
 router = APIRouter()
 logger = setup_logger("pedido-service")
 
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+idempotency_store = IdempotencyStore()
+MAX_IDS_POR_CONSULTA = 100
+
+# Seguimiento público: por IP, SEGUIMIENTO_RATE solicitudes/s con ráfagas de SEGUIMIENTO_BURST
+limitador_seguimiento = TokenBucketLimiter(
+    rate=float(os.getenv("SEGUIMIENTO_RATE", "1")),
+    burst=int(os.getenv("SEGUIMIENTO_BURST", "10"))
+)
+
 
 @router.post("/", response_model=PedidoResponse, tags=["Pedidos"])
 async def crear_pedido(
     pedido_data: CreatePedidoRequest,
     request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """
@@ -33,16 +60,44 @@ async def crear_pedido(
     - **ciudad**: Debe estar en cobertura (Bogotá, Medellín, Cali, Barranquilla, Cartagena)
     - **peso_kg**: Peso del paquete (mínimo 0.1 kg)
     - **valor_declarado**: Valor del envío en pesos colombianos
+    
+    Header opcional **Idempotency-Key**: los reintentos con la misma clave
+    devuelven el pedido ya creado en lugar de crear uno nuevo.
+    
+    Un pedido igual a otro del mismo cliente en los últimos minutos (mismo
+    destinatario, dirección, ciudad y peso) se crea con **posible_duplicado_de**
+    o, si PEDIDOS_DUPLICADOS_MODO=RECHAZAR, responde 409.
     """
     try:
         # Verificar JWT
         token_data = await verify_jwt_in_request(request)
         cliente_id = token_data.get("sub")
         
-        # Crear pedido
-        pedido = PedidoService.crear_pedido(db, cliente_id, pedido_data)
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if idempotency_key is None:
+            # Crear pedido
+            pedido = PedidoService.crear_pedido(db, cliente_id, pedido_data)
+        else:
+            async def crear():
+                creado = await run_in_threadpool(PedidoService.crear_pedido, db, cliente_id, pedido_data)
+                return PedidoResponse.model_validate(creado).model_dump(mode="json")
+            
+            pedido, repetido = await idempotency_store.run(
+                scoped_key(cliente_id, "/api/pedidos", idempotency_key),
+                request_fingerprint(pedido_data.model_dump(mode="json")),
+                crear
+            )
+            if repetido:
+                response.headers[REPLAYED_HEADER] = "true"
+        
         log_request(logger, "POST", "/api/pedidos", 201, cliente_id)
         return pedido
+    except IdempotencyKeyConflict as e:
+        log_request(logger, "POST", "/api/pedidos", 422, None)
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    except PedidoDuplicadoError as e:
+        log_request(logger, "POST", "/api/pedidos", 409, None)
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except ValueError as e:
         log_request(logger, "POST", "/api/pedidos", 400, None)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
@@ -54,27 +109,372 @@ async def crear_pedido(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error creando pedido")
 
 
+@router.get("/eventos", tags=["Pedidos"])
+async def eventos_cliente(request: Request):
+    """
+    Stream de Server-Sent Events con los cambios de todos los pedidos
+    del cliente autenticado. Reemplaza el polling de GET /api/pedidos/{pedido_id}.
+    Requiere autenticación JWT en el header Authorization.
+    """
+    token_data = await verify_jwt_in_request(request)
+    cliente_id = token_data.get("sub")
+    
+    cola = broker.suscribir_cliente(cliente_id)
+    log_request(logger, "GET", "/api/pedidos/eventos", 200, cliente_id)
+    return StreamingResponse(generar_sse(request, cola), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.get("/seguimiento/{numero_pedido}", response_model=SeguimientoPedidoResponse, tags=["Seguimiento"])
+async def seguimiento_pedido(
+    numero_pedido: str,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """
+    Seguimiento público de un pedido por su número (no requiere JWT).
+    Devuelve solo estado, ciudad y fechas. Limitado por IP.
+    """
+    ip = client_ip(request)
+    if not limitador_seguimiento.allow(ip):
+        log_request(logger, "GET", f"/api/pedidos/seguimiento/{numero_pedido}", 429, None)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiadas solicitudes de seguimiento",
+            headers={"Retry-After": str(limitador_seguimiento.retry_after())}
+        )
+    
+    try:
+        seguimiento = PedidoService.obtener_seguimiento(db, numero_pedido)
+        
+        if not seguimiento:
+            raise ValueError("Pedido no encontrado")
+        
+        response.headers["Cache-Control"] = "public, max-age=10"
+        log_request(logger, "GET", f"/api/pedidos/seguimiento/{numero_pedido}", 200, None)
+        return seguimiento
+    except ValueError as e:
+        log_request(logger, "GET", f"/api/pedidos/seguimiento/{numero_pedido}", 404, None)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    except Exception as e:
+        log_request(logger, "GET", f"/api/pedidos/seguimiento/{numero_pedido}", 500, None)
+        logger.error(f"Error obteniendo seguimiento: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error obteniendo seguimiento")
+
+
+@router.get("/estadisticas", tags=["Estadisticas"])
+async def estadisticas_pedidos(
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Conteo de pedidos por estado y ciudad desde la tabla resumen
+    mantenida incrementalmente (no recorre la tabla de pedidos).
+    Solo supervisores y administradores.
+    """
+    try:
+        token_data = await verify_jwt_in_request(request)
+        user_id = token_data.get("sub")
+        user_role = token_data.get("role", "").upper()
+        
+        if user_role not in ["SUPERVISOR", "ADMIN"]:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo supervisores pueden consultar estadísticas")
+        
+        estadisticas = obtener_estadisticas(db)
+        log_request(logger, "GET", "/api/pedidos/estadisticas", 200, user_id)
+        return estadisticas
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_request(logger, "GET", "/api/pedidos/estadisticas", 500, None)
+        logger.error(f"Error obteniendo estadísticas: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error obteniendo estadísticas")
+
+
+@router.get("/estadisticas/tiempos", tags=["Estadisticas"])
+async def tiempos_en_estado(
+    request: Request,
+    ciudad: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Percentiles (p50, p90, p95, p99) del tiempo que los pedidos pasan en
+    cada estado, por ciudad, en segundos. Se calculan sobre un histograma
+    mantenido en cada transición, no sobre el historial completo.
+    Solo supervisores y administradores.
+    """
+    try:
+        token_data = await verify_jwt_in_request(request)
+        user_id = token_data.get("sub")
+        user_role = token_data.get("role", "").upper()
+        
+        if user_role not in ["SUPERVISOR", "ADMIN"]:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo supervisores pueden consultar estadísticas")
+        
+        tiempos = obtener_tiempos_estado(db, ciudad)
+        log_request(logger, "GET", "/api/pedidos/estadisticas/tiempos", 200, user_id)
+        return tiempos
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_request(logger, "GET", "/api/pedidos/estadisticas/tiempos", 500, None)
+        logger.error(f"Error obteniendo tiempos en estado: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error obteniendo tiempos en estado")
+
+
+@router.get("/estadisticas/mapa-calor", tags=["Estadisticas"])
+async def mapa_calor(
+    request: Request,
+    ciudad: str,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+    celda_m: int = Query(500, ge=100, le=5000),
+    db: Session = Depends(get_db)
+):
+    """
+    Pedidos por celda de celda_m metros en la ciudad, creados entre desde y
+    hasta (por defecto los últimos 7 días; se redondea a horas completas).
+    Solo celdas con pedidos, de mayor a menor. Solo supervisores.
+    """
+    try:
+        token_data = await verify_jwt_in_request(request)
+        user_id = token_data.get("sub")
+        user_role = token_data.get("role", "").upper()
+        
+        if user_role not in ["SUPERVISOR", "ADMIN"]:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo supervisores pueden consultar estadísticas")
+        
+        # El cálculo recorre muchas filas; no bloquear el event loop
+        mapa = await run_in_threadpool(obtener_mapa_calor, db, ciudad, desde, hasta, celda_m)
+        log_request(logger, "GET", "/api/pedidos/estadisticas/mapa-calor", 200, user_id)
+        return mapa
+    except ValueError as e:
+        log_request(logger, "GET", "/api/pedidos/estadisticas/mapa-calor", 400, None)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_request(logger, "GET", "/api/pedidos/estadisticas/mapa-calor", 500, None)
+        logger.error(f"Error calculando mapa de calor: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error calculando mapa de calor")
+
+
+@router.post("/estadisticas/reconciliar", tags=["Estadisticas"])
+async def reconciliar_estadisticas(
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Reconstruye la tabla resumen de estadísticas desde cero.
+    Solo administradores.
+    """
+    try:
+        token_data = await verify_jwt_in_request(request)
+        user_id = token_data.get("sub")
+        user_role = token_data.get("role", "").upper()
+        
+        if user_role != "ADMIN":
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo administradores pueden reconciliar estadísticas")
+        
+        filas = reconstruir_estadisticas(db)
+        buckets = reconstruir_tiempos(db)
+        log_request(logger, "POST", "/api/pedidos/estadisticas/reconciliar", 200, user_id)
+        return {"message": "Estadísticas reconstruidas", "combinaciones": filas, "buckets_tiempos": buckets}
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        log_request(logger, "POST", "/api/pedidos/estadisticas/reconciliar", 500, None)
+        logger.error(f"Error reconciliando estadísticas: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error reconciliando estadísticas")
+
+
+@router.get("/busqueda", response_model=list[ResultadoBusquedaPedido], tags=["Pedidos"])
+async def buscar(
+    request: Request,
+    q: str = Query(..., min_length=3, max_length=100),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """
+    Busca pedidos activos por nombre o teléfono del destinatario o por
+    parte de la dirección, tolerando errores de escritura.
+    Resultados ordenados por relevancia. Solo supervisores.
+    """
+    try:
+        token_data = await verify_jwt_in_request(request)
+        user_id = token_data.get("sub")
+        user_role = token_data.get("role", "").upper()
+        
+        if user_role not in ["SUPERVISOR", "ADMIN"]:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo supervisores pueden buscar pedidos")
+        
+        resultados = buscar_pedidos(db, q, skip, limit)
+        log_request(logger, "GET", "/api/pedidos/busqueda", 200, user_id)
+        return [{"pedido": pedido, "puntaje": puntaje} for pedido, puntaje in resultados]
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_request(logger, "GET", "/api/pedidos/busqueda", 500, None)
+        logger.error(f"Error buscando pedidos: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error buscando pedidos")
+
+
+@router.get("/compatibles", response_model=list[PedidoResponse], tags=["Pedidos"])
+async def pedidos_compatibles(
+    request: Request,
+    capacidad_kg: float = Query(..., gt=0),
+    volumen_m3: Optional[float] = Query(None, gt=0),
+    ciudad: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    """
+    Pedidos pendientes sin repartidor que caben en un vehículo
+    (`capacidad_kg` y `volumen_m3` del vehículo). Solo supervisores.
+    """
+    try:
+        token_data = await verify_jwt_in_request(request)
+        user_id = token_data.get("sub")
+        user_role = token_data.get("role", "").upper()
+        
+        if user_role not in ["SUPERVISOR", "ADMIN"]:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo supervisores pueden asignar pedidos")
+        
+        pedidos = PedidoService.obtener_pedidos_para_capacidad(db, capacidad_kg, volumen_m3, ciudad, skip, limit)
+        log_request(logger, "GET", "/api/pedidos/compatibles", 200, user_id)
+        return pedidos
+    except HTTPException:
+        raise
+    except Exception as e:
+        log_request(logger, "GET", "/api/pedidos/compatibles", 500, None)
+        logger.error(f"Error obteniendo pedidos compatibles: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error obteniendo pedidos compatibles")
+
+
+@router.post("/lote/transicion", response_model=TransicionLoteResponse, tags=["Pedidos"])
+async def transicionar_lote(
+    lote_data: TransicionLoteRequest,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Cambia estado y/o repartidor de varios pedidos en una sola transacción.
+    Solo supervisores. Los pedidos cuyo estado no permite la transición se
+    devuelven en **rechazados** con el motivo; los que ya estaban en el
+    estado pedido, en **omitidos** (no se modifican).
+    """
+    try:
+        token_data = await verify_jwt_in_request(request)
+        user_id = token_data.get("sub")
+        user_role = token_data.get("role", "").upper()
+        
+        if user_role not in ["SUPERVISOR", "ADMIN"]:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Solo supervisores pueden actualizar pedidos")
+        
+        actualizados, rechazados, omitidos = PedidoService.transicionar_lote(
+            db, lote_data.ids, lote_data.estado, lote_data.repartidor_id
+        )
+        log_request(logger, "POST", "/api/pedidos/lote/transicion", 200, user_id)
+        return {"actualizados": actualizados, "rechazados": rechazados, "omitidos": omitidos}
+    except ValueError as e:
+        log_request(logger, "POST", "/api/pedidos/lote/transicion", 400, None)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        log_request(logger, "POST", "/api/pedidos/lote/transicion", 500, None)
+        logger.error(f"Error en transición por lote: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error en transición por lote")
+
+
+@router.get("/{pedido_id}/eventos", tags=["Pedidos"])
+async def eventos_pedido(
+    pedido_id: str,
+    request: Request
+):
+    """
+    Stream de Server-Sent Events con los cambios de estado de un pedido.
+    El primer evento es el estado actual; el stream se cierra al llegar
+    a ENTREGADO o CANCELADO. Un cliente solo puede seguir sus propios
+    pedidos; supervisores y administradores, cualquiera.
+    Requiere autenticación JWT en el header Authorization.
+    """
+    token_data = await verify_jwt_in_request(request)
+    user_id = token_data.get("sub")
+    user_role = token_data.get("role", "").upper()
+    
+    # Sesión propia y cerrada de inmediato: el stream no debe retener una conexión a BD
+    db = SessionLocal()
+    cola = None
+    try:
+        pedido = PedidoService.obtener_pedido(db, pedido_id)
+        # Como en el listado por ids: un cliente solo ve sus pedidos; un pedido ajeno es 404
+        if pedido is not None and user_role not in ["SUPERVISOR", "ADMIN"] and pedido.cliente_id != user_id:
+            pedido = None
+        if pedido is not None:
+            # Suscribir antes de releer el estado inicial para no perder cambios intermedios
+            cola = broker.suscribir_pedido(pedido_id)
+            db.refresh(pedido)
+            inicial = evento_desde_pedido(pedido)
+    except Exception as e:
+        if cola is not None:
+            broker.desuscribir(cola)
+        log_request(logger, "GET", f"/api/pedidos/{pedido_id}/eventos", 500, None)
+        logger.error(f"Error abriendo stream de pedido: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error abriendo stream de pedido")
+    finally:
+        db.close()
+    
+    if pedido is None:
+        log_request(logger, "GET", f"/api/pedidos/{pedido_id}/eventos", 404, user_id)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Pedido no encontrado")
+    
+    log_request(logger, "GET", f"/api/pedidos/{pedido_id}/eventos", 200, user_id)
+    return StreamingResponse(
+        generar_sse(request, cola, inicial, cerrar_en_estado_final=True),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
 @router.get("/{pedido_id}", response_model=PedidoResponse, tags=["Pedidos"])
 async def obtener_pedido(
     pedido_id: str,
     request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """
     Obtiene los detalles de un pedido específico.
     Requiere autenticación JWT en el header Authorization.
+    Soporta GET condicional: con If-None-Match responde 304 si el pedido no cambió.
     """
     try:
         # Verificar JWT
         token_data = await verify_jwt_in_request(request)
         user_id = token_data.get("sub")
         
+        # GET condicional: validar el ETag sin cargar la fila completa
+        if request.headers.get("If-None-Match"):
+            marca = PedidoService.obtener_marca_pedido(db, pedido_id)
+            if not marca:
+                raise ValueError("Pedido no encontrado")
+            etag = compute_etag(pedido_id, *marca)
+            if etag_matches(request, etag):
+                log_request(logger, "GET", f"/api/pedidos/{pedido_id}", 304, user_id)
+                return not_modified(etag)
+        
         # Obtener pedido
         pedido = PedidoService.obtener_pedido(db, pedido_id)
         
         if not pedido:
             raise ValueError("Pedido no encontrado")
         
+        set_cache_headers(response, compute_etag(pedido_id, pedido.version, pedido.updated_at))
         log_request(logger, "GET", f"/api/pedidos/{pedido_id}", 200, user_id)
         return pedido
     except ValueError as e:
@@ -92,6 +492,7 @@ async def obtener_pedido(
 async def listar_pedidos(
     skip: int = 0,
     limit: int = 10,
+    ids: Optional[str] = None,
     request: Request = None,
     db: Session = Depends(get_db)
 ):
@@ -99,16 +500,34 @@ async def listar_pedidos(
     Lista todos los pedidos del cliente autenticado.
     Requiere autenticación JWT en el header Authorization.
     Parámetros opcionales: skip (desplazamiento), limit (límite de resultados)
+    
+    - **ids**: lista de IDs separados por coma (máximo MAX_IDS_POR_CONSULTA);
+      devuelve esos pedidos en el orden pedido con una sola consulta. Los clientes
+      solo reciben sus propios pedidos; supervisores y administradores, todos.
     """
     try:
         # Verificar JWT
         token_data = await verify_jwt_in_request(request)
         cliente_id = token_data.get("sub")
         
+        if ids is not None:
+            lista_ids = [pedido_id.strip() for pedido_id in ids.split(",") if pedido_id.strip()]
+            if len(lista_ids) > MAX_IDS_POR_CONSULTA:
+                raise ValueError(f"Se permiten como máximo {MAX_IDS_POR_CONSULTA} ids por consulta")
+            
+            user_role = token_data.get("role", "").upper()
+            propietario = None if user_role in ["SUPERVISOR", "ADMIN"] else cliente_id
+            pedidos = PedidoService.obtener_pedidos_por_ids(db, lista_ids, propietario)
+            log_request(logger, "GET", "/api/pedidos?ids", 200, cliente_id)
+            return pedidos
+        
         # Obtener pedidos del cliente
         pedidos = PedidoService.obtener_pedidos_cliente(db, cliente_id, skip, limit)
         log_request(logger, "GET", "/api/pedidos", 200, cliente_id)
         return pedidos
+    except ValueError as e:
+        log_request(logger, "GET", "/api/pedidos", 400, None)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
@@ -129,9 +548,10 @@ async def actualizar_pedido(
     Requiere autenticación JWT en el header Authorization.
     Solo supervisores pueden actualizar estado y repartidor.
     
-    - **estado**: Nuevo estado del pedido
+    - **estado**: Nuevo estado del pedido (debe ser una transición válida)
     - **repartidor_id**: ID del repartidor asignado
     - **factura_id**: ID de la factura
+    - **version**: Versión leída del pedido; responde 409 si fue modificado
     """
     try:
         # Verificar JWT
@@ -147,6 +567,9 @@ async def actualizar_pedido(
         pedido = PedidoService.actualizar_pedido(db, pedido_id, pedido_data)
         log_request(logger, "PATCH", f"/api/pedidos/{pedido_id}", 200, user_id)
         return pedido
+    except ConflictoPedidoError as e:
+        log_request(logger, "PATCH", f"/api/pedidos/{pedido_id}", 409, None)
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except ValueError as e:
         log_request(logger, "PATCH", f"/api/pedidos/{pedido_id}", 404, None)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
@@ -177,9 +600,12 @@ async def cancelar_pedido(
         cliente_id = token_data.get("sub")
         
         # Cancelar pedido
-        pedido = PedidoService.cancelar_pedido(db, pedido_id, cancel_data.motivo)
+        pedido = PedidoService.cancelar_pedido(db, pedido_id, cancel_data.motivo, cancel_data.version)
         log_request(logger, "DELETE", f"/api/pedidos/{pedido_id}", 200, cliente_id)
         return {"message": "Pedido cancelado exitosamente", "pedido_id": pedido_id}
+    except ConflictoPedidoError as e:
+        log_request(logger, "DELETE", f"/api/pedidos/{pedido_id}", 409, None)
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
     except ValueError as e:
         log_request(logger, "DELETE", f"/api/pedidos/{pedido_id}", 404, None)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
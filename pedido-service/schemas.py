@@ -3,6 +3,12 @@ from pydantic import BaseModel, Field, EmailStr
 from enum import Enum
 from typing import Optional
 from datetime import datetime
+import sys
+import os
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from shared.ids import ID_PATTERN
 
 
 class EstadoPedidoEnum(str, Enum):
@@ -60,20 +66,52 @@ class CreatePedidoRequest(BaseModel):
 class UpdatePedidoRequest(BaseModel):
     """Esquema para actualización parcial de pedido"""
     estado: Optional[EstadoPedidoEnum] = None
-    repartidor_id: Optional[str] = None
-    factura_id: Optional[str] = None
+    repartidor_id: Optional[str] = Field(None, pattern=ID_PATTERN)
+    factura_id: Optional[str] = Field(None, pattern=ID_PATTERN)
     latitud: Optional[float] = None
     longitud: Optional[float] = None
+    version: Optional[int] = Field(None, ge=1)
     
     class Config:
         json_schema_extra = {
             "example": {
                 "estado": "CONFIRMADO",
-                "repartidor_id": "550e8400-e29b-41d4-a716-446655440000"
+                "repartidor_id": "550e8400-e29b-41d4-a716-446655440000",
+                "version": 1
             }
         }
 
 
+class TransicionLoteRequest(BaseModel):
+    """Esquema para cambiar estado y/o repartidor de varios pedidos"""
+    ids: list[str] = Field(..., min_length=1, max_length=500)
+    estado: Optional[EstadoPedidoEnum] = None
+    repartidor_id: Optional[str] = Field(None, pattern=ID_PATTERN)
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "ids": ["550e8400-e29b-41d4-a716-446655440000", "550e8400-e29b-41d4-a716-446655440001"],
+                "estado": "EN_RUTA",
+                "repartidor_id": "550e8400-e29b-41d4-a716-446655440002"
+            }
+        }
+
+
+class RechazoLote(BaseModel):
+    """Pedido no actualizado en una operación por lote"""
+    id: str
+    motivo: str
+
+
+class TransicionLoteResponse(BaseModel):
+    """Resultado de una transición por lote"""
+    actualizados: list[str]
+    rechazados: list[RechazoLote]
+    # Ya estaban en el estado destino: sin cambios, sin evento ni historial
+    omitidos: list[str] = []
+
+
 class PedidoResponse(BaseModel):
     """Esquema de respuesta de pedido"""
     id: str
@@ -89,12 +127,19 @@ class PedidoResponse(BaseModel):
     descripcion: Optional[str]
     peso_kg: float
     dimensiones: Optional[str]
+    largo_cm: Optional[float] = None
+    ancho_cm: Optional[float] = None
+    alto_cm: Optional[float] = None
+    volumen_m3: Optional[float] = None
+    peso_volumetrico_kg: Optional[float] = None
     valor_declarado: float
     destinatario_nombre: str
     destinatario_telefono: Optional[str]
     destinatario_email: Optional[str]
     repartidor_id: Optional[str]
     factura_id: Optional[str]
+    posible_duplicado_de: Optional[str] = None
+    version: int
     created_at: datetime
     updated_at: datetime
     cancelled_at: Optional[datetime]
@@ -103,9 +148,26 @@ class PedidoResponse(BaseModel):
         from_attributes = True
 
 
+class SeguimientoPedidoResponse(BaseModel):
+    """Proyección pública de un pedido para seguimiento por número"""
+    numero_pedido: str
+    estado: EstadoPedidoEnum
+    ciudad: str
+    created_at: datetime
+    updated_at: datetime
+    cancelled_at: Optional[datetime]
+
+
+class ResultadoBusquedaPedido(BaseModel):
+    """Pedido encontrado por la búsqueda y su relevancia (0 a 1)"""
+    pedido: PedidoResponse
+    puntaje: float
+
+
 class CancelPedidoRequest(BaseModel):
     """Esquema para cancelar pedido"""
     motivo: str = Field(..., min_length=5, max_length=500)
+    version: Optional[int] = Field(None, ge=1)
     
     class Config:
         json_schema_extra = {
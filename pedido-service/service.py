@@ -1,23 +1,23 @@
 """Servicios de negocio para PedidoService"""
-import uuid
-from datetime import datetime
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 import sys
 import os
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from pedido_service.models import Pedido, EstadoPedidoEnum, TipoEntregaEnum
+from pedido_service.models import Pedido, PedidoArchivado, EstadoPedidoEnum, TipoEntregaEnum
 from pedido_service.schemas import CreatePedidoRequest, UpdatePedidoRequest
-
-
-CIUDADES_COBERTURA = {
-    "Bogotá": {"latitud_min": 4.5, "latitud_max": 4.9, "longitud_min": -74.3, "longitud_max": -73.8},
-    "Medellín": {"latitud_min": 6.1, "latitud_max": 6.3, "longitud_min": -75.6, "longitud_max": -75.4},
-    "Cali": {"latitud_min": 3.3, "latitud_max": 3.5, "longitud_min": -76.6, "longitud_max": -76.4},
-    "Barranquilla": {"latitud_min": 10.9, "latitud_max": 11.1, "longitud_min": -74.8, "longitud_max": -74.6},
-    "Cartagena": {"latitud_min": 10.3, "latitud_max": 10.5, "longitud_min": -75.5, "longitud_max": -75.3},
-}
+from pedido_service.eventos import broker, evento_desde_pedido
+from pedido_service.estadisticas import ajustar_contador, ajustar_contadores, registrar_transicion
+from pedido_service.dimensiones import calcular_medidas
+from pedido_service.historial import registrar_entrada, registrar_cambios_estado
+from pedido_service.duplicados import huellas_pedido, DUPLICADOS_MODO, DUPLICADOS_VENTANA_SEGUNDOS
+from shared.cobertura import CIUDADES_COBERTURA
+from shared.ids import new_id, require_id, short_code
+from shared.ttl_cache import TTLCache
 
 
 def validar_cobertura_geografica(ciudad: str, latitud: float = None, longitud: float = None) -> bool:
@@ -33,11 +33,61 @@ def validar_cobertura_geografica(ciudad: str, latitud: float = None, longitud: f
             limites["longitud_min"] <= longitud <= limites["longitud_max"])
 
 
+# Máquina de estados del pedido: estado actual -> estados destino permitidos
+TRANSICIONES_PERMITIDAS = {
+    EstadoPedidoEnum.RECIBIDO: {EstadoPedidoEnum.CONFIRMADO, EstadoPedidoEnum.CANCELADO},
+    EstadoPedidoEnum.CONFIRMADO: {EstadoPedidoEnum.EN_PREPARACION, EstadoPedidoEnum.CANCELADO},
+    EstadoPedidoEnum.EN_PREPARACION: {EstadoPedidoEnum.LISTO_PARA_ENTREGA, EstadoPedidoEnum.CANCELADO},
+    EstadoPedidoEnum.LISTO_PARA_ENTREGA: {EstadoPedidoEnum.EN_RUTA, EstadoPedidoEnum.CANCELADO},
+    EstadoPedidoEnum.EN_RUTA: {EstadoPedidoEnum.ENTREGADO, EstadoPedidoEnum.CANCELADO},
+    EstadoPedidoEnum.ENTREGADO: set(),
+    EstadoPedidoEnum.CANCELADO: set(),
+}
+
+# Estados en los que un pedido espera repartidor (coinciden con ix_pedidos_pendientes_volumen_peso)
+ESTADOS_ASIGNABLES = [
+    EstadoPedidoEnum.CONFIRMADO, EstadoPedidoEnum.EN_PREPARACION, EstadoPedidoEnum.LISTO_PARA_ENTREGA
+]
+
+
+# Caché del seguimiento público; el TTL acota la desactualización entre réplicas
+SEGUIMIENTO_TTL_SEGUNDOS = int(os.getenv("SEGUIMIENTO_TTL_SEGUNDOS", "30"))
+cache_seguimiento = TTLCache(ttl_seconds=SEGUIMIENTO_TTL_SEGUNDOS, max_entries=50_000)
+
+
+class ConflictoPedidoError(Exception):
+    """El pedido cambió concurrentemente o la transición de estado no es válida"""
+    pass
+
+
+class PedidoDuplicadoError(ConflictoPedidoError):
+    """El pedido coincide con otro creado recientemente por el mismo cliente"""
+    
+    def __init__(self, original_id: str, numero_pedido: str):
+        super().__init__(f"Pedido duplicado de {numero_pedido} ({original_id})")
+        self.original_id = original_id
+
+
+def validar_transicion(estado_actual: EstadoPedidoEnum, estado_nuevo: EstadoPedidoEnum):
+    """Valida una transición de estado según TRANSICIONES_PERMITIDAS"""
+    estado_actual = EstadoPedidoEnum(estado_actual)
+    estado_nuevo = EstadoPedidoEnum(estado_nuevo)
+    if estado_actual == estado_nuevo:
+        return
+    if estado_nuevo not in TRANSICIONES_PERMITIDAS[estado_actual]:
+        raise ConflictoPedidoError(
+            f"Transición de estado inválida: {estado_actual.value} -> {estado_nuevo.value}"
+        )
+
+
 class PedidoService:
     
     @staticmethod
     def crear_pedido(db: Session, cliente_id: str, pedido_data: CreatePedidoRequest) -> Pedido:
         """Crea un nuevo pedido con validación transaccional"""
+        # cliente_id viene del `sub` del token: un valor que no es UUID no se guarda
+        cliente_id = require_id(cliente_id, "cliente_id")
+        
         # Validar cobertura geográfica
         if not validar_cobertura_geografica(pedido_data.ciudad, pedido_data.latitud, pedido_data.longitud):
             raise ValueError(f"La ciudad {pedido_data.ciudad} no está en cobertura")
@@ -46,11 +96,20 @@ class PedidoService:
         if pedido_data.tipo_entrega not in [e.value for e in TipoEntregaEnum]:
             raise ValueError("Tipo de entrega inválido")
         
+        # Huella para detectar reenvíos del mismo pedido con otro cuerpo o clave
+        huella, huella_anterior = huellas_pedido(
+            cliente_id, pedido_data.destinatario_nombre, pedido_data.direccion,
+            pedido_data.ciudad, pedido_data.peso_kg
+        )
+        original = PedidoService.buscar_duplicado(db, [huella, huella_anterior])
+        if original is not None and DUPLICADOS_MODO == "RECHAZAR":
+            raise PedidoDuplicadoError(original.id, original.numero_pedido)
+        
         # Crear pedido
         pedido = Pedido(
-            id=str(uuid.uuid4()),
+            id=new_id(),
             cliente_id=cliente_id,
-            numero_pedido=f"PED-{int(datetime.utcnow().timestamp())}-{uuid.uuid4().hex[:8].upper()}",
+            numero_pedido=f"PED-{short_code()}",
             estado=EstadoPedidoEnum.RECIBIDO,
             tipo_entrega=pedido_data.tipo_entrega,
             direccion=pedido_data.direccion,
@@ -61,27 +120,128 @@ class PedidoService:
             descripcion=pedido_data.descripcion,
             peso_kg=pedido_data.peso_kg,
             dimensiones=pedido_data.dimensiones,
+            **calcular_medidas(pedido_data.dimensiones),
             valor_declarado=pedido_data.valor_declarado,
             destinatario_nombre=pedido_data.destinatario_nombre,
             destinatario_telefono=pedido_data.destinatario_telefono,
-            destinatario_email=pedido_data.destinatario_email
+            destinatario_email=pedido_data.destinatario_email,
+            huella=huella,
+            posible_duplicado_de=original.id if original is not None else None
         )
         
         db.add(pedido)
+        ajustar_contador(db, pedido.ciudad, pedido.estado, 1)
+        registrar_entrada(db, pedido.id, pedido.estado)
         db.commit()
         db.refresh(pedido)
         
         return pedido
     
+    @staticmethod
+    def buscar_duplicado(db: Session, huellas: list):
+        """
+        Pedido no cancelado con alguna de las huellas dentro de la ventana de
+        duplicados, o None. Usa el índice de huella; no recorre pedidos recientes.
+        """
+        desde = datetime.now(timezone.utc) - timedelta(seconds=DUPLICADOS_VENTANA_SEGUNDOS)
+        return db.query(Pedido.id, Pedido.numero_pedido).filter(
+            Pedido.huella.in_(huellas),
+            Pedido.created_at >= desde,
+            Pedido.estado != EstadoPedidoEnum.CANCELADO
+        ).order_by(Pedido.created_at).first()
+    
     @staticmethod
     def obtener_pedido(db: Session, pedido_id: str) -> Pedido:
-        """Obtiene un pedido por ID"""
-        return db.query(Pedido).filter(Pedido.id == pedido_id).first()
+        """Obtiene un pedido por ID; si no está en la tabla activa lo busca en el archivo"""
+        pedido = db.query(Pedido).filter(Pedido.id == pedido_id).first()
+        if pedido is None:
+            pedido = db.query(PedidoArchivado).filter(PedidoArchivado.id == pedido_id).first()
+        return pedido
+    
+    @staticmethod
+    def obtener_marca_pedido(db: Session, pedido_id: str):
+        """Obtiene solo (version, updated_at) de un pedido para validar ETags"""
+        marca = db.query(Pedido.version, Pedido.updated_at).filter(Pedido.id == pedido_id).first()
+        if marca is None:
+            marca = db.query(PedidoArchivado.version, PedidoArchivado.updated_at).filter(
+                PedidoArchivado.id == pedido_id
+            ).first()
+        return marca
     
     @staticmethod
     def obtener_pedido_por_numero(db: Session, numero_pedido: str) -> Pedido:
-        """Obtiene un pedido por número de pedido"""
-        return db.query(Pedido).filter(Pedido.numero_pedido == numero_pedido).first()
+        """Obtiene un pedido por número de pedido, incluyendo el archivo"""
+        pedido = db.query(Pedido).filter(Pedido.numero_pedido == numero_pedido).first()
+        if pedido is None:
+            pedido = db.query(PedidoArchivado).filter(PedidoArchivado.numero_pedido == numero_pedido).first()
+        return pedido
+    
+    @staticmethod
+    def obtener_seguimiento(db: Session, numero_pedido: str):
+        """Proyección reducida para seguimiento público, servida desde caché"""
+        seguimiento = cache_seguimiento.get(numero_pedido)
+        if seguimiento is not None:
+            return seguimiento
+        
+        for modelo in (Pedido, PedidoArchivado):
+            fila = db.query(
+                modelo.numero_pedido, modelo.estado, modelo.ciudad,
+                modelo.created_at, modelo.updated_at, modelo.cancelled_at
+            ).filter(modelo.numero_pedido == numero_pedido).first()
+            if fila:
+                break
+        else:
+            return None
+        
+        seguimiento = dict(fila._mapping)
+        cache_seguimiento.set(numero_pedido, seguimiento)
+        return seguimiento
+    
+    @staticmethod
+    def obtener_pedidos_por_ids(db: Session, pedido_ids: list, cliente_id: str = None) -> list:
+        """
+        Obtiene varios pedidos con una consulta IN, en el orden solicitado.
+        Si se indica cliente_id solo se devuelven los pedidos de ese cliente.
+        Los IDs no encontrados en la tabla activa se buscan en el archivo.
+        """
+        # Los IDs de la BD vuelven en forma canónica (minúsculas)
+        pedido_ids = list(dict.fromkeys(pedido_id.lower() for pedido_id in pedido_ids))
+        if not pedido_ids:
+            return []
+        
+        encontrados = {}
+        for modelo in (Pedido, PedidoArchivado):
+            pendientes = [pedido_id for pedido_id in pedido_ids if pedido_id not in encontrados]
+            if not pendientes:
+                break
+            consulta = db.query(modelo).filter(modelo.id.in_(pendientes))
+            if cliente_id is not None:
+                consulta = consulta.filter(modelo.cliente_id == cliente_id)
+            for pedido in consulta.all():
+                encontrados[pedido.id] = pedido
+        
+        return [encontrados[pedido_id] for pedido_id in pedido_ids if pedido_id in encontrados]
+    
+    @staticmethod
+    def obtener_pedidos_para_capacidad(db: Session, capacidad_kg: float, volumen_m3: float = None,
+                                       ciudad: str = None, skip: int = 0, limit: int = 50):
+        """
+        Pedidos pendientes y sin repartidor que caben en un vehículo con la
+        capacidad indicada (peso real y, si se conoce, volumen).
+        Los pedidos sin dimensiones solo se consideran cuando no se filtra por volumen.
+        """
+        consulta = db.query(Pedido).filter(
+            Pedido.repartidor_id.is_(None),
+            Pedido.estado.in_(ESTADOS_ASIGNABLES),
+            Pedido.peso_kg <= capacidad_kg
+        )
+        if volumen_m3 is not None:
+            consulta = consulta.filter(Pedido.volumen_m3 <= volumen_m3)
+        if ciudad is not None:
+            consulta = consulta.filter(Pedido.ciudad == ciudad)
+        
+        return consulta.order_by(Pedido.volumen_m3.desc().nulls_last(), Pedido.peso_kg.desc()) \
+            .offset(skip).limit(limit).all()
     
     @staticmethod
     def obtener_pedidos_cliente(db: Session, cliente_id: str, skip: int = 0, limit: int = 10):
@@ -93,33 +253,159 @@ class PedidoService:
         """Obtiene todos los pedidos (para supervisores)"""
         return db.query(Pedido).offset(skip).limit(limit).all()
     
+    @staticmethod
+    def _aplicar_cambios(db: Session, pedido: Pedido, version: int, cambios: dict) -> Pedido:
+        """
+        Aplica cambios con compare-and-set sobre la columna version.
+        No mantiene bloqueos de fila: si otra transacción modificó el pedido
+        después de la lectura, el UPDATE no afecta filas y se lanza conflicto.
+        """
+        pedido_id = pedido.id
+        estado_anterior = pedido.estado
+        cambios = dict(cambios)
+        cambios[Pedido.version] = Pedido.version + 1
+        
+        filas = db.query(Pedido).filter(
+            Pedido.id == pedido_id,
+            Pedido.version == version
+        ).update(cambios, synchronize_session=False)
+        
+        if filas == 0:
+            db.rollback()
+            raise ConflictoPedidoError("El pedido fue modificado por otra operación, vuelva a consultarlo")
+        
+        # El compare-and-set garantiza que estado_anterior es el estado real de la fila
+        if Pedido.estado in cambios:
+            registrar_transicion(db, pedido.ciudad, estado_anterior, cambios[Pedido.estado])
+            registrar_cambios_estado(db, [(pedido_id, pedido.ciudad, estado_anterior, cambios[Pedido.estado])])
+        
+        db.commit()
+        
+        pedido = db.query(Pedido).filter(Pedido.id == pedido_id).populate_existing().first()
+        
+        # Notificar a los suscriptores SSE y descartar el seguimiento cacheado
+        broker.publicar(evento_desde_pedido(pedido))
+        cache_seguimiento.invalidate(pedido.numero_pedido)
+        
+        return pedido
+    
     @staticmethod
     def actualizar_pedido(db: Session, pedido_id: str, pedido_data: UpdatePedidoRequest) -> Pedido:
-        """Actualiza parcialmente un pedido con transacción ACID"""
+        """Actualiza parcialmente un pedido con control de concurrencia optimista"""
         pedido = db.query(Pedido).filter(Pedido.id == pedido_id).first()
         
         if not pedido:
             raise ValueError("Pedido no encontrado")
         
-        # Actualizar solo los campos proporcionados
-        if pedido_data.estado is not None:
-            pedido.estado = pedido_data.estado
+        # La versión enviada por el cliente tiene prioridad sobre la leída
+        version = pedido_data.version if pedido_data.version is not None else pedido.version
+        if version != pedido.version:
+            raise ConflictoPedidoError("El pedido fue modificado por otra operación, vuelva a consultarlo")
+        
+        # Actualizar solo los campos proporcionados; repetir el estado actual no es un cambio
+        # (no sube la versión ni publica evento)
+        cambios = {}
+        if pedido_data.estado is not None and pedido_data.estado != pedido.estado:
+            validar_transicion(pedido.estado, pedido_data.estado)
+            cambios[Pedido.estado] = pedido_data.estado
+            if pedido_data.estado == EstadoPedidoEnum.CANCELADO:
+                cambios[Pedido.cancelled_at] = datetime.utcnow()
         if pedido_data.repartidor_id is not None:
-            pedido.repartidor_id = pedido_data.repartidor_id
+            cambios[Pedido.repartidor_id] = pedido_data.repartidor_id
         if pedido_data.factura_id is not None:
-            pedido.factura_id = pedido_data.factura_id
+            cambios[Pedido.factura_id] = pedido_data.factura_id
         if pedido_data.latitud is not None:
-            pedido.latitud = pedido_data.latitud
+            cambios[Pedido.latitud] = pedido_data.latitud
         if pedido_data.longitud is not None:
-            pedido.longitud = pedido_data.longitud
+            cambios[Pedido.longitud] = pedido_data.longitud
+        
+        if not cambios:
+            return pedido
+        
+        return PedidoService._aplicar_cambios(db, pedido, version, cambios)
+    
+    @staticmethod
+    def transicionar_lote(db: Session, pedido_ids: list, estado: EstadoPedidoEnum = None,
+                          repartidor_id: str = None) -> tuple[list, list, list]:
+        """
+        Aplica un cambio de estado y/o repartidor a un conjunto de pedidos con un
+        único UPDATE ... FROM. Solo se actualizan las filas cuyo estado actual
+        permite la transición: las que ya están en el estado destino se omiten
+        sin tocarlas y los pedidos finalizados nunca se modifican. Retorna
+        (ids_actualizados, rechazos, ids_omitidos).
+        """
+        if estado is None and repartidor_id is None:
+            raise ValueError("Debe indicar estado o repartidor_id")
+        
+        pedido_ids = list(dict.fromkeys(pedido_id.lower() for pedido_id in pedido_ids))
+        tabla = Pedido.__table__
+        
+        if estado is not None:
+            estado = EstadoPedidoEnum(estado)
+            origenes = [origen for origen, destinos in TRANSICIONES_PERMITIDAS.items() if estado in destinos]
+        else:
+            origenes = [origen for origen, destinos in TRANSICIONES_PERMITIDAS.items() if destinos]
+        
+        # Estado previo de cada fila bloqueada, para RETURNING y estadísticas
+        anteriores = select(tabla.c.id, tabla.c.estado.label("estado_anterior")).where(
+            tabla.c.id.in_(pedido_ids),
+            tabla.c.estado.in_(origenes)
+        ).with_for_update().subquery("anteriores")
+        
+        valores = {"version": tabla.c.version + 1}
+        if estado is not None:
+            valores["estado"] = estado
+            if estado == EstadoPedidoEnum.CANCELADO:
+                valores["cancelled_at"] = datetime.utcnow()
+        if repartidor_id is not None:
+            valores["repartidor_id"] = repartidor_id
+        
+        stmt = update(tabla).where(tabla.c.id == anteriores.c.id).values(**valores).returning(
+            tabla.c.id, tabla.c.numero_pedido, tabla.c.cliente_id, tabla.c.ciudad, tabla.c.estado,
+            tabla.c.repartidor_id, tabla.c.version, tabla.c.updated_at, tabla.c.cancelled_at,
+            anteriores.c.estado_anterior
+        )
+        filas = db.execute(stmt).all()
+        
+        if estado is not None:
+            transiciones = Counter((fila.ciudad, EstadoPedidoEnum(fila.estado_anterior)) for fila in filas)
+            deltas = Counter()
+            for (ciudad, anterior), total in transiciones.items():
+                deltas[(ciudad, anterior)] -= total
+                deltas[(ciudad, estado)] += total
+            ajustar_contadores(db, deltas)
+            registrar_cambios_estado(db, [
+                (fila.id, fila.ciudad, fila.estado_anterior, fila.estado) for fila in filas
+            ])
         
         db.commit()
-        db.refresh(pedido)
         
-        return pedido
+        for fila in filas:
+            broker.publicar(evento_desde_pedido(fila))
+            cache_seguimiento.invalidate(fila.numero_pedido)
+        
+        actualizados = {fila.id for fila in filas}
+        pendientes = [pedido_id for pedido_id in pedido_ids if pedido_id not in actualizados]
+        rechazos, omitidos = [], []
+        if pendientes:
+            estados_actuales = dict(db.query(Pedido.id, Pedido.estado).filter(Pedido.id.in_(pendientes)).all())
+            for pedido_id in pendientes:
+                actual = estados_actuales.get(pedido_id)
+                if actual is None:
+                    motivo = "Pedido no encontrado"
+                elif estado is not None and EstadoPedidoEnum(actual) == estado:
+                    omitidos.append(pedido_id)
+                    continue
+                elif estado is not None:
+                    motivo = f"Transición de estado inválida: {EstadoPedidoEnum(actual).value} -> {estado.value}"
+                else:
+                    motivo = f"No se puede asignar repartidor a un pedido {EstadoPedidoEnum(actual).value}"
+                rechazos.append({"id": pedido_id, "motivo": motivo})
+        
+        return [pedido_id for pedido_id in pedido_ids if pedido_id in actualizados], rechazos, omitidos
     
     @staticmethod
-    def cancelar_pedido(db: Session, pedido_id: str, motivo: str) -> Pedido:
+    def cancelar_pedido(db: Session, pedido_id: str, motivo: str, version: int = None) -> Pedido:
         """Cancela un pedido de forma lógica"""
         pedido = db.query(Pedido).filter(Pedido.id == pedido_id).first()
         
@@ -132,10 +418,14 @@ class PedidoService:
         if pedido.estado in [EstadoPedidoEnum.ENTREGADO]:
             raise ValueError("No se puede cancelar un pedido ya entregado")
         
-        pedido.estado = EstadoPedidoEnum.CANCELADO
-        pedido.cancelled_at = datetime.utcnow()
+        if version is None:
+            version = pedido.version
+        elif version != pedido.version:
+            raise ConflictoPedidoError("El pedido fue modificado por otra operación, vuelva a consultarlo")
         
-        db.commit()
-        db.refresh(pedido)
+        validar_transicion(pedido.estado, EstadoPedidoEnum.CANCELADO)
         
-        return pedido
+        return PedidoService._aplicar_cambios(db, pedido, version, {
+            Pedido.estado: EstadoPedidoEnum.CANCELADO,
+            Pedido.cancelled_at: datetime.utcnow(),
+        })
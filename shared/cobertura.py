@@ -0,0 +1,9 @@
+"""Ciudades en cobertura y sus rectángulos geográficos"""
+
+CIUDADES_COBERTURA = {
+    "Bogotá": {"latitud_min": 4.5, "latitud_max": 4.9, "longitud_min": -74.3, "longitud_max": -73.8},
+    "Medellín": {"latitud_min": 6.1, "latitud_max": 6.3, "longitud_min": -75.6, "longitud_max": -75.4},
+    "Cali": {"latitud_min": 3.3, "latitud_max": 3.5, "longitud_min": -76.6, "longitud_max": -76.4},
+    "Barranquilla": {"latitud_min": 10.9, "latitud_max": 11.1, "longitud_min": -74.8, "longitud_max": -74.6},
+    "Cartagena": {"latitud_min": 10.3, "latitud_max": 10.5, "longitud_min": -75.5, "longitud_max": -75.3},
+}
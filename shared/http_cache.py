@@ -0,0 +1,38 @@
+"""ETags y GET condicional para endpoints de detalle"""
+import hashlib
+from typing import Any
+
+from fastapi import Request, Response
+
+CACHE_CONTROL = "private, no-cache"
+
+
+def compute_etag(*parts: Any) -> str:
+    """ETag fuerte derivado de id, versión y/o updated_at"""
+    raw = ":".join("" if part is None else (part.isoformat() if hasattr(part, "isoformat") else str(part))
+                   for part in parts)
+    return '"' + hashlib.sha1(raw.encode()).hexdigest()[:20] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Evalúa If-None-Match (comparación débil, RFC 9110 §13.1.2)"""
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [value.strip() for value in header.split(",")]
+    return any(value.removeprefix("W/") == etag for value in candidates)
+
+
+def set_cache_headers(response: Response, etag: str):
+    """Agrega ETag y Cache-Control a una respuesta"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+
+def not_modified(etag: str) -> Response:
+    """Respuesta 304 sin cuerpo"""
+    response = Response(status_code=304)
+    set_cache_headers(response, etag)
+    return response
@@ -0,0 +1,94 @@
+"""Claves de idempotencia para endpoints de creación"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyKeyConflict(Exception):
+    """La clave de idempotencia ya se usó con un cuerpo de solicitud distinto"""
+    pass
+
+
+def request_fingerprint(payload: Dict[str, Any]) -> str:
+    """Huella estable del cuerpo de la solicitud"""
+    canonical = json.dumps(payload, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def scoped_key(user_id: str, path: str, key: str) -> str:
+    """Aísla las claves por usuario y endpoint"""
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"{IDEMPOTENCY_HEADER} debe tener entre 1 y {MAX_KEY_LENGTH} caracteres")
+    return f"{user_id}:{path}:{key}"
+
+
+class IdempotencyStore:
+    """
+    Almacén en memoria (por proceso) de respuestas por clave de idempotencia.
+    - Repeticiones dentro del TTL reciben la respuesta almacenada.
+    - Duplicados concurrentes esperan el resultado de la primera ejecución.
+    - Los errores no se almacenan, así el cliente puede reintentar.
+    """
+
+    def __init__(self, ttl_seconds: int = DEFAULT_TTL_SECONDS, max_entries: int = 100_000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # clave -> (expira_en, huella, respuesta); el orden de inserción es el orden de expiración
+        self._completed: "OrderedDict[str, Tuple[float, str, Any]]" = OrderedDict()
+        self._in_flight: Dict[str, Tuple[str, asyncio.Future]] = {}
+
+    def _purge(self, now: float):
+        while self._completed:
+            key, (expires_at, _, _) = next(iter(self._completed.items()))
+            if expires_at > now and len(self._completed) <= self.max_entries:
+                break
+            self._completed.popitem(last=False)
+
+    async def run(self, key: str, fingerprint: str,
+                  operation: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Ejecuta la operación una sola vez por clave.
+        Retorna (respuesta, repetida) donde repetida indica que no se ejecutó.
+        """
+        self._purge(time.monotonic())
+
+        completed = self._completed.get(key)
+        if completed is not None:
+            _, stored_fingerprint, response = completed
+            if stored_fingerprint != fingerprint:
+                raise IdempotencyKeyConflict("La clave de idempotencia ya se usó con otra solicitud")
+            return response, True
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            stored_fingerprint, future = in_flight
+            if stored_fingerprint != fingerprint:
+                raise IdempotencyKeyConflict("La clave de idempotencia ya se usó con otra solicitud")
+            return await asyncio.shield(future), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (fingerprint, future)
+        try:
+            response = await operation()
+        except Exception as e:
+            future.set_exception(e)
+            # Evita el aviso de "exception was never retrieved" si nadie esperaba
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+        self._completed[key] = (time.monotonic() + self.ttl_seconds, fingerprint, response)
+        future.set_result(response)
+        return response, False
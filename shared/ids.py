@@ -0,0 +1,103 @@
+"""Generación de identificadores ordenados por tiempo (UUIDv7) y tipo de columna UUID"""
+import secrets
+import threading
+import time
+import uuid
+
+from sqlalchemy.types import TypeDecorator, Uuid
+
+ID_PATTERN = r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$"
+NIL_UUID = uuid.UUID(int=0)
+
+_CROCKFORD_BASE32 = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_PAIRS = [a + b for a in _CROCKFORD_BASE32 for b in _CROCKFORD_BASE32]
+_MAX_SEQ = 0xFFF
+
+_lock = threading.Lock()
+_last_ms = 0
+_seq = 0
+
+
+def new_uuid() -> uuid.UUID:
+    """
+    Genera un UUIDv7: 48 bits de milisegundos Unix, 12 bits de secuencia
+    monótona dentro del mismo milisegundo y 62 bits aleatorios.
+    Los valores generados por un proceso son estrictamente crecientes, así
+    las inserciones se agregan al final del índice B-tree.
+    """
+    global _last_ms, _seq
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms = now_ms
+            # Secuencia inicial aleatoria en la mitad baja para dejar margen
+            _seq = secrets.randbits(11)
+        else:
+            _seq += 1
+            if _seq > _MAX_SEQ:
+                _last_ms += 1
+                _seq = 0
+        ms, seq = _last_ms, _seq
+
+    value = ((ms & 0xFFFFFFFFFFFF) << 80) | (0x7 << 76) | (seq << 64) | (0b10 << 62) | secrets.randbits(62)
+    return uuid.UUID(int=value)
+
+
+def new_id() -> str:
+    """Identificador de entidad en formato UUID canónico"""
+    return str(new_uuid())
+
+
+def short_code(value: uuid.UUID = None) -> str:
+    """Codifica un UUID en 26 caracteres Crockford base32 (conserva el orden temporal)"""
+    number = (value or new_uuid()).int
+    # 13 pares de caracteres (10 bits cada uno) cubren los 130 bits de salida
+    pairs = []
+    for _ in range(13):
+        pairs.append(_PAIRS[number & 0x3FF])
+        number >>= 10
+    return "".join(reversed(pairs))
+
+
+def require_id(value, field: str = "id") -> str:
+    """Valida un identificador antes de escribirlo; ValueError si no es un UUID"""
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        raise ValueError(f"{field} no es un identificador válido")
+
+
+class UUIDStr(TypeDecorator):
+    """
+    UUID nativo (16 bytes) en PostgreSQL, expuesto como str en Python.
+    Al escribir (INSERT, SET de un UPDATE) un valor mal formado es un error.
+    En comparaciones (==, IN, ...) se enlaza como el UUID nulo, que nunca se
+    genera, de modo que una búsqueda con un id inválido no encuentra filas.
+    """
+    impl = Uuid
+    cache_ok = True
+
+    def __init__(self):
+        super().__init__(as_uuid=True)
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        return uuid.UUID(require_id(value))
+
+    def coerce_compared_value(self, op, value):
+        return _UUIDStrComparado()
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else str(value)
+
+
+class _UUIDStrComparado(UUIDStr):
+    """Tipo de los valores comparados con una columna UUIDStr"""
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        try:
+            return super().process_bind_param(value, dialect)
+        except ValueError:
+            return NIL_UUID
@@ -0,0 +1,61 @@
+"""Limitador de tasa en memoria (token bucket) por cliente"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Request
+
+
+# Proxies de confianza delante del servicio (Kong = 1). Cada uno agrega a
+# X-Forwarded-For la IP que vio; lo que esté más a la izquierda lo escribió
+# el cliente y no sirve para identificarlo.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1"))
+
+
+def client_ip(request: Request, trusted_hops: int = TRUSTED_PROXY_HOPS) -> str:
+    """
+    IP del cliente: el valor de X-Forwarded-For agregado por el proxy de
+    confianza más externo (el trusted_hops-ésimo desde la derecha). Sin
+    proxies configurados o sin el header, la IP de la conexión.
+    """
+    peer = request.client.host if request.client else "desconocido"
+    forwarded = request.headers.get("X-Forwarded-For")
+    if trusted_hops <= 0 or not forwarded:
+        return peer
+    hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+    if not hops:
+        return peer
+    return hops[-trusted_hops] if len(hops) >= trusted_hops else hops[0]
+
+
+class TokenBucketLimiter:
+    """
+    Permite `rate` solicitudes por segundo con ráfagas de hasta `burst`.
+    Los buckets inactivos se descartan al superar max_clients.
+    """
+
+    def __init__(self, rate: float, burst: int, max_clients: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, key: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            return allowed
+
+    def retry_after(self) -> int:
+        """Segundos hasta que se repone un token"""
+        return max(1, int(round(1.0 / self.rate)))
@@ -151,7 +151,40 @@ FACTURA_TOTAL=$(echo $FACTURA_RESPONSE | grep -o '"total_final":[0-9.]*' | cut -
 echo -e "${COLORS_GREEN}✓ Factura creada: $FACTURA_ID${COLORS_NC}"
 echo -e "${COLORS_GREEN}  Total: $FACTURA_TOTAL COP${COLORS_NC}\n"
 
-# 10. Resumen
+# 10. Concurrencia optimista
+# Las dos PATCH se atienden en serie, así que el 409 sale de la comprobación previa de version;
+# el compare-and-set del UPDATE lo cubre pedido-service/tests/test_concurrencia_pedidos.py
+echo -e "${COLORS_BLUE}10. Verificando control de concurrencia en pedidos...${COLORS_NC}"
+PEDIDO_VERSION=$(echo $PEDIDO_RESPONSE | grep -o '"version":[0-9]*' | cut -d':' -f2)
+
+curl -s -o /dev/null -w "%{http_code}\n" -X PATCH ${BASE_URL}/api/pedidos/$PEDIDO_ID \
+  -H "Content-Type: application/json" \
+  -H "Authorization: Bearer $SUPERVISOR_TOKEN" \
+  -d '{"estado": "CONFIRMADO", "version": '$PEDIDO_VERSION'}' > /tmp/patch_estado.txt &
+curl -s -o /dev/null -w "%{http_code}\n" -X PATCH ${BASE_URL}/api/pedidos/$PEDIDO_ID \
+  -H "Content-Type: application/json" \
+  -H "Authorization: Bearer $SUPERVISOR_TOKEN" \
+  -d '{"repartidor_id": "'$REPARTIDOR_ID'", "version": '$PEDIDO_VERSION'}' > /tmp/patch_repartidor.txt &
+wait
+
+CODIGOS=$(cat /tmp/patch_estado.txt /tmp/patch_repartidor.txt | sort | tr '\n' ' ')
+if [ "$CODIGOS" != "200 409 " ]; then
+  echo -e "Se esperaba una actualización exitosa y un conflicto 409, se obtuvo: $CODIGOS"
+  exit 1
+fi
+
+TRANSICION_CODE=$(curl -s -o /dev/null -w "%{http_code}" -X PATCH ${BASE_URL}/api/pedidos/$PEDIDO_ID \
+  -H "Content-Type: application/json" \
+  -H "Authorization: Bearer $SUPERVISOR_TOKEN" \
+  -d '{"estado": "ENTREGADO"}')
+if [ "$TRANSICION_CODE" != "409" ]; then
+  echo -e "Se esperaba 409 para una transición inválida, se obtuvo: $TRANSICION_CODE"
+  exit 1
+fi
+
+echo -e "${COLORS_GREEN}✓ Actualizaciones concurrentes y transiciones inválidas rechazadas con 409${COLORS_NC}\n"
+
+# 11. Resumen
 echo -e "${COLORS_BLUE}=== RESUMEN DE PRUEBAS ===${COLORS_NC}"
 echo -e "${COLORS_GREEN}✓ Cliente ID: $CLIENTE_ID${COLORS_NC}"
 echo -e "${COLORS_GREEN}✓ Pedido: $NUMERO_PEDIDO (Estado: RECIBIDO)${COLORS_NC}"